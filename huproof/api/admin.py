@@ -0,0 +1,141 @@
+"""Admin-only diagnostics, guarded by ``ADMIN_TOKEN``."""
+
+import asyncio
+import tracemalloc
+from typing import Any
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import PlainTextResponse
+
+from ..config.settings import get_settings
+from ..core.auth import require_admin
+from ..core.logging import get_logger
+from ..core.memory import (
+    MAX_SNAPSHOTS,
+    NotTracing,
+    diff_allocations,
+    get_snapshot,
+    process_memory,
+    start_tracing,
+    stop_tracing,
+    take_snapshot,
+    top_allocations,
+    tracing_status,
+)
+from ..core.profiler import ProfilerBusy, StackSampler, route_codes
+
+logger = get_logger()
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+
+@router.post(
+    "/profile",
+    response_class=PlainTextResponse,
+    summary="Sample stacks",
+    description=(
+        "Sample every thread's stack for `seconds` and return collapsed stacks "
+        "(flamegraph format), rooted at the endpoint each thread was serving. "
+        "One profile runs at a time."
+    ),
+)
+async def profile(
+    request: Request,
+    seconds: float = Query(10.0, gt=0, description="Sampling duration"),
+    hz: int = Query(100, ge=1, le=1000, description="Samples per second"),
+    idle: bool = Query(False, description="Include threads waiting on locks, queues or I/O"),
+) -> PlainTextResponse:
+    limit = get_settings().profile_max_s
+    if seconds > limit:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=f"seconds must be at most {limit:g}"
+        )
+    sampler = StackSampler(1.0 / hz, route_codes(request.app.routes), include_idle=idle)
+    try:
+        sampler.start()
+    except ProfilerBusy:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail="A profile is already running"
+        )
+    logger.info("profile_start", seconds=seconds, hz=hz)
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        sampler.stop()
+    logger.info("profile_done", samples=sampler.samples, stacks=len(sampler.stacks))
+    return PlainTextResponse(
+        sampler.collapsed(), headers={"X-Profile-Samples": str(sampler.samples)}
+    )
+
+
+@router.get(
+    "/memory", summary="Process memory", description="RSS, GC generations and tracemalloc status."
+)
+def memory() -> dict[str, Any]:
+    return process_memory()
+
+
+@router.post("/tracemalloc/start", summary="Start allocation tracing")
+def tracemalloc_start(
+    frames: int = Query(1, ge=1, le=64, description="Frames kept per allocation"),
+) -> dict[str, Any]:
+    start_tracing(frames)
+    logger.info("tracemalloc_start", frames=frames)
+    return tracing_status()
+
+
+@router.post("/tracemalloc/stop", summary="Stop allocation tracing")
+def tracemalloc_stop() -> dict[str, Any]:
+    stop_tracing()
+    logger.info("tracemalloc_stop")
+    return tracing_status()
+
+
+@router.post(
+    "/tracemalloc/snapshots",
+    summary="Take a snapshot",
+    description=(
+        "Snapshot traced allocations under `label`; "
+        f"the {MAX_SNAPSHOTS} most recent snapshots are kept."
+    ),
+)
+def tracemalloc_snapshot(label: str = Query(..., min_length=1, max_length=64)) -> dict[str, Any]:
+    try:
+        return take_snapshot(label)
+    except NotTracing:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail="tracemalloc is not running"
+        )
+
+
+def _snapshot(label: str) -> tracemalloc.Snapshot:
+    snapshot = get_snapshot(label)
+    if snapshot is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"No snapshot {label!r}")
+    return snapshot
+
+
+@router.get("/tracemalloc/snapshots/{label}", summary="Top allocation sites of a snapshot")
+def tracemalloc_top(
+    label: str,
+    limit: int = Query(20, ge=1, le=500),
+    group_by: str = Query("lineno", pattern="^(lineno|filename|traceback)$"),
+) -> dict[str, Any]:
+    return {"label": label, "top": top_allocations(_snapshot(label), limit, group_by)}
+
+
+@router.get(
+    "/tracemalloc/diff",
+    summary="Compare two snapshots",
+    description="Sites that grew or shrank most from `base` to `target`.",
+)
+def tracemalloc_diff(
+    base: str,
+    target: str,
+    limit: int = Query(20, ge=1, le=500),
+    group_by: str = Query("lineno", pattern="^(lineno|filename|traceback)$"),
+) -> dict[str, Any]:
+    return {
+        "base": base,
+        "target": target,
+        "diff": diff_allocations(_snapshot(base), _snapshot(target), limit, group_by),
+    }
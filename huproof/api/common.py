@@ -0,0 +1,98 @@
+"""Helpers shared by the sync and async variants of the API handlers."""
+
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Optional
+
+from fastapi import HTTPException, status
+
+from ..config.settings import get_settings
+from ..core.admission import controller as admission
+from ..core.logging import get_logger
+from ..core.metrics import TimingContext, record_counter
+from ..core.tracing import span
+from ..core.zk import ZKVerifyError, verify_groth16
+from ..db.models import NoncePurpose, NonceRecord
+from ..schemas.enroll import ProofSchema, PublicInputs
+
+logger = get_logger()
+
+VKEY_PATH = Path(__file__).resolve().parents[2] / "circuits" / "build" / "verification_key.json"
+
+
+def invalid_request() -> HTTPException:
+    return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid request")
+
+
+def new_nonce_record(
+    nonce: str, purpose: NoncePurpose, origin_hash: str, user_id: Optional[str] = None
+) -> tuple[NonceRecord, datetime]:
+    """Build a nonce record expiring after ``NONCE_TTL_S``; returns it with its creation time."""
+    settings = get_settings()
+    now = datetime.now(tz=timezone.utc)
+    expires_at = now + timedelta(seconds=settings.nonce_ttl_s)
+    record = NonceRecord(
+        value=nonce,
+        purpose=purpose,
+        origin_hash=origin_hash,
+        user_id=user_id,
+        created_at=now.replace(tzinfo=None),
+        expires_at=expires_at.replace(tzinfo=None),
+    )
+    return record, now
+
+
+def check_nonce(record: Optional[NonceRecord], now: datetime) -> NonceRecord:
+    """Reject missing, consumed or expired nonces."""
+    if record is None:
+        raise invalid_request()
+    if record.consumed_at is not None or record.expires_at < now:
+        raise invalid_request()
+    return record
+
+
+def consumed(won: bool) -> None:
+    """Reject a request whose nonce another request consumed while it was being handled."""
+    if not won:
+        logger.warning("nonce_replayed")
+        raise invalid_request()
+
+
+def verify_proof(public_inputs: PublicInputs, proof: ProofSchema, *, endpoint: str) -> None:
+    """Verify a Groth16 proof unless ``BYPASS_ZK_VERIFY`` is set.
+
+    Blocking (spawns snarkjs); async callers run it in the threadpool.
+    """
+    if get_settings().bypass_zk_verify:
+        return
+    try:
+        # Convert Pydantic models to dict for snarkjs
+        public_inputs_dict = public_inputs.model_dump()
+        proof_dict = proof.model_dump()
+        with (
+            admission.verification(),
+            span("zk_verify"),
+            TimingContext("zk_verify_time", endpoint=endpoint),
+        ):
+            ok = verify_groth16(VKEY_PATH, public_inputs_dict, proof_dict)
+    except ZKVerifyError as e:
+        logger.error("zk_verify_error", error=str(e))
+        record_counter("zk_verify_errors", endpoint=endpoint)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Verification service unavailable",
+        )
+    if not ok:
+        record_counter("zk_verify_failures", endpoint=endpoint)
+        raise invalid_request()
+    record_counter("zk_verify_successes", endpoint=endpoint)
+
+
+def parse_bearer(authorization: str) -> str:
+    """Extract the token from an ``Authorization: Bearer ...`` header."""
+    if not authorization.startswith("Bearer "):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid authorization header",
+        )
+    return authorization[7:]  # Remove "Bearer " prefix
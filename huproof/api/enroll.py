@@ -1,26 +1,73 @@
-from datetime import datetime, timedelta, timezone
+from datetime import datetime
 
-from fastapi import APIRouter, Depends, HTTPException, Request, status
-from sqlmodel import Session, select
+from fastapi import APIRouter, Depends, Request
+from fastapi.concurrency import run_in_threadpool
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from ..config.settings import get_settings
 from ..core.challenge import generate_challenge, generate_nonce
 from ..core.crypto import sha256_hex
-from pathlib import Path
-
-from ..core.zk import ZKVerifyError, verify_groth16
-from ..core.ratelimit import rate_limit_enroll_start, rate_limit_finish
 from ..core.logging import get_logger
 from ..core.origin import validate_origin
-from ..core.metrics import TimingContext, record_counter
+from ..core.metrics import record_counter
+from ..core.tracing import span
+from ..db.commitments import store_commitment, store_commitment_async
 from ..db.models import KeystrokeCommitment, NoncePurpose, NonceRecord, User
-from ..db.session import get_session
+from ..db.queries import NONCE_BY_VALUE
+from ..db.types import compact_storage, is_field_element
+from ..db.session import (
+    consume_nonce,
+    consume_nonce_async,
+    get_async_session,
+    get_session,
+    shard_nonce,
+)
 from ..schemas.enroll import EnrollFinishRequest, EnrollFinishResponse, EnrollStartResponse
+from .common import check_nonce, consumed, invalid_request, new_nonce_record, verify_proof
 
 logger = get_logger()
 
 
 router = APIRouter()
+async_router = APIRouter()
+
+
+def _start() -> tuple[NonceRecord, EnrollStartResponse]:
+    settings = get_settings()
+    challenge = generate_challenge()
+    nonce = shard_nonce(generate_nonce())
+    origin_hash = sha256_hex(settings.origin)
+    record, now = new_nonce_record(nonce, NoncePurpose.enroll, origin_hash)
+    response = EnrollStartResponse(
+        challenge=challenge,
+        nonce=nonce,
+        origin_hash=origin_hash,
+        tau=settings.tau_default,
+        timestamp=int(now.timestamp()),
+    )
+    return record, response
+
+
+def _finish(
+    payload: EnrollFinishRequest, record: NonceRecord, now: datetime
+) -> tuple[User, KeystrokeCommitment]:
+    """Build the new user and its commitment; the nonce must be consumed already."""
+    if compact_storage() and not is_field_element(payload.commitment):
+        # Compact storage only holds canonical field elements
+        raise invalid_request()
+    user = User()
+    tau_input = payload.public_inputs.tau or 400
+    origin_hash = payload.public_inputs.origin_hash
+    commit = KeystrokeCommitment(
+        user_id=user.id,
+        origin=origin_hash,
+        commitment_c=str(payload.commitment),
+        tau=tau_input,
+        vkey_id=None,
+        is_active=True,
+    )
+    return user, commit
 
 
 @router.get(
@@ -29,36 +76,12 @@ router = APIRouter()
     summary="Start enrollment",
     description="Initiate user enrollment. Returns a challenge phrase and nonce for keystroke capture.",
 )
-@rate_limit_enroll_start()
 def enroll_start(*, request: Request, session: Session = Depends(get_session)) -> EnrollStartResponse:
     """Start enrollment flow by generating a challenge and nonce."""
     validate_origin(request)
-    settings = get_settings()
-    challenge = generate_challenge()
-    nonce = generate_nonce()
-    origin_hash = sha256_hex(settings.origin)
-    tau = settings.tau_default
-    now = datetime.now(tz=timezone.utc)
-    expires_at = now + timedelta(seconds=settings.nonce_ttl_s)
-
-    # Persist nonce
-    record = NonceRecord(
-        value=nonce,
-        purpose=NoncePurpose.enroll,
-        origin_hash=origin_hash,
-        user_id=None,
-        created_at=now.replace(tzinfo=None),
-        expires_at=expires_at.replace(tzinfo=None),
-    )
+    record, response = _start()
     session.add(record)
-
-    return EnrollStartResponse(
-        challenge=challenge,
-        nonce=nonce,
-        origin_hash=origin_hash,
-        tau=tau,
-        timestamp=int(now.timestamp()),
-    )
+    return response
 
 
 @router.post(
@@ -67,7 +90,6 @@ def enroll_start(*, request: Request, session: Session = Depends(get_session)) -
     summary="Complete enrollment",
     description="Submit keystroke proof and commitment to complete enrollment. Returns user_id.",
 )
-@rate_limit_finish()
 def enroll_finish(
     payload: EnrollFinishRequest, *, request: Request, session: Session = Depends(get_session)
 ) -> EnrollFinishResponse:
@@ -75,56 +97,77 @@ def enroll_finish(
     validate_origin(request)
     # Validate nonce is valid and not expired/consumed
     nonce_value = payload.public_inputs.nonce
-    statement = select(NonceRecord).where(NonceRecord.value == nonce_value, NonceRecord.purpose == NoncePurpose.enroll)
-    record = session.exec(statement).first()
-    if record is None:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid request")
     now = datetime.utcnow()
-    if record.consumed_at is not None or record.expires_at < now:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid request")
+    with span("nonce_query"):
+        record = session.exec(
+            NONCE_BY_VALUE, params={"value": nonce_value, "purpose": NoncePurpose.enroll}
+        ).first()
+    record = check_nonce(record, now)
 
-    settings = get_settings()
-    if not settings.bypass_zk_verify:
-        # Verify proof against local vkey (PoC path)
-        repo_root = Path(__file__).resolve().parents[2]
-        vkey_path = repo_root / "circuits" / "build" / "verification_key.json"
-        try:
-            # Convert Pydantic models to dict for snarkjs
-            public_inputs_dict = payload.public_inputs.model_dump()
-            proof_dict = payload.proof.model_dump()
-            with TimingContext("zk_verify_time", endpoint="enroll_finish"):
-                ok = verify_groth16(vkey_path, public_inputs_dict, proof_dict)
-        except ZKVerifyError as e:
-            logger.error("zk_verify_error", error=str(e))
-            record_counter("zk_verify_errors", endpoint="enroll_finish")
-            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Verification service unavailable")
-        if not ok:
-            record_counter("zk_verify_failures", endpoint="enroll_finish")
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid request")
-        record_counter("zk_verify_successes", endpoint="enroll_finish")
+    verify_proof(payload.public_inputs, payload.proof, endpoint="enroll_finish")
 
+    consumed(consume_nonce(session, record, now))
     # Create user and store commitment
-    user = User()
+    user, commit = _finish(payload, record, now)
     session.add(user)
-    session.flush()  # assign id
-
-    tau_input = payload.public_inputs.tau or 400
-    origin_hash = payload.public_inputs.origin_hash
-    commit = KeystrokeCommitment(
-        user_id=user.id,
-        origin=origin_hash,
-        commitment_c=str(payload.commitment),
-        tau=tau_input,
-        vkey_id=None,
-        is_active=True,
-    )
-    session.add(commit)
+    session.flush()  # user row must exist before the commitment's foreign key
+    store_commitment(session, commit)
 
-    # consume nonce
-    record.consumed_at = now
-    
     record_counter("enrollments_total", success=1)
 
     return EnrollFinishResponse(success=True, user_id=user.id)
 
 
+@async_router.get(
+    "/start",
+    response_model=EnrollStartResponse,
+    summary="Start enrollment",
+    description=(
+        "Initiate user enrollment. Returns a challenge phrase and nonce for keystroke capture."
+    ),
+)
+async def enroll_start_async(
+    *, request: Request, session: AsyncSession = Depends(get_async_session)
+) -> EnrollStartResponse:
+    """Async variant of :func:`enroll_start`."""
+    validate_origin(request)
+    record, response = _start()
+    session.add(record)
+    return response
+
+
+@async_router.post(
+    "/finish",
+    response_model=EnrollFinishResponse,
+    summary="Complete enrollment",
+    description="Submit keystroke proof and commitment to complete enrollment. Returns user_id.",
+)
+async def enroll_finish_async(
+    payload: EnrollFinishRequest,
+    *,
+    request: Request,
+    session: AsyncSession = Depends(get_async_session),
+) -> EnrollFinishResponse:
+    """Async variant of :func:`enroll_finish`; proof verification runs in the threadpool."""
+    validate_origin(request)
+    nonce_value = payload.public_inputs.nonce
+    now = datetime.utcnow()
+    with span("nonce_query"):
+        result = await session.exec(
+            NONCE_BY_VALUE, params={"value": nonce_value, "purpose": NoncePurpose.enroll}
+        )
+    record = check_nonce(result.first(), now)
+
+    await run_in_threadpool(
+        verify_proof, payload.public_inputs, payload.proof, endpoint="enroll_finish"
+    )
+
+    consumed(await consume_nonce_async(session, record, now))
+    user, commit = _finish(payload, record, now)
+    session.add(user)
+    await session.flush()
+    await store_commitment_async(session, commit)
+
+    record_counter("enrollments_total", success=1)
+
+    return EnrollFinishResponse(success=True, user_id=user.id)
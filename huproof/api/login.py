@@ -1,142 +1,88 @@
-from datetime import datetime, timedelta, timezone
+from datetime import datetime, timedelta
+from typing import Optional
 
 from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
-from sqlmodel import Session, select
+from fastapi.concurrency import run_in_threadpool
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from ..config.settings import get_settings
 from ..core.challenge import generate_challenge, generate_nonce
 from ..core.crypto import sha256_hex
-from pathlib import Path
-
 from ..core.security import create_access_token
-from ..db.models import SessionToken
-from ..core.zk import ZKVerifyError, verify_groth16
-from ..core.ratelimit import rate_limit_login_start, rate_limit_finish
 from ..core.logging import get_logger
 from ..core.origin import validate_origin
-from ..core.metrics import TimingContext, record_counter
-from ..db.models import KeystrokeCommitment, NoncePurpose, NonceRecord, User
-from ..db.session import get_session
+from ..core.metrics import record_counter
+from ..core.sessions import (
+    AsyncReadWriteSessions,
+    ReadWriteSessions,
+    get_async_read_write_sessions,
+    get_read_write_sessions,
+)
+from ..core.tracing import span
+from ..db.commitments import CachedCommitment, get_active_commitment, get_active_commitment_async
+from ..db.models import NoncePurpose, NonceRecord, SessionToken
+from ..db.queries import NONCE_BY_VALUE
+from ..db.session import (
+    consume_nonce,
+    consume_nonce_async,
+    get_async_session,
+    get_session,
+    served_by_replica,
+    shard_nonce,
+)
 from ..schemas.login import LoginFinishRequest, LoginFinishResponse, LoginStartResponse
+from .common import check_nonce, consumed, invalid_request, new_nonce_record, verify_proof
+
+logger = get_logger()
 
 
 router = APIRouter()
+async_router = APIRouter()
 
 
-@router.get(
-    "/start",
-    response_model=LoginStartResponse,
-    summary="Start login",
-    description="Initiate login flow. Returns challenge phrase, nonce, and user's commitment.",
-)
-@rate_limit_login_start()
-def login_start(
-    *, request: Request, user_id: str = Query(..., description="User ID"), session: Session = Depends(get_session)
-) -> LoginStartResponse:
-    """Start login flow by generating a challenge and retrieving user's commitment."""
-    validate_origin(request)
-    settings = get_settings()
-    origin_hash = sha256_hex(settings.origin)
+def _retry_on_primary(read_session: Session | AsyncSession) -> bool:
+    """A replica may not have replicated a just-enrolled commitment yet."""
+    return served_by_replica(read_session) and get_settings().db_replica_miss_fallback
 
-    # Find active commitment for this user and origin
-    stmt = select(KeystrokeCommitment).where(
-        KeystrokeCommitment.user_id == user_id,
-        KeystrokeCommitment.origin == origin_hash,
-        KeystrokeCommitment.is_active == True,  # noqa: E712
-    )
-    commit = session.exec(stmt).first()
+
+def _start(
+    user_id: str, commit: Optional[CachedCommitment]
+) -> tuple[NonceRecord, LoginStartResponse]:
     if commit is None:
         # Don't reveal user_id existence
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not found")
 
     challenge = generate_challenge()
-    nonce = generate_nonce()
-    tau = commit.tau
-    now = datetime.now(tz=timezone.utc)
-    expires_at = now + timedelta(seconds=settings.nonce_ttl_s)
-
-    # Persist nonce bound to user and purpose
-    record = NonceRecord(
-        value=nonce,
-        purpose=NoncePurpose.login,
-        origin_hash=origin_hash,
-        user_id=user_id,
-        created_at=now.replace(tzinfo=None),
-        expires_at=expires_at.replace(tzinfo=None),
-    )
-    session.add(record)
+    nonce = shard_nonce(generate_nonce(), user_id)
+    origin_hash = commit.origin
 
-    return LoginStartResponse(
+    # Nonce bound to user and purpose
+    record, now = new_nonce_record(nonce, NoncePurpose.login, origin_hash, user_id=user_id)
+    response = LoginStartResponse(
         challenge=challenge,
         nonce=nonce,
         origin_hash=origin_hash,
-        tau=tau,
+        tau=commit.tau,
         timestamp=int(now.timestamp()),
         commitment=commit.commitment_c,
     )
+    return record, response
 
 
-@router.post(
-    "/finish",
-    response_model=LoginFinishResponse,
-    summary="Complete login",
-    description="Submit keystroke proof to complete login. Returns JWT access token.",
-)
-@rate_limit_finish()
-def login_finish(
-    payload: LoginFinishRequest, *, request: Request, session: Session = Depends(get_session)
-) -> LoginFinishResponse:
-    """Complete login by submitting ZK proof. Returns access token on success."""
-    validate_origin(request)
-    # Validate nonce
-    nonce_value = payload.public_inputs.nonce
-    stmt = select(NonceRecord).where(NonceRecord.value == nonce_value, NonceRecord.purpose == NoncePurpose.login)
-    record = session.exec(stmt).first()
-    if record is None:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid request")
-    now = datetime.utcnow()
-    if record.consumed_at is not None or record.expires_at < now:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid request")
-
-    # Look up user's active commitment
-    origin_hash = payload.public_inputs.origin_hash
-    stmt_c = select(KeystrokeCommitment).where(
-        KeystrokeCommitment.user_id == record.user_id,
-        KeystrokeCommitment.origin == origin_hash,
-        KeystrokeCommitment.is_active == True,  # noqa: E712
-    )
-    commit = session.exec(stmt_c).first()
+def _check_commitment(payload: LoginFinishRequest, commit: Optional[CachedCommitment]) -> None:
     if commit is None:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid request")
-
+        raise invalid_request()
     # Ensure public_inputs.C matches stored commitment
-    pin_c = payload.public_inputs.C
-    if pin_c != commit.commitment_c:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid request")
+    if payload.public_inputs.C != commit.commitment_c:
+        raise invalid_request()
 
-    settings = get_settings()
-    if not settings.bypass_zk_verify:
-        repo_root = Path(__file__).resolve().parents[2]
-        vkey_path = repo_root / "circuits" / "build" / "verification_key.json"
-        try:
-            # Convert Pydantic models to dict for snarkjs
-            public_inputs_dict = payload.public_inputs.model_dump()
-            proof_dict = payload.proof.model_dump()
-            with TimingContext("zk_verify_time", endpoint="login_finish"):
-                ok = verify_groth16(vkey_path, public_inputs_dict, proof_dict)
-        except ZKVerifyError as e:
-            logger.error("zk_verify_error", error=str(e))
-            record_counter("zk_verify_errors", endpoint="login_finish")
-            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Verification service unavailable")
-        if not ok:
-            record_counter("zk_verify_failures", endpoint="login_finish")
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid request")
-        record_counter("zk_verify_successes", endpoint="login_finish")
-
-    # Issue access token
+
+def _finish(record: NonceRecord, now: datetime) -> tuple[str, SessionToken]:
+    """Issue an access token for the nonce's user; the nonce must be consumed already."""
     if record.user_id is None:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid request")
-    
+        raise invalid_request()
+
     settings = get_settings()
     expires_in_seconds = 3600
     token, jti = create_access_token(
@@ -144,8 +90,8 @@ def login_finish(
         secret=settings.app_secret,
         expires_in_seconds=expires_in_seconds,
     )
-    
-    # Store session token record
+
+    # Session token record
     expires_at = now + timedelta(seconds=expires_in_seconds)
     session_token = SessionToken(
         user_id=record.user_id,
@@ -154,13 +100,128 @@ def login_finish(
         expires_at=expires_at.replace(tzinfo=None),
         revoked_at=None,
     )
+    return token, session_token
+
+
+@router.get(
+    "/start",
+    response_model=LoginStartResponse,
+    summary="Start login",
+    description="Initiate login flow. Returns challenge phrase, nonce, and user's commitment.",
+)
+def login_start(
+    *,
+    request: Request,
+    user_id: str = Query(..., description="User ID"),
+    sessions: ReadWriteSessions = Depends(get_read_write_sessions),
+) -> LoginStartResponse:
+    """Start login flow by generating a challenge and retrieving user's commitment."""
+    validate_origin(request)
+    origin_hash = sha256_hex(get_settings().origin)
+
+    # Find active commitment for this user and origin
+    commit = get_active_commitment(sessions.read, user_id, origin_hash)
+    if commit is None and _retry_on_primary(sessions.read):
+        commit = get_active_commitment(sessions.primary(), user_id, origin_hash)
+    record, response = _start(user_id, commit)
+    sessions.primary().add(record)
+    return response
+
+
+@router.post(
+    "/finish",
+    response_model=LoginFinishResponse,
+    summary="Complete login",
+    description="Submit keystroke proof to complete login. Returns JWT access token.",
+)
+def login_finish(
+    payload: LoginFinishRequest, *, request: Request, session: Session = Depends(get_session)
+) -> LoginFinishResponse:
+    """Complete login by submitting ZK proof. Returns access token on success."""
+    validate_origin(request)
+    # Validate nonce
+    nonce_value = payload.public_inputs.nonce
+    now = datetime.utcnow()
+    with span("nonce_query"):
+        record = session.exec(
+            NONCE_BY_VALUE, params={"value": nonce_value, "purpose": NoncePurpose.login}
+        ).first()
+    record = check_nonce(record, now)
+
+    # Look up user's active commitment
+    origin_hash = payload.public_inputs.origin_hash
+    commit = get_active_commitment(session, record.user_id, origin_hash)
+    _check_commitment(payload, commit)
+
+    verify_proof(payload.public_inputs, payload.proof, endpoint="login_finish")
+
+    consumed(consume_nonce(session, record, now))
+    token, session_token = _finish(record, now)
     session.add(session_token)
 
-    # consume nonce
-    record.consumed_at = now
-    
     record_counter("logins_total", success=1)
 
     return LoginFinishResponse(success=True, token=token)
 
 
+@async_router.get(
+    "/start",
+    response_model=LoginStartResponse,
+    summary="Start login",
+    description="Initiate login flow. Returns challenge phrase, nonce, and user's commitment.",
+)
+async def login_start_async(
+    *,
+    request: Request,
+    user_id: str = Query(..., description="User ID"),
+    sessions: AsyncReadWriteSessions = Depends(get_async_read_write_sessions),
+) -> LoginStartResponse:
+    """Async variant of :func:`login_start`."""
+    validate_origin(request)
+    origin_hash = sha256_hex(get_settings().origin)
+
+    commit = await get_active_commitment_async(sessions.read, user_id, origin_hash)
+    if commit is None and _retry_on_primary(sessions.read):
+        commit = await get_active_commitment_async(await sessions.primary(), user_id, origin_hash)
+    record, response = _start(user_id, commit)
+    (await sessions.primary()).add(record)
+    return response
+
+
+@async_router.post(
+    "/finish",
+    response_model=LoginFinishResponse,
+    summary="Complete login",
+    description="Submit keystroke proof to complete login. Returns JWT access token.",
+)
+async def login_finish_async(
+    payload: LoginFinishRequest,
+    *,
+    request: Request,
+    session: AsyncSession = Depends(get_async_session),
+) -> LoginFinishResponse:
+    """Async variant of :func:`login_finish`; proof verification runs in the threadpool."""
+    validate_origin(request)
+    nonce_value = payload.public_inputs.nonce
+    now = datetime.utcnow()
+    with span("nonce_query"):
+        result = await session.exec(
+            NONCE_BY_VALUE, params={"value": nonce_value, "purpose": NoncePurpose.login}
+        )
+    record = check_nonce(result.first(), now)
+
+    origin_hash = payload.public_inputs.origin_hash
+    commit = await get_active_commitment_async(session, record.user_id, origin_hash)
+    _check_commitment(payload, commit)
+
+    await run_in_threadpool(
+        verify_proof, payload.public_inputs, payload.proof, endpoint="login_finish"
+    )
+
+    consumed(await consume_nonce_async(session, record, now))
+    token, session_token = _finish(record, now)
+    session.add(session_token)
+
+    record_counter("logins_total", success=1)
+
+    return LoginFinishResponse(success=True, token=token)
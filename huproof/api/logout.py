@@ -1,51 +1,31 @@
 """Logout endpoint for token revocation."""
 
 from datetime import datetime, timezone
+from typing import Optional
 
 import jwt
 from fastapi import APIRouter, Depends, HTTPException, Header, Request, status
-from sqlmodel import Session, select
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from ..core.logging import get_logger
 from ..core.origin import validate_origin
-from ..core.ratelimit import rate_limit_finish
 from ..core.security import decode_token
 from ..config.settings import get_settings
 from ..db.models import SessionToken
-from ..db.session import get_session
+from ..db.queries import SESSION_TOKEN_BY_JTI
+from ..db.session import get_async_session, get_session
+from .common import parse_bearer
 
 logger = get_logger()
 router = APIRouter()
+async_router = APIRouter()
 
 
-@router.post(
-    "/logout",
-    summary="Logout",
-    description="Revoke current access token. Requires Bearer token in Authorization header.",
-    response_description="Success status",
-)
-@rate_limit_finish()
-def logout(
-    *,
-    request: Request,
-    authorization: str = Header(..., description="Bearer token"),
-    session: Session = Depends(get_session),
-) -> dict[str, bool]:
-    """Revoke an access token by marking it as revoked.
-    
-    Requires Authorization header with Bearer token.
-    """
-    validate_origin(request)
-    
-    # Extract token from Authorization header
-    if not authorization.startswith("Bearer "):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid authorization header",
-        )
-    token = authorization[7:]  # Remove "Bearer " prefix
-    
-    # Decode token to get JTI
+def _token_claims(authorization: str) -> tuple[str, str]:
+    """Decode the bearer token and return its ``(user_id, jti)``."""
+    token = parse_bearer(authorization)
+
     settings = get_settings()
     try:
         payload = decode_token(token, secret=settings.app_secret)
@@ -67,22 +47,70 @@ def logout(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid token",
         )
-    
-    # Find and revoke token
-    stmt = select(SessionToken).where(SessionToken.jti == jti)
-    token_record = session.exec(stmt).first()
-    
+    return payload.get("sub", ""), jti
+
+
+def _revoke(jti: str, token_record: Optional[SessionToken]) -> bool:
+    """Mark ``token_record`` revoked; returns True if it changed."""
     if token_record:
         if token_record.revoked_at is None:
             token_record.revoked_at = datetime.now(timezone.utc).replace(tzinfo=None)
-            session.add(token_record)
             logger.info("token_revoked", jti=jti, user_id=token_record.user_id)
-        else:
-            logger.info("token_already_revoked", jti=jti)
+            return True
+        logger.info("token_already_revoked", jti=jti)
     else:
         # Token not in database (might be from before we started tracking)
         logger.warning("token_not_found", jti=jti)
-    
+    return False
+
+
+@router.post(
+    "/logout",
+    summary="Logout",
+    description="Revoke current access token. Requires Bearer token in Authorization header.",
+    response_description="Success status",
+)
+def logout(
+    *,
+    request: Request,
+    authorization: str = Header(..., description="Bearer token"),
+    session: Session = Depends(get_session),
+) -> dict[str, bool]:
+    """Revoke an access token by marking it as revoked.
+
+    Requires Authorization header with Bearer token.
+    """
+    validate_origin(request)
+    user_id, jti = _token_claims(authorization)
+
+    token_record = session.exec(
+        SESSION_TOKEN_BY_JTI, params={"jti": jti, "user_id": user_id}
+    ).first()
+    if _revoke(jti, token_record):
+        session.add(token_record)
+
     return {"success": True}
 
 
+@async_router.post(
+    "/logout",
+    summary="Logout",
+    description="Revoke current access token. Requires Bearer token in Authorization header.",
+    response_description="Success status",
+)
+async def logout_async(
+    *,
+    request: Request,
+    authorization: str = Header(..., description="Bearer token"),
+    session: AsyncSession = Depends(get_async_session),
+) -> dict[str, bool]:
+    """Async variant of :func:`logout`."""
+    validate_origin(request)
+    user_id, jti = _token_claims(authorization)
+
+    result = await session.exec(SESSION_TOKEN_BY_JTI, params={"jti": jti, "user_id": user_id})
+    token_record = result.first()
+    if _revoke(jti, token_record):
+        session.add(token_record)
+
+    return {"success": True}
@@ -1,14 +1,21 @@
-from typing import Any
+import asyncio
+from typing import Any, Optional
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 
 from .config.settings import get_settings
+from .core.admission import AdmissionMiddleware
 from .core.logging import configure_logging
-from .core.ratelimit import setup_rate_limit_handler, rate_limit_exceeded_handler
-from slowapi.errors import RateLimitExceeded
-from .db.session import init_db
-from .api import enroll, login, logout
+from .core.memory import run_memory_probe
+from .core.runtime import instrument_threadpool, run_probe
+from .core.tracing import TracingMiddleware
+from .core.guard import GuardMiddleware
+from .core.ratelimit import setup_rate_limit_handler
+from .db.commitments import start_invalidation_listener
+from .db.session import init_db, shard_engines
+from .api import admin, enroll, login, logout
 
 
 configure_logging()
@@ -24,15 +31,22 @@ app = FastAPI(
 
 # Set up rate limiting
 setup_rate_limit_handler(app)
-app.add_exception_handler(RateLimitExceeded, rate_limit_exceeded_handler)
 
+# Inside CORS, so browsers can read a 503; after the guard, so rejected traffic is not
+# counted as load
+app.add_middleware(AdmissionMiddleware)
+# Body caps, origin and rate limits before routing and body parsing
+app.add_middleware(GuardMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=[settings.origin],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "Retry-After"],
 )
+# Outermost, so the trace covers CORS and error handling
+app.add_middleware(TracingMiddleware)
 
 
 @app.get(
@@ -53,12 +67,19 @@ def health() -> dict[str, str | dict[str, str]]:
 @app.get(
     "/metrics",
     summary="Metrics",
-    description="Get aggregated metrics (timing, counters). PoC implementation - use Prometheus for production.",
+    description=(
+        "Aggregated metrics as JSON, or in the Prometheus text format when the client accepts "
+        "`text/plain`/OpenMetrics (as Prometheus does) or passes `?format=prometheus`."
+    ),
+    response_model=None,
 )
-def metrics() -> dict[str, Any]:
+def metrics(request: Request, format: Optional[str] = None) -> dict[str, Any] | PlainTextResponse:
     """Get current metrics statistics."""
-    from .core.metrics import get_all_metrics
-    
+    from .core.metrics import PROMETHEUS_CONTENT_TYPE, get_all_metrics, render_prometheus
+
+    accept = request.headers.get("accept", "")
+    if format == "prometheus" or "text/plain" in accept or "openmetrics" in accept:
+        return PlainTextResponse(render_prometheus(), media_type=PROMETHEUS_CONTENT_TYPE)
     return {
         "metrics": get_all_metrics(),
     }
@@ -72,10 +93,34 @@ def root() -> dict[str, str]:
 @app.on_event("startup")
 def on_startup() -> None:
     init_db()
+    for engine in shard_engines():
+        start_invalidation_listener(engine)
 
 
-app.include_router(enroll.router, prefix="/api/enroll", tags=["enroll"])
-app.include_router(login.router, prefix="/api/login", tags=["login"])
-app.include_router(logout.router, prefix="/api", tags=["auth"])
-
-
+@app.on_event("startup")
+async def start_runtime_probes() -> None:
+    instrument_threadpool(settings.threadpool_limit)
+    if settings.runtime_probe_s > 0:
+        app.state.runtime_probe = asyncio.create_task(run_probe(settings.runtime_probe_s))
+    if settings.memory_probe_s > 0:
+        app.state.memory_probe = asyncio.create_task(run_memory_probe(settings.memory_probe_s))
+
+
+@app.on_event("shutdown")
+async def stop_runtime_probes() -> None:
+    for name in ("runtime_probe", "memory_probe"):
+        probe = getattr(app.state, name, None)
+        if probe is not None:
+            probe.cancel()
+
+
+if settings.db_async:
+    app.include_router(enroll.async_router, prefix="/api/enroll", tags=["enroll"])
+    app.include_router(login.async_router, prefix="/api/login", tags=["login"])
+    app.include_router(logout.async_router, prefix="/api", tags=["auth"])
+else:
+    app.include_router(enroll.router, prefix="/api/enroll", tags=["enroll"])
+    app.include_router(login.router, prefix="/api/login", tags=["login"])
+    app.include_router(logout.router, prefix="/api", tags=["auth"])
+
+app.include_router(admin.router, prefix="/api/admin", tags=["admin"])
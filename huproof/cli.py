@@ -0,0 +1,190 @@
+"""``huproof`` command line: data export/import, resharding and accuracy evaluation."""
+
+import argparse
+import json
+import sys
+from typing import Optional
+
+from sqlmodel import SQLModel
+
+from .core.evaluation import Evaluation, parse_sweep, read_samples
+from .core.logging import configure_logging, get_logger
+from .db.migrations import run_migrations
+from .db.reshard import reshard
+from .db.session import create_url_engine, get_engine, get_shards, init_db, shard_engines
+from .db.transfer import Checkpoint, export_rows, import_rows, open_dump
+
+logger = get_logger()
+
+
+def _export(args: argparse.Namespace) -> int:
+    engines = [create_url_engine(args.db_url)] if args.db_url else shard_engines()
+    out = open_dump(args.output, "w")
+    try:
+        counts = export_rows(engines, out, batch_size=args.batch_size)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    logger.info("export_done", **counts)
+    return 0
+
+
+def _import(args: argparse.Namespace) -> int:
+    if args.db_url:
+        engine = create_url_engine(args.db_url)
+        SQLModel.metadata.create_all(engine)
+        run_migrations(engine)
+        router = None
+    else:
+        init_db()
+        engine, router = get_engine(), get_shards()
+    checkpoint = Checkpoint.load(args.checkpoint or f"{args.input}.checkpoint")
+    if checkpoint.records:
+        logger.info("import_resume", after=checkpoint.records)
+    source = open_dump(args.input, "r")
+    try:
+        total = import_rows(engine, source, checkpoint, batch_size=args.batch_size, router=router)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+    checkpoint.clear()
+    logger.info("import_done", lines=total)
+    return 0
+
+
+def _reshard(args: argparse.Namespace) -> int:
+    moved = reshard(batch_size=args.batch_size, dry_run=args.dry_run)
+    logger.info("reshard_done", moved=moved, dry_run=args.dry_run)
+    return 0
+
+
+def _evaluate(args: argparse.Namespace) -> int:
+    evaluation = Evaluation(
+        args.tau,
+        args.multiplier,
+        enroll=args.enroll,
+        base_tau=args.base_tau,
+        batch_size=args.batch_size,
+    )
+    try:
+        for path, add in (
+            (args.genuine, evaluation.add_genuine),
+            (args.impostor, evaluation.add_impostors),
+        ):
+            source = open_dump(path, "r")
+            try:
+                add(read_samples(source))
+            finally:
+                if source is not sys.stdin:
+                    source.close()
+        report = evaluation.report()
+    except ValueError as exc:
+        logger.error("evaluate_failed", error=str(exc))
+        return 1
+    out = open_dump(args.output, "w")
+    try:
+        json.dump(report, out, indent=2)
+        out.write("\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    logger.info(
+        "evaluate_done",
+        users=report["users"],
+        genuine=report["genuine_comparisons"],
+        impostor=report["impostor_comparisons"],
+        tau_eer=report["tau"]["eer"],
+        multiplier_eer=report["multiplier"]["eer"],
+    )
+    return 0
+
+
+def _sweep(kind: type):
+    def parse(value: str) -> list:
+        try:
+            return parse_sweep(value, kind)
+        except ValueError as exc:
+            raise argparse.ArgumentTypeError(str(exc)) from None
+
+    return parse
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="huproof", description="huproof maintenance commands.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser("export", help="stream users and commitments out as ndjson")
+    export.add_argument(
+        "-o", "--output", default="-", help="dump file, .gz to compress (default: stdout)"
+    )
+    export.add_argument("--db-url", help="export this database instead of DB_URL/DB_SHARD_URLS")
+    export.add_argument(
+        "--batch-size", type=int, default=10_000, help="rows fetched per round trip"
+    )
+    export.set_defaults(func=_export)
+
+    imp = commands.add_parser("import", help="bulk-insert a dump, resumable by checkpoint")
+    imp.add_argument("input", help="dump file written by export (.gz supported)")
+    imp.add_argument("--db-url", help="import into this database instead of DB_URL/DB_SHARD_URLS")
+    imp.add_argument(
+        "--batch-size", type=int, default=10_000, help="rows per insert batch and checkpoint"
+    )
+    imp.add_argument("--checkpoint", help="checkpoint file (default: <input>.checkpoint)")
+    imp.set_defaults(func=_import)
+
+    reshard = commands.add_parser(
+        "reshard", help="move users onto the shard the current ring assigns them"
+    )
+    reshard.add_argument("--batch-size", type=int, default=500, help="users scanned per query")
+    reshard.add_argument(
+        "--dry-run", action="store_true", help="count misplaced users without moving them"
+    )
+    reshard.set_defaults(func=_reshard)
+
+    evaluate = commands.add_parser(
+        "evaluate", help="FAR/FRR/EER of fixed and adaptive thresholds over sample sets"
+    )
+    evaluate.add_argument(
+        "genuine", help='ndjson of {"user": ..., "samples": [[...], ...]} per line (.gz supported)'
+    )
+    evaluate.add_argument("impostor", help="ndjson of impostor samples, in the same format")
+    evaluate.add_argument("-o", "--output", default="-", help="JSON report file (default: stdout)")
+    evaluate.add_argument(
+        "--enroll",
+        type=int,
+        default=5,
+        help="first samples of each genuine user that make the template",
+    )
+    evaluate.add_argument(
+        "--tau",
+        type=_sweep(int),
+        default="0:4000:20",
+        help="fixed thresholds, start:stop:step or a list",
+    )
+    evaluate.add_argument(
+        "--multiplier",
+        type=_sweep(float),
+        default="0:6:0.25",
+        help="adaptive tau multipliers, start:stop:step or a list",
+    )
+    evaluate.add_argument("--base-tau", type=int, default=400, help="minimum adaptive threshold")
+    evaluate.add_argument(
+        "--batch-size", type=int, default=1024, help="users or impostor samples read at a time"
+    )
+    evaluate.set_defaults(func=_evaluate)
+    return parser
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.command == "import" and args.input == "-" and args.checkpoint is None:
+        build_parser().error("import from stdin needs --checkpoint")
+    if args.command == "evaluate" and args.genuine == args.impostor == "-":
+        build_parser().error("only one sample set can be read from stdin")
+    # Keep stdout free for `export -o -`
+    configure_logging(sys.stderr)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -15,6 +15,101 @@ class Settings(BaseSettings):
     origin: str = Field("http://localhost:5173", alias="ORIGIN")
     bypass_zk_verify: bool = Field(False, alias="BYPASS_ZK_VERIFY")
 
+    # Database connection pool (ignored for SQLite)
+    db_pool_size: int = Field(10, alias="DB_POOL_SIZE")
+    db_max_overflow: int = Field(20, alias="DB_MAX_OVERFLOW")
+    db_pool_timeout_s: float = Field(5.0, alias="DB_POOL_TIMEOUT_S")
+    db_pool_pre_ping: bool = Field(True, alias="DB_POOL_PRE_PING")
+    db_pool_recycle_s: int = Field(1800, alias="DB_POOL_RECYCLE_S")
+    db_statement_timeout_ms: int = Field(5000, alias="DB_STATEMENT_TIMEOUT_MS")
+    db_query_cache_size: int = Field(500, alias="DB_QUERY_CACHE_SIZE")
+    # Store ids as 16-byte UUIDs and field elements as 32 bytes (set before creating tables)
+    db_compact_storage: bool = Field(False, alias="DB_COMPACT_STORAGE")
+    # Comma-separated read replica URLs; reads skip replicas lagging more than the max
+    db_replica_urls: str = Field("", alias="DB_REPLICA_URLS")
+    db_replica_max_lag_s: float = Field(5.0, alias="DB_REPLICA_MAX_LAG_S")
+    db_replica_lag_check_s: float = Field(10.0, alias="DB_REPLICA_LAG_CHECK_S")
+    # Retry a replica miss on the primary (covers reads right after a write elsewhere)
+    db_replica_miss_fallback: bool = Field(True, alias="DB_REPLICA_MISS_FALLBACK")
+    # Extra user shards after DB_URL (shard "0"), comma-separated and append-only; users are
+    # placed by consistent hashing, enrollment nonces go to DB_ENROLL_SHARD
+    db_shard_urls: str = Field("", alias="DB_SHARD_URLS")
+    db_shard_vnodes: int = Field(64, alias="DB_SHARD_VNODES")
+    db_enroll_shard: int = Field(0, alias="DB_ENROLL_SHARD")
+    # Shard count before the last DB_SHARD_URLS change; set while huproof.db.reshard runs
+    db_shard_previous_count: int = Field(0, alias="DB_SHARD_PREVIOUS_COUNT")
+    # SQLite production mode: WAL + tuned pragmas, read pool, single group-commit writer
+    sqlite_production: bool = Field(False, alias="SQLITE_PRODUCTION")
+    sqlite_busy_timeout_ms: int = Field(5000, alias="SQLITE_BUSY_TIMEOUT_MS")
+    sqlite_mmap_size: int = Field(268435456, alias="SQLITE_MMAP_SIZE")
+    sqlite_read_pool_size: int = Field(8, alias="SQLITE_READ_POOL_SIZE")
+    sqlite_write_batch_max: int = Field(256, alias="SQLITE_WRITE_BATCH_MAX")
+    sqlite_write_timeout_s: float = Field(10.0, alias="SQLITE_WRITE_TIMEOUT_S")
+    # Serve the API from async handlers on an async engine (aiosqlite / asyncpg)
+    db_async: bool = Field(False, alias="DB_ASYNC")
+
+    # Active-commitment cache (0 disables); NOTIFY propagates invalidations on PostgreSQL
+    commitment_cache_size: int = Field(10000, alias="COMMITMENT_CACHE_SIZE")
+    commitment_cache_ttl_s: float = Field(60.0, alias="COMMITMENT_CACHE_TTL_S")
+    commitment_cache_notify: bool = Field(True, alias="COMMITMENT_CACHE_NOTIFY")
+    # (user, origin) pairs without a commitment, kept as keyed hashes with the same TTL (0 disables)
+    commitment_negative_cache_size: int = Field(100_000, alias="COMMITMENT_NEGATIVE_CACHE_SIZE")
+
+    # Per-client-IP limits ("count/period", period one of second, minute, hour, day); limiter
+    # state is bounded to RATE_LIMIT_MAX_KEYS keys, striped over RATE_LIMIT_SHARDS locks
+    rate_limit_enroll_start: str = Field("5/minute", alias="RATE_LIMIT_ENROLL_START")
+    rate_limit_login_start: str = Field("10/minute", alias="RATE_LIMIT_LOGIN_START")
+    rate_limit_finish: str = Field("20/minute", alias="RATE_LIMIT_FINISH")
+    # Per account (a keyed hash of user_id) on login start, whatever the client IP
+    rate_limit_login_account: str = Field("10/minute", alias="RATE_LIMIT_LOGIN_ACCOUNT")
+    # Largest request body accepted by the finish endpoints (others take none)
+    max_body_bytes: int = Field(16384, alias="MAX_BODY_BYTES")
+    rate_limit_max_keys: int = Field(100_000, alias="RATE_LIMIT_MAX_KEYS")
+    rate_limit_shards: int = Field(16, alias="RATE_LIMIT_SHARDS")
+    # Shared limiter state for all workers/nodes (redis://host:port/db); unset keeps it per process.
+    # Up to RATE_LIMIT_LEASE_TOKENS tokens per key are taken at once and kept for RATE_LIMIT_LEASE_S
+    rate_limit_storage_url: str = Field("", alias="RATE_LIMIT_STORAGE_URL")
+    rate_limit_store_timeout_s: float = Field(0.05, alias="RATE_LIMIT_STORE_TIMEOUT_S")
+    rate_limit_lease_tokens: int = Field(10, alias="RATE_LIMIT_LEASE_TOKENS")
+    rate_limit_lease_s: float = Field(1.0, alias="RATE_LIMIT_LEASE_S")
+
+    # Admission control for the enroll/login flows (0 turns a signal off): /start is shed once the
+    # load (the highest ratio of in-flight requests, verifications and p99 to these limits) reaches
+    # the headroom, /finish only at full load
+    admission_max_in_flight: int = Field(256, alias="ADMISSION_MAX_IN_FLIGHT")
+    admission_max_verify_queue: int = Field(32, alias="ADMISSION_MAX_VERIFY_QUEUE")
+    admission_p99_target_ms: float = Field(5000.0, alias="ADMISSION_P99_TARGET_MS")
+    admission_start_headroom: float = Field(0.8, alias="ADMISSION_START_HEADROOM")
+    admission_window_s: float = Field(10.0, alias="ADMISSION_WINDOW_S")
+
+    # Warn when a request runs more SQL statements than this (0 disables)
+    db_query_warn_threshold: int = Field(10, alias="DB_QUERY_WARN_THRESHOLD")
+    # Request tracing: Server-Timing header, and a sampled fraction of traces written as OTLP JSON
+    server_timing: bool = Field(True, alias="SERVER_TIMING")
+    trace_sample_rate: float = Field(0.0, alias="TRACE_SAMPLE_RATE")
+    trace_file: str = Field("", alias="TRACE_FILE")
+
+    # Directory (ideally on tmpfs, e.g. /dev/shm/huproof) for metrics shared by all workers; empty
+    # it before starting the server. Unset keeps metrics in process memory
+    metrics_shared_dir: str = Field("", alias="METRICS_SHARED_DIR")
+
+    # Bearer token for /api/admin endpoints (profiler); unset disables them
+    admin_token: str = Field("", alias="ADMIN_TOKEN")
+    profile_max_s: float = Field(60.0, alias="PROFILE_MAX_S")
+
+    # Logging: rendering and writes on a background thread; per-event sampling rates and
+    # per-second caps, e.g. LOG_SAMPLE="metric_timing=0.01" LOG_RATE_LIMIT="zk_verify_ok=10"
+    log_async: bool = Field(True, alias="LOG_ASYNC")
+    log_queue_size: int = Field(10000, alias="LOG_QUEUE_SIZE")
+    log_sample: str = Field("", alias="LOG_SAMPLE")
+    log_rate_limit: str = Field("", alias="LOG_RATE_LIMIT")
+
+    # anyio threadpool size for sync routes; loop-lag/threadpool probe interval (0 disables)
+    threadpool_limit: int = Field(40, alias="THREADPOOL_LIMIT")
+    runtime_probe_s: float = Field(0.5, alias="RUNTIME_PROBE_S")
+    # RSS / GC generation gauges interval (0 disables)
+    memory_probe_s: float = Field(15.0, alias="MEMORY_PROBE_S")
+
     model_config = SettingsConfigDict(
         env_file=".env",
         env_prefix="",
@@ -0,0 +1,148 @@
+"""Adaptive admission control: shed load before it reaches the verifier.
+
+Per-IP rate limits do not bound the total load. :class:`AdmissionController`
+looks at three signals:
+
+- requests of the auth flows in flight (``ADMISSION_MAX_IN_FLIGHT``);
+- proofs being verified or waiting to be (``ADMISSION_MAX_VERIFY_QUEUE``);
+- the p99 latency of those requests over the last ``ADMISSION_WINDOW_S``
+  seconds (``ADMISSION_P99_TARGET_MS``).
+
+The load is the highest of the three ratios to their limits (a limit of 0
+turns that signal off). ``/finish`` requests complete a flow whose nonce
+already exists, and are only rejected at full load. ``/start`` requests
+are rejected once the load reaches ``ADMISSION_START_HEADROOM``, which
+keeps capacity free for the flows already started. Rejecting a ``/start``
+happens in :class:`AdmissionMiddleware`, before routing, so no nonce is
+created that could not be finished. A rejected request gets ``503`` with a
+``Retry-After`` of about the current p99, and is counted in
+``admission_rejections`` (label ``priority``).
+
+The controller is per process: with several workers each one sheds its
+own share.
+"""
+
+import math
+import threading
+from collections import deque
+from contextlib import contextmanager
+from time import monotonic, perf_counter
+from typing import Callable, Iterator, Optional
+
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from ..config.settings import get_settings
+from .metrics import inc_counter, set_gauge
+
+START, FINISH = "start", "finish"
+
+# Latency samples kept for the p99 (the newest win when the window is busier)
+MAX_SAMPLES = 2048
+_P99_REFRESH_S = 1.0
+
+
+def flow_priority(path: str) -> Optional[str]:
+    """``"start"`` or ``"finish"`` for the enrollment and login flow endpoints, else ``None``."""
+    if not path.startswith(("/api/enroll/", "/api/login/")):
+        return None
+    if path.endswith("/start"):
+        return START
+    if path.endswith("/finish"):
+        return FINISH
+    return None
+
+
+class AdmissionController:
+    """Load signals of the auth flows, and the admit/reject decision."""
+
+    def __init__(self, clock: Callable[[], float] = monotonic):
+        self.clock = clock
+        self.in_flight = 0
+        self.verifying = 0
+        self._verify_lock = threading.Lock()
+        self._samples: deque[tuple[float, float]] = deque(maxlen=MAX_SAMPLES)
+        self._p99_ms = 0.0
+        self._p99_at = -math.inf
+
+    def observe(self, duration_ms: float) -> None:
+        self._samples.append((self.clock(), duration_ms))
+
+    def p99_ms(self) -> float:
+        """p99 of the latencies in the window, recomputed at most once a second."""
+        now = self.clock()
+        if now - self._p99_at >= _P99_REFRESH_S:
+            horizon = now - get_settings().admission_window_s
+            recent = sorted(ms for at, ms in list(self._samples) if at >= horizon)
+            self._p99_ms = recent[min(int(len(recent) * 0.99), len(recent) - 1)] if recent else 0.0
+            self._p99_at = now
+        return self._p99_ms
+
+    @contextmanager
+    def verification(self) -> Iterator[None]:
+        """Count a proof verification in the queue while it runs."""
+        with self._verify_lock:
+            self.verifying += 1
+        try:
+            yield
+        finally:
+            with self._verify_lock:
+                self.verifying -= 1
+
+    def load(self) -> float:
+        settings = get_settings()
+        ratios = [0.0]
+        if settings.admission_max_in_flight > 0:
+            ratios.append(self.in_flight / settings.admission_max_in_flight)
+        if settings.admission_max_verify_queue > 0:
+            ratios.append(self.verifying / settings.admission_max_verify_queue)
+        if settings.admission_p99_target_ms > 0:
+            ratios.append(self.p99_ms() / settings.admission_p99_target_ms)
+        return max(ratios)
+
+    def admit(self, priority: str) -> bool:
+        threshold = get_settings().admission_start_headroom if priority == START else 1.0
+        if self.load() < threshold:
+            return True
+        inc_counter("admission_rejections", priority=priority)
+        return False
+
+    def retry_after_s(self) -> int:
+        return max(1, math.ceil(self.p99_ms() / 1000.0))
+
+    def record_gauges(self) -> None:
+        set_gauge("admission_in_flight", self.in_flight)
+        set_gauge("admission_verify_queue", self.verifying)
+        set_gauge("admission_p99_ms", self.p99_ms())
+        set_gauge("admission_load", self.load())
+
+
+controller = AdmissionController()
+
+
+class AdmissionMiddleware:
+    """Admit or reject auth flow requests before routing, and feed the controller's signals."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        priority = flow_priority(scope["path"]) if scope["type"] == "http" else None
+        if priority is None:
+            await self.app(scope, receive, send)
+            return
+        if not controller.admit(priority):
+            response = JSONResponse(
+                {"detail": "Service overloaded. Please try again later."},
+                status_code=503,
+                headers={"Retry-After": str(controller.retry_after_s())},
+            )
+            await response(scope, receive, send)
+            return
+        controller.in_flight += 1
+        t0 = perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            controller.in_flight -= 1
+            controller.observe((perf_counter() - t0) * 1000.0)
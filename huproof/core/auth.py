@@ -1,29 +1,28 @@
 """Authentication dependencies for protected endpoints."""
 
-from typing import Annotated
+import hmac
+from typing import Annotated, Optional
 
 import jwt
 from fastapi import Depends, HTTPException, Header, status
-from sqlmodel import Session, select
 
 from .logging import get_logger
 from .security import decode_token
+from .sessions import (
+    AsyncReadWriteSessions,
+    ReadWriteSessions,
+    get_async_read_write_sessions,
+    get_read_write_sessions,
+)
 from ..config.settings import get_settings
 from ..db.models import SessionToken, User
-from ..db.session import get_session
+from ..db.queries import SESSION_TOKEN_BY_JTI, USER_BY_ID
 
 logger = get_logger()
 
 
-def get_current_user(
-    authorization: Annotated[str, Header(..., description="Bearer token")],
-    session: Session = Depends(get_session),
-) -> User:
-    """Dependency to get current authenticated user from JWT token.
-    
-    Verifies token signature, expiration, and revocation status.
-    Raises HTTPException if token is invalid, expired, or revoked.
-    """
+def _decode_bearer(authorization: str) -> tuple[str, Optional[str]]:
+    """Verify the bearer token and return its ``(user_id, jti)``."""
     settings = get_settings()
     
     # Extract token from Authorization header
@@ -59,26 +58,81 @@ def get_current_user(
             detail="Invalid token",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    
-    # Check if token is revoked
-    if jti:
-        stmt = select(SessionToken).where(SessionToken.jti == jti)
-        token_record = session.exec(stmt).first()
-        if token_record and token_record.revoked_at is not None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Token revoked",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-    
-    # Get user
-    stmt = select(User).where(User.id == user_id)
-    user = session.exec(stmt).first()
+
+    return user_id, jti
+
+
+def _check_revoked(token_record: Optional[SessionToken]) -> None:
+    if token_record and token_record.revoked_at is not None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token revoked",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+
+def _check_user(user: Optional[User]) -> User:
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User not found",
         )
-    
     return user
 
+
+def get_current_user(
+    authorization: Annotated[str, Header(..., description="Bearer token")],
+    sessions: ReadWriteSessions = Depends(get_read_write_sessions),
+) -> User:
+    """Dependency to get current authenticated user from JWT token.
+
+    Verifies token signature, expiration, and revocation status.
+    Raises HTTPException if token is invalid, expired, or revoked.
+    """
+    user_id, jti = _decode_bearer(authorization)
+
+    # Check if token is revoked; on the primary, as a replica may not have the revocation yet
+    if jti:
+        token_record = (
+            sessions.primary()
+            .exec(SESSION_TOKEN_BY_JTI, params={"jti": jti, "user_id": user_id})
+            .first()
+        )
+        _check_revoked(token_record)
+
+    # Get user
+    return _check_user(sessions.read.exec(USER_BY_ID, params={"user_id": user_id}).first())
+
+
+async def get_current_user_async(
+    authorization: Annotated[str, Header(..., description="Bearer token")],
+    sessions: AsyncReadWriteSessions = Depends(get_async_read_write_sessions),
+) -> User:
+    """Async variant of :func:`get_current_user`."""
+    user_id, jti = _decode_bearer(authorization)
+
+    if jti:
+        primary = await sessions.primary()
+        result = await primary.exec(SESSION_TOKEN_BY_JTI, params={"jti": jti, "user_id": user_id})
+        _check_revoked(result.first())
+
+    result = await sessions.read.exec(USER_BY_ID, params={"user_id": user_id})
+    return _check_user(result.first())
+
+
+def require_admin(
+    authorization: Annotated[str, Header(description="Bearer ADMIN_TOKEN")] = "",
+) -> None:
+    """Dependency guarding admin endpoints with the static ``ADMIN_TOKEN``.
+
+    Admin endpoints answer 404 while ``ADMIN_TOKEN`` is unset.
+    """
+    expected = get_settings().admin_token
+    if not expected:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if not hmac.compare_digest(authorization.encode(), f"Bearer {expected}".encode()):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid admin token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
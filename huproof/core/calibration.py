@@ -1,11 +1,30 @@
-"""Template calibration and adaptive threshold calculation."""
+"""Template calibration and adaptive threshold calculation.
 
-from typing import Sequence
+The ``calculate_*`` functions and :func:`average_features` work on one
+user's vectors. The ``batch_*`` functions and :func:`distance_matrix` do
+the same for many users per call. They take a ``(users × samples ×
+features)`` array of integer features (int16/int32) and, when users have
+fewer samples than the array holds, a ``counts`` vector of samples per user.
+With NumPy installed (``uv sync --extra calibration``) they are vectorised
+and return arrays. Without it they loop over the single-user functions and
+return lists. Either way the results are the same as calling the
+single-user functions on each user.
+"""
+
+from typing import Any, Optional, Sequence
 
 from .logging import get_logger
 
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional speedup
+    np = None
+
 logger = get_logger()
 
+# Elements per intermediate block of distance_matrix (about 64 MiB of int64)
+BLOCK_ELEMENTS = 8 * 1024 * 1024
+
 
 def calculate_l1_distance(features1: Sequence[int], features2: Sequence[int]) -> int:
     """Calculate L1 (Manhattan) distance between two feature vectors.
@@ -89,35 +108,16 @@ def calculate_adaptive_tau(
     """
     if not samples:
         logger.warning("no_samples_for_tau", using_base=base_tau)
-        return base_tau
-    
-    # Calculate distances from template to each sample
-    distances = [calculate_l1_distance(template, sample) for sample in samples]
-    
-    if len(distances) < 2:
-        # Not enough samples for variance, use base + small margin
-        mean_dist = distances[0] if distances else 0
-        return max(base_tau, int(mean_dist * 1.5))
-    
-    # Calculate mean and standard deviation
-    mean_dist = sum(distances) / len(distances)
-    variance = sum((d - mean_dist) ** 2 for d in distances) / len(distances)
-    stddev = variance ** 0.5
-    
-    # Adaptive threshold: mean + multiplier * stddev
-    adaptive_tau = int(mean_dist + multiplier * stddev)
-    
-    # Ensure it's at least base_tau
-    tau = max(base_tau, adaptive_tau)
-    
-    logger.info(
-        "adaptive_tau_calculated",
-        mean=round(mean_dist, 2),
-        stddev=round(stddev, 2),
-        tau=tau,
-        base_tau=base_tau,
-    )
-    
+    tau, stats = _adaptive_tau(template, samples, base_tau, multiplier)
+    if stats is not None:
+        mean_dist, stddev = stats
+        logger.info(
+            "adaptive_tau_calculated",
+            mean=round(mean_dist, 2),
+            stddev=round(stddev, 2),
+            tau=tau,
+            base_tau=base_tau,
+        )
     return tau
 
 
@@ -160,3 +160,186 @@ def calculate_template_quality(
         "consistency_score": round(consistency_score, 3),
     }
 
+
+
+def _batch_shape(samples: Any, counts: Optional[Sequence[int]]) -> tuple[int, int, list[int]]:
+    users = len(samples)
+    width = max((len(user) for user in samples), default=0)
+    counts = [width] * users if counts is None else [int(c) for c in counts]
+    if len(counts) != users:
+        raise ValueError("counts must have one entry per user")
+    if any(c < 0 or c > len(user) for c, user in zip(counts, samples)):
+        raise ValueError("counts must be between 0 and the number of samples given")
+    return users, width, counts
+
+
+def _mask(counts: list[int], width: int) -> Any:
+    """``(users × width)`` True where a sample is real, not padding."""
+    return np.arange(width)[None, :] < np.asarray(counts)[:, None]
+
+
+def _user_samples(samples: Any, counts: list[int]) -> list[list[Sequence[int]]]:
+    return [list(user[:count]) for user, count in zip(samples, counts)]
+
+
+def distance_matrix(a: Any, b: Any) -> Any:
+    """L1 distance between every row of ``a`` (``n × features``) and of ``b`` (``m × features``).
+
+    Returns an ``n × m`` matrix; computed in row blocks of at most
+    :data:`BLOCK_ELEMENTS` intermediate values.
+    """
+    if np is None:
+        return [[calculate_l1_distance(x, y) for y in b] for x in a]
+    a = np.asarray(a, dtype=np.int64)
+    b = np.asarray(b, dtype=np.int64)
+    if a.ndim != 2 or b.ndim != 2 or a.shape[1] != b.shape[1]:
+        raise ValueError("Feature vectors must have same length")
+    out = np.empty((a.shape[0], b.shape[0]), dtype=np.int64)
+    rows = max(1, BLOCK_ELEMENTS // max(1, b.shape[0] * b.shape[1]))
+    for start in range(0, a.shape[0], rows):
+        block = a[start : start + rows, None, :] - b[None, :, :]
+        np.abs(block, out=block)
+        block.sum(axis=2, out=out[start : start + rows])
+    return out
+
+
+def batch_templates(samples: Any, counts: Optional[Sequence[int]] = None) -> Any:
+    """:func:`average_features` of each user's samples: ``users × features``."""
+    users, width, counts = _batch_shape(samples, counts)
+    if 0 in counts:
+        raise ValueError("At least one feature vector required")
+    if np is None:
+        return [average_features(user) for user in _user_samples(samples, counts)]
+    x = np.asarray(samples, dtype=np.int64)
+    if x.ndim != 3:
+        raise ValueError("All feature vectors must have same length")
+    mask = _mask(counts, width)
+    sums = np.where(mask[:, :, None], x, 0).sum(axis=1)
+    # Exact integer sums divided once, then rounded half to even, as round() does
+    return np.rint(sums / np.asarray(counts, dtype=np.float64)[:, None]).astype(np.int64)
+
+
+def batch_distances(templates: Any, samples: Any, counts: Optional[Sequence[int]] = None) -> Any:
+    """L1 distance from each user's template to each of their samples (``users × samples``).
+
+    Padding past a user's ``count`` is 0.
+    """
+    users, width, counts = _batch_shape(samples, counts)
+    if np is None:
+        return [
+            [calculate_l1_distance(t, s) for s in user]
+            for t, user in zip(templates, _user_samples(samples, counts))
+        ]
+    t = np.asarray(templates, dtype=np.int64)
+    x = np.asarray(samples, dtype=np.int64)
+    if x.ndim != 3 or t.shape != (x.shape[0], x.shape[2]):
+        raise ValueError("Feature vectors must have same length")
+    distances = np.abs(x - t[:, None, :]).sum(axis=2)
+    distances[~_mask(counts, width)] = 0
+    return distances
+
+
+def _distance_stats(distances: Any, counts: list[int]) -> tuple[Any, Any]:
+    """Mean and population stddev of each row's first ``count`` distances.
+
+    Summed in the same order as the scalar code, so the results are identical.
+    """
+    n = np.asarray(counts, dtype=np.float64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = distances.sum(axis=1) / n
+        squares = np.where(_mask(counts, distances.shape[1]), (distances - mean[:, None]) ** 2, 0.0)
+        # Column by column: float sums in sample order, not NumPy's pairwise order
+        total = np.zeros(len(counts))
+        for column in squares.T:
+            total += column
+        stddev = (total / n) ** 0.5
+    return mean, stddev
+
+
+def batch_adaptive_tau(
+    templates: Any,
+    samples: Any,
+    counts: Optional[Sequence[int]] = None,
+    base_tau: int = 400,
+    multiplier: float = 2.0,
+) -> Any:
+    """:func:`calculate_adaptive_tau` for each user: a ``users`` vector of thresholds."""
+    tau = adaptive_tau_sweep(templates, samples, counts, base_tau, [multiplier])[0]
+    logger.info("adaptive_tau_batch", users=len(samples), base_tau=base_tau)
+    return tau
+
+
+def adaptive_tau_sweep(
+    templates: Any,
+    samples: Any,
+    counts: Optional[Sequence[int]] = None,
+    base_tau: int = 400,
+    multipliers: Sequence[float] = (2.0,),
+) -> Any:
+    """:func:`calculate_adaptive_tau` for each multiplier and user: ``multipliers × users``.
+
+    The distances and their statistics are computed once for all multipliers.
+    """
+    users, width, counts = _batch_shape(samples, counts)
+    if np is None:
+        per_user = _user_samples(samples, counts)
+        return [
+            [_adaptive_tau(t, user, base_tau, m)[0] for t, user in zip(templates, per_user)]
+            for m in multipliers
+        ]
+    distances = batch_distances(templates, samples, counts)
+    mean, stddev = _distance_stats(distances, counts)
+    c = np.asarray(counts)
+    with np.errstate(invalid="ignore"):
+        adaptive = np.trunc(
+            mean[None, :] + np.asarray(multipliers, dtype=np.float64)[:, None] * stddev[None, :]
+        )
+        single = np.trunc(distances[:, 0] * 1.5) if width else np.zeros(users)
+    tau = np.where(c >= 2, adaptive, np.where(c == 1, single, base_tau))
+    return np.maximum(tau, base_tau).astype(np.int64)
+
+
+def _adaptive_tau(
+    template: Sequence[int], samples: Sequence[Sequence[int]], base_tau: int, multiplier: float
+) -> tuple[int, Optional[tuple[float, float]]]:
+    """The threshold of :func:`calculate_adaptive_tau`, without logging.
+
+    Also returns the distance mean and standard deviation it used, or ``None``
+    with fewer than two samples.
+    """
+    if not samples:
+        return base_tau, None
+    # Distances from the template to each sample
+    distances = [calculate_l1_distance(template, sample) for sample in samples]
+    if len(distances) < 2:
+        # Not enough samples for variance, use base + small margin
+        return max(base_tau, int(distances[0] * 1.5)), None
+    mean_dist = sum(distances) / len(distances)
+    stddev = (sum((d - mean_dist) ** 2 for d in distances) / len(distances)) ** 0.5
+    # Adaptive threshold: mean + multiplier * stddev, at least base_tau
+    return max(base_tau, int(mean_dist + multiplier * stddev)), (mean_dist, stddev)
+
+
+def batch_template_quality(
+    templates: Any, samples: Any, counts: Optional[Sequence[int]] = None
+) -> list[dict[str, float]]:
+    """:func:`calculate_template_quality` for each user."""
+    users, width, counts = _batch_shape(samples, counts)
+    if np is None:
+        return [
+            calculate_template_quality(t, user)
+            for t, user in zip(templates, _user_samples(samples, counts))
+        ]
+    mean, stddev = _distance_stats(batch_distances(templates, samples, counts), counts)
+    empty = {"mean_distance": 0.0, "stddev_distance": 0.0, "consistency_score": 0.0}
+    # round() per value, so results match the scalar function exactly
+    return [
+        {
+            "mean_distance": round(m, 2),
+            "stddev_distance": round(s, 2),
+            "consistency_score": round(max(0.0, min(1.0, 1.0 - (s / 200.0))), 3),
+        }
+        if count
+        else dict(empty)
+        for m, s, count in zip(mean.tolist(), stddev.tolist(), counts)
+    ]
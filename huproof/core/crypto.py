@@ -1,7 +1,22 @@
 import hashlib
+import hmac
+from functools import lru_cache
 
 
 def sha256_hex(data: str) -> str:
     return hashlib.sha256(data.encode("utf-8")).hexdigest()
 
 
+@lru_cache(maxsize=16)
+def _purpose_key(secret: str, purpose: str) -> bytes:
+    return hmac.new(secret.encode("utf-8"), purpose.encode("utf-8"), hashlib.sha256).digest()
+
+
+def keyed_hash(secret: str, purpose: str, data: str, size: int = 16) -> bytes:
+    """HMAC-SHA256 of ``data`` under a key derived from ``secret`` for ``purpose``.
+
+    Truncated to ``size`` bytes. Fixed-size keys for in-memory and shared state built
+    from client input (e.g. user ids), which neither grow with the input nor reveal it.
+    """
+    digest = hmac.new(_purpose_key(secret, purpose), data.encode("utf-8"), hashlib.sha256).digest()
+    return digest[:size]
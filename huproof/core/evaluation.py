@@ -0,0 +1,364 @@
+"""Accuracy evaluation: FRR, FAR and EER over sweeps of fixed and adaptive thresholds.
+
+Two sample sets are compared. Each user of the genuine set enrolls with
+their first ``enroll`` samples, which give the template
+(:func:`~.calibration.average_features`) and the adaptive thresholds
+(:func:`~.calibration.calculate_adaptive_tau`). Their other samples are
+genuine attempts against that template. Every sample of the impostor set
+is an attempt against the template of every genuine user except its own
+(same ``user`` id). An attempt is accepted when its L1 distance is at most
+the threshold.
+
+One pass over the data counts two sweeps:
+
+- ``tau``: one fixed threshold for every user, as ``TAU_DEFAULT`` sets it;
+- ``multiplier``: each user's adaptive threshold for a ``base_tau``.
+
+FAR is the share of impostor comparisons accepted, FRR the share of genuine
+ones rejected. Each sweep reports ROC points (FAR against ``1 - FRR``), DET
+points (both rates as normal deviates) and the equal error rate,
+interpolated between the two sweep points where FAR and FRR cross.
+
+Distances are not kept. Each block is folded into per-threshold counts and
+dropped, and users and impostor samples are read ``batch_size`` at a time.
+Only the genuine users' templates and thresholds stay in memory, and a block
+holds at most :data:`~.calibration.BLOCK_ELEMENTS` values, so millions of
+comparisons run in bounded memory. Like :mod:`.calibration`, this is
+vectorised when NumPy is installed and pure Python otherwise.
+"""
+
+import json
+from bisect import bisect_left
+from itertools import islice
+from statistics import NormalDist
+from typing import Any, Iterable, Iterator, Optional, Sequence
+
+from . import calibration
+
+# (user id, samples)
+Record = tuple[str, list[list[int]]]
+
+# Longest sweep parse_sweep expands
+MAX_SWEEP = 10_000
+
+_NORMAL = NormalDist()
+
+
+def read_samples(lines: Iterable[str]) -> Iterator[Record]:
+    """Records from ndjson lines of ``{"user": ..., "samples": [[...], ...]}``.
+
+    Blank lines are skipped.
+    """
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            user, samples = str(record["user"]), record["samples"]
+        except (ValueError, KeyError, TypeError):
+            raise ValueError(
+                f'line {number}: expected {{"user": ..., "samples": [[...], ...]}}'
+            ) from None
+        yield user, samples
+
+
+def parse_sweep(value: str, kind: type = float) -> list[Any]:
+    """Values of ``"start:stop:step"`` (``stop`` included) or of a comma separated list, sorted."""
+    try:
+        if ":" not in value:
+            values = {kind(part) for part in value.split(",") if part.strip()}
+        else:
+            start, stop, step = (kind(part) for part in value.split(":"))
+            if step <= 0 or stop < start:
+                raise ValueError
+            count = int((stop - start) / step + 1e-9) + 1
+            if count > MAX_SWEEP:
+                raise ValueError
+            values = {kind(round(start + i * step, 10)) for i in range(count)}
+    except ValueError:
+        raise ValueError(
+            f"invalid sweep {value!r}, "
+            f"expected start:stop:step (at most {MAX_SWEEP} values) or a list"
+        ) from None
+    if not values:
+        raise ValueError(f"invalid sweep {value!r}, no values")
+    return sorted(values)
+
+
+def _deviate(p: float) -> Optional[float]:
+    """``p`` on the normal deviate scale of DET plots; ``None`` at 0 and 1."""
+    return round(_NORMAL.inv_cdf(p), 6) if 0.0 < p < 1.0 else None
+
+
+def equal_error_rate(points: Sequence[dict[str, Any]], key: str) -> Optional[dict[str, float]]:
+    """Where FAR meets FRR, interpolated between sweep points ordered by ``key``.
+
+    ``None`` when FAR and FRR do not cross within the sweep.
+    """
+    previous = None
+    for point in points:
+        gap = point["far"] - point["frr"]
+        if gap >= 0:
+            if previous is None:
+                return {"rate": point["far"], key: point[key]} if gap == 0 else None
+            before = previous["far"] - previous["frr"]
+            t = -before / (gap - before)
+            return {
+                "rate": round(previous["far"] + t * (point["far"] - previous["far"]), 6),
+                key: round(previous[key] + t * (point[key] - previous[key]), 6),
+            }
+        previous = point
+    return None
+
+
+class _Counts:
+    """Accepted comparisons per fixed tau and per multiplier, folded in block by block."""
+
+    def __init__(self, taus: list[int], multipliers: int):
+        self.taus = taus
+        self.total = 0
+        # Comparisons whose smallest accepting tau is taus[i]; the last slot: none accepts
+        self.first_tau = [0] * (len(taus) + 1)
+        self.adaptive = [0] * multipliers
+
+    def add(self, distances: Any, thresholds: Any, keep: Any = None) -> None:
+        """Count a ``rows × users`` block of distances.
+
+        ``thresholds`` holds each user's adaptive threshold per multiplier
+        (``multipliers × users``); ``keep``, when given, masks the
+        comparisons to count.
+        """
+        np = calibration.np
+        if np is None:
+            for r, row in enumerate(distances):
+                for u, distance in enumerate(row):
+                    if keep is not None and not keep[r][u]:
+                        continue
+                    self.total += 1
+                    self.first_tau[bisect_left(self.taus, distance)] += 1
+                    for m, tau in enumerate(thresholds):
+                        self.adaptive[m] += distance <= tau[u]
+            return
+        values = distances.ravel() if keep is None else distances[keep]
+        self.total += values.size
+        first = np.bincount(
+            np.searchsorted(self.taus, values, side="left"), minlength=len(self.first_tau)
+        )
+        self.first_tau = [a + b for a, b in zip(self.first_tau, first.tolist())]
+        for m, tau in enumerate(thresholds):
+            accepted = distances <= tau[None, :]
+            if keep is not None:
+                accepted &= keep
+            self.adaptive[m] += int(np.count_nonzero(accepted))
+
+    def accepted_per_tau(self) -> list[int]:
+        accepted, running = [], 0
+        for count in self.first_tau[:-1]:
+            running += count
+            accepted.append(running)
+        return accepted
+
+
+class Evaluation:
+    """Genuine and impostor comparison counts for one tau sweep and one multiplier sweep."""
+
+    def __init__(
+        self,
+        taus: Sequence[int],
+        multipliers: Sequence[float],
+        enroll: int = 5,
+        base_tau: int = 400,
+        batch_size: int = 1024,
+    ):
+        if enroll < 1:
+            raise ValueError("enroll must be at least 1")
+        self.taus = sorted(set(taus))
+        self.multipliers = sorted(set(multipliers))
+        self.enroll = enroll
+        self.base_tau = base_tau
+        self.batch_size = max(1, batch_size)
+        self.features: Optional[int] = None
+        # Genuine user id -> column in templates/thresholds
+        self.users: dict[str, int] = {}
+        self.skipped = 0
+        self._skipped_users: set[str] = set()
+        self.genuine = _Counts(self.taus, len(self.multipliers))
+        self.impostor = _Counts(self.taus, len(self.multipliers))
+        # Lists while users are added; with NumPy, arrays once add_genuine is done
+        self._templates: Any = []
+        self._thresholds: Any = [] if calibration.np is not None else [[] for _ in self.multipliers]
+
+    def _check(self, user: str, samples: list[list[int]]) -> None:
+        for sample in samples:
+            if self.features is None:
+                self.features = len(sample)
+            if len(sample) != self.features:
+                raise ValueError(
+                    f"user {user!r}: samples must have {self.features} features, got {len(sample)}"
+                )
+
+    def add_genuine(self, records: Iterable[Record]) -> None:
+        """Enroll the users of ``records`` and count their genuine attempts.
+
+        Users with too few samples are skipped. Each user must appear once
+        (ValueError otherwise). Call once, before :meth:`add_impostors`.
+        """
+        records = iter(records)
+        while batch := list(islice(records, self.batch_size)):
+            self._genuine_batch(batch)
+        np = calibration.np
+        if np is not None:
+            m = len(self.multipliers)
+            self._templates = (
+                np.concatenate(self._templates)
+                if self._templates
+                else np.empty((0, self.features or 0), np.int64)
+            )
+            self._thresholds = (
+                np.concatenate(self._thresholds, axis=1)
+                if self._thresholds
+                else np.empty((m, 0), np.int64)
+            )
+
+    def _genuine_batch(self, batch: list[Record]) -> None:
+        enrolls, attempts = [], []
+        for user, samples in batch:
+            self._check(user, samples)
+            # A repeated user would take a second column and misalign every later one
+            if user in self.users or user in self._skipped_users:
+                raise ValueError(f"user {user!r} appears more than once in the genuine samples")
+            if len(samples) < self.enroll:
+                self.skipped += 1
+                self._skipped_users.add(user)
+                continue
+            self.users[user] = len(self.users)
+            enrolls.append(samples[: self.enroll])
+            attempts.append(samples[self.enroll :])
+        if not enrolls:
+            return
+        np = calibration.np
+        templates = calibration.batch_templates(enrolls)
+        thresholds = calibration.adaptive_tau_sweep(
+            templates, enrolls, base_tau=self.base_tau, multipliers=self.multipliers
+        )
+        counts = [len(a) for a in attempts]
+        if np is None:
+            for template, attempt, column in zip(templates, attempts, zip(*thresholds)):
+                self.genuine.add(
+                    calibration.distance_matrix(attempt, [template]), [[tau] for tau in column]
+                )
+            self._templates.extend(templates)
+            for kept, column in zip(self._thresholds, thresholds):
+                kept.extend(column)
+            return
+        width = max(counts)
+        if width:
+            padded = np.zeros((len(attempts), width, self.features), dtype=np.int64)
+            for i, attempt in enumerate(attempts):
+                if attempt:
+                    padded[i, : len(attempt)] = attempt
+            distances = calibration.batch_distances(templates, padded, counts)
+            keep = np.arange(width)[:, None] < np.asarray(counts)[None, :]
+            self.genuine.add(distances.T, thresholds, keep)
+        self._templates.append(templates)
+        self._thresholds.append(thresholds)
+
+    def add_impostors(self, records: Iterable[Record]) -> None:
+        """Count every impostor sample against every enrolled user other than its own."""
+        np = calibration.np
+        users = len(self.users)
+        if not users:
+            return
+
+        def samples() -> Iterator[tuple[int, list[int]]]:
+            for user, user_samples in records:
+                self._check(user, user_samples)
+                owner = self.users.get(user, -1)
+                for sample in user_samples:
+                    yield owner, sample
+
+        stream = samples()
+        while batch := list(islice(stream, self.batch_size)):
+            owners = [owner for owner, _ in batch]
+            rows = [sample for _, sample in batch]
+            if np is not None:
+                rows = np.asarray(rows, dtype=np.int64)
+                owners = np.asarray(owners)
+            # Template columns per block, so a block and its intermediates fit in BLOCK_ELEMENTS
+            step = max(1, calibration.BLOCK_ELEMENTS // (len(batch) * (self.features or 1)))
+            for start in range(0, users, step):
+                stop = min(start + step, users)
+                distances = calibration.distance_matrix(rows, self._templates[start:stop])
+                if np is None:
+                    thresholds = [column[start:stop] for column in self._thresholds]
+                    keep = [[owner != u for u in range(start, stop)] for owner in owners]
+                    self.impostor.add(distances, thresholds, keep)
+                    continue
+                keep = None
+                if ((owners >= start) & (owners < stop)).any():
+                    keep = owners[:, None] != np.arange(start, stop)[None, :]
+                self.impostor.add(distances, self._thresholds[:, start:stop], keep)
+
+    def _points(
+        self, key: str, values: list[Any], genuine: list[int], impostor: list[int]
+    ) -> list[dict[str, Any]]:
+        points = []
+        for value, accepted_genuine, accepted_impostor in zip(values, genuine, impostor):
+            far = accepted_impostor / self.impostor.total
+            frr = 1.0 - accepted_genuine / self.genuine.total
+            points.append(
+                {
+                    key: value,
+                    "far": round(far, 6),
+                    "frr": round(frr, 6),
+                    "tar": round(1.0 - frr, 6),
+                    "det": [_deviate(far), _deviate(frr)],
+                }
+            )
+        return points
+
+    def report(self) -> dict[str, Any]:
+        """Comparison counts, and ROC/DET points and EER of both sweeps."""
+        if not self.genuine.total or not self.impostor.total:
+            raise ValueError(
+                "need genuine and impostor comparisons, "
+                f"got {self.genuine.total} and {self.impostor.total}"
+                f" (users need more than enroll={self.enroll} samples)"
+            )
+        fixed = self._points(
+            "tau", self.taus, self.genuine.accepted_per_tau(), self.impostor.accepted_per_tau()
+        )
+        adaptive = self._points(
+            "multiplier", self.multipliers, self.genuine.adaptive, self.impostor.adaptive
+        )
+        return {
+            "users": len(self.users),
+            "skipped_users": self.skipped,
+            "enroll": self.enroll,
+            "genuine_comparisons": self.genuine.total,
+            "impostor_comparisons": self.impostor.total,
+            "tau": {"points": fixed, "eer": equal_error_rate(fixed, "tau")},
+            "multiplier": {
+                "base_tau": self.base_tau,
+                "points": adaptive,
+                "eer": equal_error_rate(adaptive, "multiplier"),
+            },
+        }
+
+
+def evaluate(
+    genuine: Iterable[Record],
+    impostor: Iterable[Record],
+    taus: Sequence[int],
+    multipliers: Sequence[float],
+    enroll: int = 5,
+    base_tau: int = 400,
+    batch_size: int = 1024,
+) -> dict[str, Any]:
+    """Compare the ``genuine`` and ``impostor`` sets and report both sweeps (see the module doc)."""
+    evaluation = Evaluation(
+        taus, multipliers, enroll=enroll, base_tau=base_tau, batch_size=batch_size
+    )
+    evaluation.add_genuine(genuine)
+    evaluation.add_impostors(impostor)
+    return evaluation.report()
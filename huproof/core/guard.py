@@ -0,0 +1,206 @@
+"""Pre-routing checks for the API routes: body size, origin and rate limits.
+
+:class:`GuardMiddleware` runs before routing, so hostile requests are
+turned away before FastAPI reads the body or Pydantic parses it. For each
+guarded route (:data:`ROUTES`) it checks, cheapest first:
+
+1. ``Content-Length`` against the route's cap (``413``);
+2. ``Origin`` (or ``Referer``) against the expected origin, which is
+   normalised once per configured value (``403``);
+3. the route's rate limits, per client IP and, on login start, per account
+   (``429`` with ``Retry-After``);
+4. the body, read while counting bytes, for requests without a
+   ``Content-Length`` (``413`` once over the cap).
+
+The body is then handed to the app as one message. Rejections other than rate
+limits are counted in ``guard_rejections`` (label ``reason``).
+"""
+
+from dataclasses import dataclass
+from typing import Optional
+from urllib.parse import parse_qs
+
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from ..config.settings import get_settings
+from .logging import get_logger
+from .metrics import inc_counter
+from .ratelimit import (
+    RateLimitExceeded,
+    account_key,
+    check_rate_limit,
+    client_ip,
+    parse_rate,
+    rate_limited_response,
+)
+from .tracing import span
+
+logger = get_logger()
+
+# Cap for routes that take no body
+NO_BODY = 1024
+
+
+@dataclass(frozen=True)
+class RouteRule:
+    # (limit name, setting holding its rate); keyed by client IP
+    ip_limits: tuple[tuple[str, str], ...]
+    # Body cap in bytes; None means MAX_BODY_BYTES
+    max_body: Optional[int] = NO_BODY
+    # Also limit per account, keyed by the user_id query parameter
+    account_limit: bool = False
+
+
+ROUTES: dict[tuple[str, str], RouteRule] = {
+    ("GET", "/api/enroll/start"): RouteRule((("enroll_start", "rate_limit_enroll_start"),)),
+    ("POST", "/api/enroll/finish"): RouteRule((("finish", "rate_limit_finish"),), max_body=None),
+    ("GET", "/api/login/start"): RouteRule(
+        (("login_start", "rate_limit_login_start"),), account_limit=True
+    ),
+    ("POST", "/api/login/finish"): RouteRule((("finish", "rate_limit_finish"),), max_body=None),
+    ("POST", "/api/logout"): RouteRule((("finish", "rate_limit_finish"),)),
+}
+
+
+class _Rejected(Exception):
+    def __init__(self, status_code: int, detail: str, reason: str):
+        self.status_code = status_code
+        self.detail = detail
+        self.reason = reason
+
+
+_expected: tuple[str, bytes] = ("", b"")
+
+
+def _expected_origin() -> bytes:
+    """The configured origin as header bytes (recomputed only when the setting changes)."""
+    global _expected
+    origin = get_settings().origin
+    if _expected[0] != origin:
+        _expected = (origin, origin.rstrip("/").encode("latin-1"))
+    return _expected[1]
+
+
+def check_origin(origin: Optional[bytes], path: str) -> None:
+    if not origin:
+        logger.warning("missing_origin_header", path=path)
+        raise _Rejected(403, "Origin header required", "origin_missing")
+    received = origin.rstrip(b"/")
+    if received != _expected_origin():
+        logger.warning(
+            "origin_mismatch",
+            received=received.decode("latin-1"),
+            expected=get_settings().origin.rstrip("/"),
+            path=path,
+        )
+        raise _Rejected(403, "Invalid origin", "origin_mismatch")
+
+
+class GuardMiddleware:
+    """Reject oversized, cross-origin and rate-limited requests to :data:`ROUTES` before routing."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        rule = ROUTES.get((scope["method"], scope["path"])) if scope["type"] == "http" else None
+        if rule is None:
+            await self.app(scope, receive, send)
+            return
+        try:
+            max_body = get_settings().max_body_bytes if rule.max_body is None else rule.max_body
+            content_length, origin, referer, forwarded_for = self._headers(scope)
+            if content_length is not None and content_length > max_body:
+                raise _Rejected(413, "Request body too large", "body_too_large")
+            with span("origin"):
+                check_origin(origin or referer, scope["path"])
+            self._rate_limit(scope, rule, forwarded_for)
+            body = await self._read_body(receive, max_body)
+        except _Rejected as rejected:
+            inc_counter("guard_rejections", reason=rejected.reason)
+            response = JSONResponse({"detail": rejected.detail}, status_code=rejected.status_code)
+            await response(scope, receive, send)
+            return
+        except RateLimitExceeded as exc:
+            logger.warning(
+                "rate_limit_exceeded",
+                ip=client_ip(forwarded_for, _peer(scope)),
+                path=scope["path"],
+                limit=exc.name,
+            )
+            await rate_limited_response(exc)(scope, receive, send)
+            return
+        # Tells validate_origin the check is done
+        scope.setdefault("state", {})["origin_checked"] = True
+        await self.app(scope, _replay(body, receive), send)
+
+    @staticmethod
+    def _headers(
+        scope: Scope,
+    ) -> tuple[Optional[int], Optional[bytes], Optional[bytes], Optional[str]]:
+        content_length = origin = referer = forwarded_for = None
+        for name, value in scope["headers"]:
+            if name == b"content-length":
+                try:
+                    content_length = int(value)
+                except ValueError:
+                    raise _Rejected(400, "Invalid Content-Length", "bad_content_length") from None
+            elif name == b"origin":
+                origin = value
+            elif name == b"referer":
+                referer = value
+            elif name == b"x-forwarded-for" and forwarded_for is None:
+                forwarded_for = value.decode("latin-1")
+        return content_length, origin, referer, forwarded_for
+
+    @staticmethod
+    def _rate_limit(scope: Scope, rule: RouteRule, forwarded_for: Optional[str]) -> None:
+        settings = get_settings()
+        ip = client_ip(forwarded_for, _peer(scope))
+        for name, setting in rule.ip_limits:
+            check_rate_limit(name, ip, parse_rate(getattr(settings, setting)))
+        if rule.account_limit:
+            user_ids = parse_qs(scope["query_string"].decode("latin-1")).get("user_id")
+            if user_ids:
+                # The handler binds the last value of a repeated parameter
+                check_rate_limit(
+                    "login_account",
+                    account_key(user_ids[-1]),
+                    parse_rate(settings.rate_limit_login_account),
+                )
+
+    @staticmethod
+    async def _read_body(receive: Receive, max_body: int) -> bytes:
+        chunks: list[bytes] = []
+        size = 0
+        while True:
+            message = await receive()
+            if message["type"] != "http.request":
+                # Client went away; let the app see the disconnect
+                raise _Rejected(400, "Client disconnected", "disconnected")
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if size > max_body:
+                raise _Rejected(413, "Request body too large", "body_too_large")
+            chunks.append(chunk)
+            if not message.get("more_body", False):
+                return b"".join(chunks)
+
+
+def _peer(scope: Scope) -> Optional[str]:
+    client = scope.get("client")
+    return client[0] if client else None
+
+
+def _replay(body: bytes, receive: Receive) -> Receive:
+    sent = False
+
+    async def replay() -> Message:
+        nonlocal sent
+        if sent:
+            return await receive()
+        sent = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    return replay
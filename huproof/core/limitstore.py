@@ -0,0 +1,193 @@
+"""Shared rate-limit state: a minimal Redis protocol client and an in-process stand-in.
+
+Both stores expose one operation, :meth:`acquire`. It takes up to ``want``
+GCRA tokens for a key at once and returns ``(granted, retry_after_ms,
+remaining)``. In Redis the check and the update are one Lua script run
+against the server clock, so any number of workers and nodes share one
+limit per key. Keys expire when their window has passed.
+
+The client speaks RESP over plain sockets, from a small pool of
+connections. It needs no Redis library and works with any server that
+runs Lua scripts (Redis, Valkey, KeyDB).
+"""
+
+import hashlib
+import queue
+import socket
+import threading
+from time import monotonic
+from typing import Any, Callable, Optional
+from urllib.parse import unquote, urlsplit
+
+# KEYS[1] = key; ARGV = interval ms, burst ms (interval * count), tokens wanted
+GCRA_SCRIPT = b"""
+local interval = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local want = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = t[1] * 1000 + t[2] / 1000
+local tat = tonumber(redis.call('GET', KEYS[1])) or now
+if tat < now then tat = now end
+local free = math.floor((burst - (tat - now)) / interval + 1e-9)
+if free < 1 then
+  return {0, tostring(tat + interval - burst - now), 0}
+end
+local n = math.min(want, free)
+tat = tat + n * interval
+redis.call('SET', KEYS[1], tostring(tat), 'PX', math.ceil(tat - now))
+return {n, '0', free - n}
+"""
+GCRA_SHA = hashlib.sha1(GCRA_SCRIPT).hexdigest()
+
+Acquired = tuple[int, float, int]
+
+
+class StoreError(Exception):
+    """The store answered with an error, or not in the protocol."""
+
+
+def encode_command(*args: Any) -> bytes:
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        data = arg if isinstance(arg, bytes) else str(arg).encode()
+        parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+    return b"".join(parts)
+
+
+def read_reply(f: Any) -> Any:
+    """Read one RESP2 reply from a binary file object; error replies raise :class:`StoreError`."""
+    line = f.readline()
+    if not line.endswith(b"\r\n"):
+        raise StoreError("connection closed")
+    kind, rest = line[:1], line[1:-2]
+    if kind == b"+":
+        return rest.decode()
+    if kind == b"-":
+        raise StoreError(rest.decode())
+    if kind == b":":
+        return int(rest)
+    if kind == b"$":
+        size = int(rest)
+        if size < 0:
+            return None
+        data = f.read(size + 2)
+        return data[:-2]
+    if kind == b"*":
+        size = int(rest)
+        return None if size < 0 else [read_reply(f) for _ in range(size)]
+    raise StoreError(f"unexpected reply {line[:32]!r}")
+
+
+class _Connection:
+    def __init__(self, host: str, port: int, timeout_s: float):
+        self.sock = socket.create_connection((host, port), timeout=timeout_s)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.file = self.sock.makefile("rb")
+
+    def execute(self, *args: Any) -> Any:
+        self.sock.sendall(encode_command(*args))
+        return read_reply(self.file)
+
+    def close(self) -> None:
+        self.file.close()
+        self.sock.close()
+
+
+class RedisStore:
+    """GCRA tokens in a Redis-protocol server at ``redis://[:password@]host[:port][/db]``."""
+
+    def __init__(self, url: str, timeout_s: float = 0.05, pool_size: int = 8):
+        parts = urlsplit(url)
+        if parts.scheme != "redis":
+            raise ValueError(f"unsupported rate limit store {url!r}, expected redis://host:port/db")
+        self.host = parts.hostname or "localhost"
+        self.port = parts.port or 6379
+        self.password = unquote(parts.password) if parts.password else None
+        self.username = unquote(parts.username) if parts.username else None
+        self.db = int(parts.path.strip("/") or 0)
+        self.timeout_s = timeout_s
+        self.prefix = "huproof:rl:"
+        self._pool: queue.LifoQueue[_Connection] = queue.LifoQueue(pool_size)
+
+    def _connect(self) -> _Connection:
+        conn = _Connection(self.host, self.port, self.timeout_s)
+        try:
+            if self.password:
+                conn.execute("AUTH", *filter(None, (self.username, self.password)))
+            if self.db:
+                conn.execute("SELECT", self.db)
+        except Exception:
+            conn.close()
+            raise
+        return conn
+
+    def execute(self, *args: Any) -> Any:
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        try:
+            reply = conn.execute(*args)
+        except StoreError:
+            # An error reply leaves the connection usable
+            self._release(conn)
+            raise
+        except Exception:
+            conn.close()
+            raise
+        self._release(conn)
+        return reply
+
+    def _release(self, conn: _Connection) -> None:
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def acquire(self, key: str, interval_ms: float, burst_ms: float, want: int) -> Acquired:
+        args = (1, self.prefix + key, repr(interval_ms), repr(burst_ms), want)
+        try:
+            reply = self.execute("EVALSHA", GCRA_SHA, *args)
+        except StoreError as exc:
+            if not str(exc).startswith("NOSCRIPT"):
+                raise
+            # First use on this server: EVAL also caches the script for EVALSHA
+            reply = self.execute("EVAL", GCRA_SCRIPT, *args)
+        granted, retry_ms, remaining = reply
+        return int(granted), float(retry_ms), int(remaining)
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class MemoryStore:
+    """In-process stand-in for :class:`RedisStore` with the same semantics, for tests."""
+
+    def __init__(self, clock: Callable[[], float] = monotonic):
+        self.clock = clock
+        self.tats: dict[str, float] = {}
+        self._lock = threading.Lock()
+        # Set to an exception to simulate an unreachable store
+        self.fail: Optional[Exception] = None
+        self.calls = 0
+
+    def acquire(self, key: str, interval_ms: float, burst_ms: float, want: int) -> Acquired:
+        self.calls += 1
+        if self.fail is not None:
+            raise self.fail
+        now = self.clock() * 1000.0
+        with self._lock:
+            tat = max(self.tats.get(key, now), now)
+            free = int((burst_ms - (tat - now)) / interval_ms + 1e-9)
+            if free < 1:
+                return 0, tat + interval_ms - burst_ms - now, 0
+            n = min(want, free)
+            self.tats[key] = tat + n * interval_ms
+            return n, 0.0, free - n
+
+    def close(self) -> None:
+        pass
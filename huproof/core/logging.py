@@ -1,25 +1,294 @@
+"""Structured logging: structlog events rendered as JSON lines.
+
+The request thread only filters and stamps an event, then hands it to a
+bounded queue (``LOG_QUEUE_SIZE``). A background thread renders the JSON
+(``orjson`` when installed) and writes it in batches. Chatty events can be
+sampled (``LOG_SAMPLE``, e.g. ``metric_timing=0.01``) or capped per second
+(``LOG_RATE_LIMIT``, e.g. ``zk_verify_ok=10``). Events dropped by sampling,
+rate limits or a full queue are counted in the ``log_events_dropped`` metric
+and summarised in a ``log_events_dropped`` line every ``DROP_REPORT_S``.
+``LOG_ASYNC=0`` renders and writes on the calling thread instead; drops are
+then reported by the next event logged or dropped after the interval.
+"""
+
+import atexit
+import json
 import logging
+import queue
+import random
+import sys
+import threading
+from collections import Counter
+from datetime import datetime, timezone
+from time import monotonic, time
+from typing import Any, Callable, Optional, TextIO
 
 import structlog
 
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+DROP_REPORT_S = 10.0
+_BATCH = 512
+
+_json_encoder = json.JSONEncoder(separators=(", ", ": "), check_circular=False, default=repr)
+
+
+def _iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, tz=timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def render_json(event: dict[str, Any]) -> str:
+    """One JSON line; the float ``timestamp`` set by the pipeline becomes ISO 8601 UTC."""
+    ts = event.get("timestamp")
+    if isinstance(ts, float):
+        event["timestamp"] = _iso(ts)
+    if orjson is not None:
+        return orjson.dumps(event, default=repr, option=orjson.OPT_NON_STR_KEYS).decode()
+    return _json_encoder.encode(event)
+
+
+def parse_event_rates(value: str) -> dict[str, float]:
+    """Parse ``"event=number,event=number"`` settings."""
+    rates: dict[str, float] = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        event, _, number = item.partition("=")
+        try:
+            rates[event.strip()] = float(number)
+        except ValueError:
+            raise ValueError(f"invalid event rate {item!r}, expected event=number") from None
+    return rates
+
+
+class _RateLimit:
+    """At most ``per_s`` events per one-second window (approximate under concurrency)."""
+
+    def __init__(self, per_s: float):
+        self.per_s = per_s
+        self.window = -1
+        self.seen = 0
+
+    def allow(self) -> bool:
+        window = int(monotonic())
+        if window != self.window:
+            self.window, self.seen = window, 0
+        self.seen += 1
+        return self.seen <= self.per_s
+
+
+class LogPipeline:
+    """Sampling, rate limiting, and the queue between request threads and the writer thread."""
+
+    def __init__(
+        self,
+        stream: Optional[TextIO] = None,
+        sample: Optional[dict[str, float]] = None,
+        rate_limits: Optional[dict[str, float]] = None,
+        queue_size: int = 10_000,
+        background: bool = True,
+    ):
+        self.stream = stream
+        self.sample = sample or {}
+        self.rate_limits = {event: _RateLimit(n) for event, n in (rate_limits or {}).items()}
+        self.dropped: Counter[tuple[str, str]] = Counter()
+        self._dropped_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._queue: Optional[queue.Queue] = queue.Queue(queue_size) if background else None
+        self._next_report = monotonic() + DROP_REPORT_S
+        self._write_failed = False
+        self._thread: Optional[threading.Thread] = None
+        if self._queue is not None:
+            self._thread = threading.Thread(
+                target=self._run, name="huproof-log-writer", daemon=True
+            )
+            self._thread.start()
+
+    def _drop(self, event: str, reason: str) -> None:
+        with self._dropped_lock:
+            self.dropped[(event, reason)] += 1
+        if self._queue is None:
+            self._maybe_report_dropped()
+
+    def filter(self, _logger: Any, _method: str, event_dict: dict[str, Any]) -> dict[str, Any]:
+        """First processor: drop sampled-out and rate-limited events before any other work."""
+        event = event_dict.get("event", "")
+        rate = self.sample.get(event)
+        if rate is not None and random.random() >= rate:
+            self._drop(event, "sampled")
+            raise structlog.DropEvent
+        limit = self.rate_limits.get(event)
+        if limit is not None and not limit.allow():
+            self._drop(event, "rate_limited")
+            raise structlog.DropEvent
+        # Rendered to ISO 8601 by the writer
+        event_dict["timestamp"] = time()
+        return event_dict
+
+    def emit(self, event_dict: dict[str, Any]) -> None:
+        events = self._queue
+        if events is None:
+            self._write([event_dict])
+            self._maybe_report_dropped()
+            return
+        try:
+            events.put_nowait(event_dict)
+        except queue.Full:
+            self._drop(event_dict.get("event", ""), "queue_full")
+
+    def _write(self, events: list[dict[str, Any]]) -> None:
+        text = "".join(render_json(event) + "\n" for event in events)
+        stream = self.stream or sys.stdout
+        with self._write_lock:
+            stream.write(text)
+            stream.flush()
+
+    def _report_dropped(self) -> None:
+        with self._dropped_lock:
+            dropped, self.dropped = self.dropped, Counter()
+        if not dropped:
+            return
+        from .metrics import inc_counter
+
+        lines = []
+        for (event, reason), count in sorted(dropped.items()):
+            inc_counter("log_events_dropped", count, event=event, reason=reason)
+            lines.append(
+                {
+                    "dropped_event": event,
+                    "reason": reason,
+                    "count": count,
+                    "event": "log_events_dropped",
+                    "timestamp": time(),
+                    "level": "info",
+                }
+            )
+        self._write(lines)
 
-def configure_logging() -> None:
-    """Configure structured logging via structlog."""
-    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    def _maybe_report_dropped(self) -> None:
+        """Report drops once ``DROP_REPORT_S`` has passed since the last report."""
+        if monotonic() >= self._next_report:
+            self._next_report = monotonic() + DROP_REPORT_S
+            self._report_dropped()
+
+    def _report_write_error(self, error: Exception) -> None:
+        """Count a failed write; the first one also goes to stderr, as logging itself is broken."""
+        from .metrics import inc_counter
+
+        inc_counter("log_write_errors")
+        if not self._write_failed:
+            self._write_failed = True
+            print(f"huproof: writing log events failed: {error!r}", file=sys.stderr)
+
+    def _run(self) -> None:
+        events = self._queue
+        assert events is not None
+        stopping = False
+        while not stopping:
+            try:
+                batch = [events.get(timeout=DROP_REPORT_S)]
+            except queue.Empty:
+                batch = []
+            while batch and len(batch) < _BATCH:
+                try:
+                    batch.append(events.get_nowait())
+                except queue.Empty:
+                    break
+            # None is the stop sentinel from close(); an emit racing close() can queue
+            # events after it, so it may sit anywhere in the batch
+            to_write = [event for event in batch if event is not None]
+            stopping = len(to_write) < len(batch)
+            try:
+                if to_write:
+                    self._write(to_write)
+                self._maybe_report_dropped()
+            except Exception as e:  # never let the writer die
+                self._report_write_error(e)
+            finally:
+                for _ in batch:
+                    events.task_done()
+
+    def flush(self) -> None:
+        """Wait until every queued event is written, then report drops."""
+        if self._queue is not None:
+            self._queue.join()
+        self._report_dropped()
+
+    def close(self) -> None:
+        """Write out queued events and stop the writer thread; later events are written inline."""
+        events, self._queue = self._queue, None
+        if events is not None and self._thread is not None:
+            events.put(None)
+            self._thread.join()
+            # Events queued by an emit that raced close() after the writer stopped
+            late = []
+            while True:
+                try:
+                    late.append(events.get_nowait())
+                except queue.Empty:
+                    break
+            late = [event for event in late if event is not None]
+            if late:
+                self._write(late)
+        self._report_dropped()
+
+
+class _PipelineLogger:
+    """structlog logger handing each processed event dict to the pipeline."""
+
+    def __init__(self, pipeline: LogPipeline):
+        self._emit = pipeline.emit
+
+    def msg(self, **event_dict: Any) -> None:
+        self._emit(event_dict)
+
+    debug = info = warning = warn = error = critical = exception = fatal = log = msg
+
+
+_pipeline: Optional[LogPipeline] = None
+
+
+def configure_logging(stream: Optional[TextIO] = None) -> None:
+    """Configure structured logging via structlog (to stdout unless ``stream`` is given)."""
+    global _pipeline
+    from ..config.settings import get_settings
+
+    settings = get_settings()
+    logging.basicConfig(level=logging.INFO, format="%(message)s", stream=stream)
+    if _pipeline is not None:
+        # Loggers cached by structlog keep the old pipeline; once closed it writes inline
+        _pipeline.close()
+    pipeline = _pipeline = LogPipeline(
+        stream,
+        sample=parse_event_rates(settings.log_sample),
+        rate_limits=parse_event_rates(settings.log_rate_limit),
+        queue_size=settings.log_queue_size,
+        background=settings.log_async,
+    )
+    factory: Callable[..., _PipelineLogger] = lambda *args: _PipelineLogger(pipeline)  # noqa: E731
     structlog.configure(
         processors=[
-            structlog.processors.TimeStamper(fmt="iso"),
+            pipeline.filter,
             structlog.processors.add_log_level,
+            # Exceptions and stacks must be captured on the calling thread
             structlog.processors.StackInfoRenderer(),
             structlog.processors.format_exc_info,
-            structlog.processors.JSONRenderer(),
         ],
         wrapper_class=structlog.make_filtering_bound_logger(logging.INFO),
+        logger_factory=factory,
         cache_logger_on_first_use=True,
     )
 
 
-def get_logger() -> structlog.BoundLoggerBase:
-    return structlog.get_logger("huproof")
+def flush_logs() -> None:
+    """Write out queued log events (called at exit; call before reading the log stream)."""
+    if _pipeline is not None:
+        _pipeline.flush()
+
+
+atexit.register(flush_logs)
 
 
+def get_logger() -> structlog.BoundLoggerBase:
+    return structlog.get_logger("huproof")
@@ -0,0 +1,156 @@
+"""Memory diagnostics: on-demand ``tracemalloc`` snapshots and process memory gauges.
+
+``tracemalloc`` slows allocations down noticeably, so it is off until an
+admin starts it. Snapshots are kept under a label (at most
+``MAX_SNAPSHOTS``, oldest dropped first) so two of them can be compared
+later: taking one before and one after a suspected leak shows the
+allocation sites that grew.
+"""
+
+import asyncio
+import gc
+import os
+import resource
+import sys
+import threading
+import tracemalloc
+from collections import OrderedDict
+from typing import Any, Optional
+
+from .metrics import set_gauge
+
+MAX_SNAPSHOTS = 8
+GROUP_BY = ("lineno", "filename", "traceback")
+
+# Allocations made by the tracing machinery itself
+_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+]
+
+_snapshots: "OrderedDict[str, tracemalloc.Snapshot]" = OrderedDict()
+_lock = threading.Lock()
+
+
+class NotTracing(Exception):
+    """``tracemalloc`` is not running."""
+
+
+def start_tracing(frames: int = 1) -> None:
+    """Start tracing allocations, keeping ``frames`` frames per traceback."""
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+    tracemalloc.start(frames)
+
+
+def stop_tracing() -> None:
+    """Stop tracing and free the traces; snapshots taken so far are kept."""
+    tracemalloc.stop()
+
+
+def tracing_status() -> dict[str, Any]:
+    status: dict[str, Any] = {"tracing": tracemalloc.is_tracing(), "snapshots": list(_snapshots)}
+    if tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        status.update(
+            frames=tracemalloc.get_traceback_limit(), traced_bytes=current, peak_bytes=peak
+        )
+    return status
+
+
+def take_snapshot(label: str) -> dict[str, Any]:
+    """Snapshot the traced allocations under ``label``, replacing an older one of that name."""
+    if not tracemalloc.is_tracing():
+        raise NotTracing()
+    snapshot = tracemalloc.take_snapshot().filter_traces(_FILTERS)
+    with _lock:
+        _snapshots.pop(label, None)
+        _snapshots[label] = snapshot
+        while len(_snapshots) > MAX_SNAPSHOTS:
+            _snapshots.popitem(last=False)
+    return {
+        "label": label,
+        "traces": len(snapshot.traces),
+        "traced_bytes": sum(trace.size for trace in snapshot.traces),
+    }
+
+
+def get_snapshot(label: str) -> Optional[tracemalloc.Snapshot]:
+    return _snapshots.get(label)
+
+
+def _site(traceback: tracemalloc.Traceback) -> list[str]:
+    return [f"{frame.filename}:{frame.lineno}" for frame in traceback]
+
+
+def top_allocations(
+    snapshot: tracemalloc.Snapshot, limit: int = 20, group_by: str = "lineno"
+) -> list[dict[str, Any]]:
+    """The ``limit`` allocation sites holding the most memory."""
+    return [
+        {"site": _site(stat.traceback), "size": stat.size, "count": stat.count}
+        for stat in snapshot.statistics(group_by)[:limit]
+    ]
+
+
+def diff_allocations(
+    base: tracemalloc.Snapshot,
+    target: tracemalloc.Snapshot,
+    limit: int = 20,
+    group_by: str = "lineno",
+) -> list[dict[str, Any]]:
+    """The ``limit`` sites whose memory changed most from ``base`` to ``target``."""
+    return [
+        {
+            "site": _site(stat.traceback),
+            "size": stat.size,
+            "size_diff": stat.size_diff,
+            "count": stat.count,
+            "count_diff": stat.count_diff,
+        }
+        for stat in target.compare_to(base, group_by)[:limit]
+    ]
+
+
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # Peak, not current, RSS; kilobytes on Linux, bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def process_memory() -> dict[str, Any]:
+    """Resident set size, objects per GC generation and collections so far."""
+    counts = gc.get_count()
+    return {
+        "rss_bytes": _rss_bytes(),
+        "gc": [
+            {
+                "generation": generation,
+                "objects": counts[generation],
+                "collections": stats["collections"],
+            }
+            for generation, stats in enumerate(gc.get_stats())
+        ],
+        "tracemalloc": tracing_status(),
+    }
+
+
+def record_memory_gauges() -> None:
+    memory = process_memory()
+    set_gauge("process_rss_bytes", memory["rss_bytes"])
+    for gen in memory["gc"]:
+        set_gauge("gc_objects", gen["objects"], generation=gen["generation"])
+        set_gauge("gc_collections", gen["collections"], generation=gen["generation"])
+
+
+async def run_memory_probe(interval_s: float) -> None:
+    """Update the memory gauges every ``interval_s`` until cancelled."""
+    while True:
+        record_memory_gauges()
+        await asyncio.sleep(interval_s)
@@ -1,14 +1,533 @@
-"""Metrics and monitoring utilities."""
+"""Metrics and monitoring utilities.
 
-from time import perf_counter
+Timings go into log-bucketed histograms and counters into running totals,
+so recording is O(1) and memory stays constant however much traffic the
+process serves. Each metric also keeps per-10-second slots for the last five
+minutes, which give the ``1m``/``5m`` window statistics.
+"""
+
+import bisect
+import glob
+import json
+import math
+import mmap
+import operator
+import os
+import re
+import struct
+import threading
+from array import array
+from time import monotonic, perf_counter
 from typing import Any, Optional
 
 from .logging import get_logger
 
 logger = get_logger()
 
-# Simple in-memory metrics (for PoC; use Prometheus for production)
-_metrics: dict[str, list[float]] = {}
+# Histogram buckets grow by 2**(1/16) (~4.4% relative error) from 1µs to ~3 hours
+_BUCKET_GROWTH = 2 ** (1 / 16)
+_BUCKET_MIN_MS = 1e-3
+_BUCKETS = 16 * 34
+_LOG_GROWTH = math.log(_BUCKET_GROWTH)
+
+# Sliding windows: 30 slots of 10 s cover 5 minutes
+_SLOT_S = 10.0
+_SLOTS = 30
+WINDOWS = {"1m": 6, "5m": 30}
+
+QUANTILES = {"p50": 0.5, "p90": 0.9, "p99": 0.99, "p999": 0.999}
+
+
+def _bucket(value: float) -> int:
+    if value <= _BUCKET_MIN_MS:
+        return 0
+    return min(int(math.log(value / _BUCKET_MIN_MS) / _LOG_GROWTH) + 1, _BUCKETS - 1)
+
+
+def _bucket_value(index: int) -> float:
+    """Geometric midpoint of a bucket."""
+    if index == 0:
+        return _BUCKET_MIN_MS
+    return _BUCKET_MIN_MS * _BUCKET_GROWTH ** (index - 0.5)
+
+
+def _quantiles(
+    counts: dict[int, int] | list[int], total: int, lo: float, hi: float
+) -> dict[str, float]:
+    items = sorted(counts.items()) if isinstance(counts, dict) else enumerate(counts)
+    targets = sorted((q * total, name) for name, q in QUANTILES.items())
+    result: dict[str, float] = {}
+    seen = 0
+    pending = iter(targets)
+    rank, name = next(pending)
+    for index, count in items:
+        if not count:
+            continue
+        seen += count
+        while seen >= rank:
+            result[name] = min(max(_bucket_value(index), lo), hi)
+            try:
+                rank, name = next(pending)
+            except StopIteration:
+                return result
+    return result
+
+
+def _new_buffer(size: int) -> memoryview:
+    return memoryview(bytearray(size))
+
+
+def _current_slot(f: memoryview, base: int, fields: int, now: float) -> tuple[int, bool]:
+    """Index of the 10-second slot for ``now`` in the ring at ``f[base:]``; True if just recycled.
+
+    A slot's first field holds its epoch plus one, so zeroed memory reads as empty.
+    """
+    epoch = int(now // _SLOT_S)
+    index = epoch % _SLOTS
+    if f[base + index * fields] == epoch + 1:
+        return index, False
+    f[base + index * fields] = epoch + 1
+    return index, True
+
+
+def _recent_slots(f: memoryview, base: int, fields: int, now: float, slots: int) -> list[int]:
+    epoch = int(now // _SLOT_S)
+    return [
+        e % _SLOTS
+        for e in range(epoch - slots + 1, epoch + 1)
+        if f[base + (e % _SLOTS) * fields] == e + 1
+    ]
+
+
+# Histogram layout: float64 [count, sum, min, max, bucket counts...,
+# slots of (epoch + 1, count, sum, min, max)], then uint32 bucket counts per slot
+_H_BUCKETS = 4
+_H_SLOTS = _H_BUCKETS + _BUCKETS
+_H_SLOT_FIELDS = 5
+_H_FLOATS = _H_SLOTS + _SLOTS * _H_SLOT_FIELDS
+_ZERO_SLOT = memoryview(bytes(_BUCKETS * 4)).cast("I")
+_EMPTY_SLOT_FIELDS = memoryview(array("d", [0.0, 0.0, math.inf, -math.inf]).tobytes()).cast("d")
+
+
+class Histogram:
+    """Log-bucketed histogram with exact count/sum/min/max and sliding windows.
+
+    State lives in a fixed-size buffer (``SIZE`` bytes), private to the process
+    or a slice of the shared metrics file.
+    """
+
+    SIZE = _H_FLOATS * 8 + _SLOTS * _BUCKETS * 4
+
+    def __init__(self, buffer: Optional[memoryview] = None) -> None:
+        buffer = _new_buffer(self.SIZE) if buffer is None else buffer
+        self._lock = threading.Lock()
+        self._f = buffer[: _H_FLOATS * 8].cast("d")
+        self._counts = self._f[_H_BUCKETS:_H_SLOTS]
+        self._slot_counts = buffer[_H_FLOATS * 8 : self.SIZE].cast("I")
+
+    @property
+    def count(self) -> int:
+        return int(self._f[0])
+
+    @property
+    def sum(self) -> float:
+        return self._f[1]
+
+    def observe(self, value: float) -> None:
+        index = _bucket(value)
+        f = self._f
+        with self._lock:
+            slot, fresh = _current_slot(f, _H_SLOTS, _H_SLOT_FIELDS, monotonic())
+            s = _H_SLOTS + slot * _H_SLOT_FIELDS
+            if fresh:
+                f[s + 1 : s + 5] = _EMPTY_SLOT_FIELDS
+                self._slot_counts[slot * _BUCKETS : (slot + 1) * _BUCKETS] = _ZERO_SLOT
+            f[s + 2] += value
+            f[s + 3] = min(f[s + 3], value)
+            f[s + 4] = max(f[s + 4], value)
+            self._slot_counts[slot * _BUCKETS + index] += 1
+            f[_H_BUCKETS + index] += 1
+            f[1] += value
+            f[2] = value if not f[0] else min(f[2], value)
+            f[3] = value if not f[0] else max(f[3], value)
+            # Counts last: a reader in another worker sees the observation only once it is complete
+            f[s + 1] += 1
+            f[0] += 1
+
+    def stats(self) -> Optional[dict[str, Any]]:
+        return _histogram_stats([self])
+
+
+def _window(slots: list[tuple[float, float, float, float, list[int]]]) -> dict[str, float]:
+    count = int(sum(s[0] for s in slots))
+    if not count:
+        return {"count": 0}
+    lo, hi = min(s[2] for s in slots), max(s[3] for s in slots)
+    merged = [0] * _BUCKETS
+    for s in slots:
+        merged = list(map(operator.add, merged, s[4]))
+    return {
+        "count": count,
+        "mean": sum(s[1] for s in slots) / count,
+        "min": lo,
+        "max": hi,
+        **_quantiles(merged, count, lo, hi),
+    }
+
+
+def _histogram_stats(hists: list[Histogram]) -> Optional[dict[str, Any]]:
+    """Statistics of the union of ``hists`` (the series of one metric, across workers)."""
+    now = monotonic()
+    count, total, lo, hi = 0, 0.0, math.inf, -math.inf
+    counts = [0] * _BUCKETS
+    recent: dict[str, list[tuple[float, float, float, float, list[int]]]] = {
+        name: [] for name in WINDOWS
+    }
+    for hist in hists:
+        f = hist._f
+        with hist._lock:
+            if not f[0]:
+                continue
+            count += int(f[0])
+            total += f[1]
+            lo, hi = min(lo, f[2]), max(hi, f[3])
+            counts = list(map(operator.add, counts, map(int, hist._counts)))
+            for name, n in WINDOWS.items():
+                for slot in _recent_slots(f, _H_SLOTS, _H_SLOT_FIELDS, now, n):
+                    s = _H_SLOTS + slot * _H_SLOT_FIELDS
+                    buckets = hist._slot_counts[slot * _BUCKETS : (slot + 1) * _BUCKETS].tolist()
+                    recent[name].append((f[s + 1], f[s + 2], f[s + 3], f[s + 4], buckets))
+    if not count:
+        return None
+    return {
+        "count": count,
+        "mean": total / count,
+        "min": lo,
+        "max": hi,
+        **_quantiles(counts, count, lo, hi),
+        "windows": {name: _window(slots) for name, slots in recent.items()},
+    }
+
+
+# Counter layout: float64 [count, total, min, max, slots of (epoch + 1, count, total)]
+_C_SLOTS = 4
+_C_SLOT_FIELDS = 3
+_C_FLOATS = _C_SLOTS + _SLOTS * _C_SLOT_FIELDS
+
+
+class Counter:
+    """Monotonic counter: running total plus count/min/max of the increments."""
+
+    SIZE = _C_FLOATS * 8
+
+    def __init__(self, buffer: Optional[memoryview] = None) -> None:
+        buffer = _new_buffer(self.SIZE) if buffer is None else buffer
+        self._lock = threading.Lock()
+        self._f = buffer[: self.SIZE].cast("d")
+
+    @property
+    def count(self) -> int:
+        return int(self._f[0])
+
+    @property
+    def total(self) -> float:
+        return self._f[1]
+
+    def inc(self, value: float = 1.0) -> None:
+        f = self._f
+        with self._lock:
+            slot, fresh = _current_slot(f, _C_SLOTS, _C_SLOT_FIELDS, monotonic())
+            s = _C_SLOTS + slot * _C_SLOT_FIELDS
+            if fresh:
+                f[s + 1] = f[s + 2] = 0.0
+            f[s + 2] += value
+            f[s + 1] += 1
+            f[2] = value if not f[0] else min(f[2], value)
+            f[3] = value if not f[0] else max(f[3], value)
+            f[1] += value
+            f[0] += 1
+
+    def stats(self) -> Optional[dict[str, Any]]:
+        return _counter_stats([self])
+
+
+def _counter_stats(counters: list[Counter]) -> Optional[dict[str, Any]]:
+    now = monotonic()
+    count, total, lo, hi = 0, 0.0, math.inf, -math.inf
+    windows = {name: {"count": 0, "total": 0.0} for name in WINDOWS}
+    for counter in counters:
+        f = counter._f
+        with counter._lock:
+            if not f[0]:
+                continue
+            count += int(f[0])
+            total += f[1]
+            lo, hi = min(lo, f[2]), max(hi, f[3])
+            for name, n in WINDOWS.items():
+                for slot in _recent_slots(f, _C_SLOTS, _C_SLOT_FIELDS, now, n):
+                    s = _C_SLOTS + slot * _C_SLOT_FIELDS
+                    windows[name]["count"] += int(f[s + 1])
+                    windows[name]["total"] += f[s + 2]
+    if not count:
+        return None
+    return {
+        "count": count,
+        "total": total,
+        "mean": total / count,
+        "min": lo,
+        "max": hi,
+        "windows": windows,
+    }
+
+
+class Gauge:
+    """Value that is set or moved up and down, e.g. a queue depth."""
+
+    SIZE = 8
+
+    def __init__(self, buffer: Optional[memoryview] = None) -> None:
+        buffer = _new_buffer(self.SIZE) if buffer is None else buffer
+        self._lock = threading.Lock()
+        self._f = buffer[: self.SIZE].cast("d")
+
+    @property
+    def value(self) -> float:
+        return self._f[0]
+
+    def set(self, value: float) -> None:
+        self._f[0] = value
+
+    def inc(self, value: float = 1.0) -> None:
+        with self._lock:
+            self._f[0] += value
+
+
+def _gauge_stats(gauges: list[Gauge]) -> Optional[dict[str, Any]]:
+    return {"value": sum(g.value for g in gauges)} if gauges else None
+
+
+LabelKey = tuple[tuple[str, str], ...]
+# A worker's file: inode, mapping, bytes parsed so far, and its (name, kind, key, view) entries
+_Reader = tuple[int, mmap.mmap, int, list[tuple[str, str, LabelKey, memoryview]]]
+
+# Label sets per metric beyond this share one series whose label values are OVERFLOW_VALUE
+MAX_SERIES = 100
+OVERFLOW_VALUE = "_other"
+OVERFLOW_METRIC = "metrics_series_overflow"
+
+_KINDS: dict[str, tuple[Any, Any]] = {
+    "histogram": (Histogram, _histogram_stats),
+    "counter": (Counter, _counter_stats),
+    "gauge": (Gauge, _gauge_stats),
+}
+
+
+class SharedStore:
+    """Metric series in memory-mapped files under ``directory``, shared by all workers.
+
+    Each process appends its series to its own segment files
+    (``metrics-<pid>-<n>.mmap``) and is their only writer, so recording
+    needs no cross-process locking. A segment is a sequence of entries, each
+    a JSON key (name, kind, labels) followed by the series buffer; the
+    segment header holds the number of bytes in use, written after an entry
+    is complete. Readers map every segment in the directory and sum the
+    series with the same key. Gauges of exited workers are skipped; their
+    counters and histograms still count, so totals survive worker restarts.
+    Empty the directory before starting the server.
+    """
+
+    SEGMENT_SIZE = 8 << 20
+    MAGIC = b"HUPMET01"
+    _HEADER = 16
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.pid = os.getpid()
+        self._lock = threading.Lock()
+        self._segment: Optional[mmap.mmap] = None
+        self._used = 0
+        self._segments = 0
+        # path -> (inode, mmap, parsed offset, entries)
+        self._readers: dict[str, _Reader] = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def _new_segment(self) -> None:
+        path = os.path.join(self.directory, f"metrics-{self.pid}-{self._segments}.mmap")
+        tmp = f"{path}.tmp"
+        # Full size up front (sparse): a segment never shrinks under a reader's mapping
+        with open(tmp, "wb") as f:
+            f.write(self.MAGIC)
+            f.truncate(self.SEGMENT_SIZE)
+        with open(tmp, "r+b") as f:
+            self._segment = mmap.mmap(f.fileno(), self.SEGMENT_SIZE)
+        # Replaces a file left by an earlier process with the same pid
+        os.replace(tmp, path)
+        self._segments += 1
+        self._used = self._HEADER
+
+    def allocate(self, name: str, kind: str, key: LabelKey, size: int) -> memoryview:
+        """A zeroed, shared buffer of ``size`` bytes for one series."""
+        raw = json.dumps([name, kind, key]).encode()
+        padded = -(-len(raw) // 8) * 8
+        needed = 8 + padded + size
+        if needed > self.SEGMENT_SIZE - self._HEADER:
+            raise ValueError(f"metric series {name!r} is too large for a shared segment")
+        with self._lock:
+            if self._segment is None or self._used + needed > self.SEGMENT_SIZE:
+                self._new_segment()
+            segment, offset = self._segment, self._used
+            assert segment is not None
+            struct.pack_into("<II", segment, offset, needed, len(raw))
+            segment[offset + 8 : offset + 8 + len(raw)] = raw
+            self._used += needed
+            struct.pack_into("<Q", segment, 8, self._used)
+            return memoryview(segment)[offset + 8 + padded : offset + needed]
+
+    def _read(self, path: str) -> list[tuple[str, str, LabelKey, memoryview]]:
+        inode = os.stat(path).st_ino
+        cached = self._readers.get(path)
+        if cached is None or cached[0] != inode:
+            with open(path, "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            if mapped[:8] != self.MAGIC:
+                return []
+            cached = (inode, mapped, self._HEADER, [])
+        inode, mapped, offset, entries = cached
+        (used,) = struct.unpack_from("<Q", mapped, 8)
+        view = memoryview(mapped)
+        while offset < used:
+            length, key_length = struct.unpack_from("<II", mapped, offset)
+            name, kind, key = json.loads(bytes(mapped[offset + 8 : offset + 8 + key_length]))
+            start = offset + 8 + -(-key_length // 8) * 8
+            entries.append(
+                (name, kind, tuple(tuple(item) for item in key), view[start : offset + length])
+            )
+            offset += length
+        self._readers[path] = (inode, mapped, offset, entries)
+        return entries
+
+    def collect(self) -> dict[str, tuple[str, dict[LabelKey, list[Any]]]]:
+        """Every worker's series, grouped by metric name and label set."""
+        collected: dict[str, tuple[str, dict[LabelKey, list[Any]]]] = {}
+        paths = sorted(glob.glob(os.path.join(self.directory, "metrics-*-*.mmap")))
+        for path in set(self._readers) - set(paths):
+            del self._readers[path]
+        for path in paths:
+            pid = int(os.path.basename(path).split("-")[1])
+            try:
+                entries = self._read(path)
+            except FileNotFoundError:
+                continue
+            alive = _pid_alive(pid)
+            for name, kind, key, buffer in entries:
+                if kind == "gauge" and not alive:
+                    continue
+                _, series = collected.setdefault(name, (kind, {}))
+                series.setdefault(key, []).append(_KINDS[kind][0](buffer))
+        return collected
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Family:
+    """All series of one metric name, one per label set (at most ``MAX_SERIES``)."""
+
+    def __init__(self, name: str, kind: str, store: Optional[SharedStore] = None):
+        self.name = name
+        self.kind = kind
+        self.series: dict[LabelKey, Any] = {}
+        self._factory, self._stats = _KINDS[kind]
+        self._store = store
+        self._lock = threading.Lock()
+
+    def labels(self, labels: dict[str, Any]) -> Any:
+        key: LabelKey = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        child = self.series.get(key)
+        if child is not None:
+            return child
+        overflowed = False
+        with self._lock:
+            if key not in self.series and len(self.series) >= MAX_SERIES:
+                overflowed = True
+                key = tuple((k, OVERFLOW_VALUE) for k, _ in key)
+            if key not in self.series:
+                buffer = (
+                    None
+                    if self._store is None
+                    else self._store.allocate(self.name, self.kind, key, self._factory.SIZE)
+                )
+                self.series[key] = self._factory(buffer)
+            child = self.series[key]
+        if overflowed and self.name != OVERFLOW_METRIC:
+            _family(OVERFLOW_METRIC, "counter").labels({"metric": self.name}).inc()
+        return child
+
+
+_families: dict[str, Family] = {}
+_registry_lock = threading.Lock()
+_store: Optional[SharedStore] = None
+_store_checked = False
+
+
+def use_shared_store(directory: Optional[str]) -> None:
+    """Keep metrics in ``directory`` (shared by all workers), or in process memory for None.
+
+    Drops the metrics recorded so far in this process. Called on first use
+    with ``METRICS_SHARED_DIR``.
+    """
+    global _store, _store_checked
+    with _registry_lock:
+        _families.clear()
+        _store = SharedStore(directory) if directory else None
+        _store_checked = True
+
+
+def _get_store() -> Optional[SharedStore]:
+    if not _store_checked:
+        from ..config.settings import get_settings
+
+        use_shared_store(get_settings().metrics_shared_dir or None)
+    return _store
+
+
+def _reset_after_fork() -> None:
+    # A forked worker must not write into its parent's segments
+    global _store_checked
+    _families.clear()
+    _store_checked = False
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _family(name: str, kind: str) -> Family:
+    family = _families.get(name)
+    if family is None:
+        store = _get_store()
+        with _registry_lock:
+            family = _families.setdefault(name, Family(name, kind, store))
+    if family.kind != kind:
+        raise ValueError(f"metric {name!r} is a {family.kind}, not a {kind}")
+    return family
+
+
+def _collect() -> dict[str, tuple[str, dict[LabelKey, list[Any]]]]:
+    """Series of every metric: this process's, or all workers' with a shared store."""
+    store = _get_store()
+    if store is not None:
+        return store.collect()
+    return {
+        family.name: (family.kind, {key: [child] for key, child in list(family.series.items())})
+        for family in list(_families.values())
+    }
 
 
 def record_timing(metric_name: str, duration_ms: float, **labels: Any) -> None:
@@ -21,12 +540,10 @@ def record_timing(metric_name: str, duration_ms: float, **labels: Any) -> None:
     duration_ms: float
         Duration in milliseconds
     labels: dict
-        Additional labels for context
+        Series labels (keep their values to a small fixed set)
     """
-    if metric_name not in _metrics:
-        _metrics[metric_name] = []
-    _metrics[metric_name].append(duration_ms)
-    
+    observe_timing(metric_name, duration_ms, **labels)
+
     logger.info(
         "metric_timing",
         metric=metric_name,
@@ -45,12 +562,10 @@ def record_counter(metric_name: str, value: float = 1.0, **labels: Any) -> None:
     value: float
         Counter increment (default: 1.0)
     labels: dict
-        Additional labels for context
+        Series labels (keep their values to a small fixed set)
     """
-    if metric_name not in _metrics:
-        _metrics[metric_name] = []
-    _metrics[metric_name].append(value)
-    
+    inc_counter(metric_name, value, **labels)
+
     logger.info(
         "metric_counter",
         metric=metric_name,
@@ -59,29 +574,118 @@ def record_counter(metric_name: str, value: float = 1.0, **labels: Any) -> None:
     )
 
 
-def get_metric_stats(metric_name: str) -> Optional[dict[str, float]]:
+def observe_timing(metric_name: str, duration_ms: float, **labels: Any) -> None:
+    """Record a timing without logging it (for events too frequent to log, like SQL statements)."""
+    _family(metric_name, "histogram").labels(labels).observe(duration_ms)
+
+
+def inc_counter(metric_name: str, value: float = 1.0, **labels: Any) -> None:
+    """Increment a counter without logging it (for metrics about the log pipeline itself)."""
+    _family(metric_name, "counter").labels(labels).inc(value)
+
+
+def set_gauge(metric_name: str, value: float, **labels: Any) -> None:
+    """Set a gauge metric to ``value`` (not logged: gauges are sampled, not events)."""
+    _family(metric_name, "gauge").labels(labels).set(value)
+
+
+def get_metric_stats(metric_name: str) -> Optional[dict[str, Any]]:
     """Get statistics for a metric.
-    
-    Returns mean, min, max, count, or None if metric doesn't exist.
+
+    Timings report count, mean, min, max and p50/p90/p99/p999; counters
+    report their total and the count, mean, min and max of the increments;
+    gauges report their value. Timings and counters include the same
+    figures for the last minute and five minutes under ``windows``. Figures
+    cover all label sets; labelled metrics list each one under ``series``.
+    Returns None if the metric doesn't exist.
     """
-    if metric_name not in _metrics or not _metrics[metric_name]:
-        return None
-    
-    values = _metrics[metric_name]
-    return {
-        "count": len(values),
-        "mean": sum(values) / len(values),
-        "min": min(values),
-        "max": max(values),
-    }
+    collected = _collect().get(metric_name)
+    return _stats(*collected) if collected is not None else None
 
 
-def get_all_metrics() -> dict[str, dict[str, float]]:
+def _stats(kind: str, series: dict[LabelKey, list[Any]]) -> Optional[dict[str, Any]]:
+    merge = _KINDS[kind][1]
+    stats = merge([child for children in series.values() for child in children])
+    if stats is not None and any(series):
+        stats["series"] = [
+            {"labels": dict(key), **(merge(children) or {})} for key, children in series.items()
+        ]
+    return stats
+
+
+def get_all_metrics() -> dict[str, dict[str, Any]]:
     """Get statistics for all metrics."""
-    return {
-        name: get_metric_stats(name) or {}
-        for name in _metrics.keys()
-    }
+    return {name: _stats(*collected) or {} for name, collected in _collect().items()}
+
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+PROMETHEUS_PREFIX = "huproof_"
+
+# Exposed histogram buckets (seconds); each fine bucket counts toward the first bound
+# above its upper edge
+PROMETHEUS_BUCKETS_S = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+    0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+_LE_INDEX = [
+    bisect.bisect_left(PROMETHEUS_BUCKETS_S, _BUCKET_MIN_MS * _BUCKET_GROWTH**i / 1000.0)
+    for i in range(_BUCKETS)
+]
+_NAME_RE = re.compile(r"[^a-zA-Z0-9_:]")
+
+
+def _prom_name(name: str, kind: str) -> str:
+    name = PROMETHEUS_PREFIX + _NAME_RE.sub("_", name)
+    if kind == "histogram":
+        return name + "_seconds"
+    if kind == "counter" and not name.endswith("_total"):
+        return name + "_total"
+    return name
+
+
+def _prom_escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _prom_labels(key: LabelKey) -> str:
+    if not key:
+        return ""
+    return "{" + ",".join(f'{_NAME_RE.sub("_", k)}="{_prom_escape(v)}"' for k, v in key) + "}"
+
+
+def _prom_histogram(name: str, key: LabelKey, hists: list[Histogram]) -> list[str]:
+    coarse = [0] * (len(PROMETHEUS_BUCKETS_S) + 1)
+    total, count = 0.0, 0
+    for hist in hists:
+        with hist._lock:
+            counts, total, count = hist._counts.tolist(), total + hist.sum, count + hist.count
+        for index, n in enumerate(counts):
+            if n:
+                coarse[_LE_INDEX[index]] += int(n)
+    lines = []
+    cumulative = 0
+    for bound, n in zip([*PROMETHEUS_BUCKETS_S, "+Inf"], coarse):
+        cumulative += n
+        lines.append(f"{name}_bucket{_prom_labels((*key, ('le', str(bound))))} {cumulative}")
+    lines.append(f"{name}_sum{_prom_labels(key)} {total / 1000.0}")
+    lines.append(f"{name}_count{_prom_labels(key)} {count}")
+    return lines
+
+
+def render_prometheus() -> str:
+    """All metrics in the Prometheus text exposition format (timings in seconds)."""
+    lines: list[str] = []
+    for metric, (kind, series) in _collect().items():
+        name = _prom_name(metric, kind)
+        lines.append(f"# TYPE {name} {kind}")
+        for key, children in series.items():
+            if kind == "histogram":
+                lines += _prom_histogram(name, key, children)
+            elif kind == "counter":
+                lines.append(f"{name}{_prom_labels(key)} {sum(c.total for c in children)}")
+            else:
+                lines.append(f"{name}{_prom_labels(key)} {sum(g.value for g in children)}")
+    return "\n".join(lines) + "\n"
 
 
 class TimingContext:
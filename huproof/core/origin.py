@@ -4,6 +4,7 @@ from fastapi import Request, HTTPException, status
 
 from .crypto import sha256_hex
 from .logging import get_logger
+from .tracing import span
 from ..config.settings import get_settings
 
 logger = get_logger()
@@ -13,7 +14,15 @@ def validate_origin(request: Request) -> None:
     """Validate that the request Origin header matches expected origin.
     
     Raises HTTPException if origin doesn't match or is missing (for protected endpoints).
+    A no-op when :class:`~huproof.core.guard.GuardMiddleware` already checked the request.
     """
+    if getattr(request.state, "origin_checked", False):
+        return
+    with span("origin"):
+        _validate_origin(request)
+
+
+def _validate_origin(request: Request) -> None:
     settings = get_settings()
     expected_origin = settings.origin
     
@@ -1,44 +1,287 @@
-"""Rate limiting utilities for API endpoints."""
+"""Rate limiting for API endpoints: a bounded, sharded GCRA limiter.
 
-from functools import wraps
-from typing import Callable
+GCRA (the generic cell rate algorithm) keeps a single number per key, the
+theoretical arrival time (TAT) of the next request. A limit of ``n`` per
+``period`` admits one request every ``period / n`` seconds on average,
+with bursts of up to ``n``. A check and its update are O(1).
 
-from fastapi import Request, HTTPException, status
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address, get_ipaddr
-from slowapi.errors import RateLimitExceeded
+Keys are spread over ``RATE_LIMIT_SHARDS`` shards, each with its own lock
+and LRU dict. A shard evicts entries whose TAT has passed (they are the
+same as a fresh key) and, above its share of ``RATE_LIMIT_MAX_KEYS``, the
+least recently used entry. A flood of spoofed client addresses can then
+only reset the oldest keys instead of exhausting memory. Decisions are
+counted in ``rate_limit_decisions`` (labels ``limit`` and ``decision``) and
+capacity evictions in ``rate_limit_evictions``.
 
+With ``RATE_LIMIT_STORAGE_URL`` set, :class:`SharedLimiter` keeps the
+state in a Redis-protocol store (:mod:`.limitstore`) shared by all workers
+and nodes. To save a network round trip per request it leases a few tokens
+at a time for fast limits, and remembers a denial until its retry time. While the store is
+unreachable, each process enforces the limits on its own.
+"""
+
+import math
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from time import monotonic
+from typing import Callable, Hashable, Optional
+
+from fastapi import status
+from fastapi.responses import JSONResponse
+
+from ..config.settings import get_settings
+from .crypto import keyed_hash
+from .limitstore import MemoryStore, RedisStore
 from .logging import get_logger
+from .metrics import inc_counter
 
 logger = get_logger()
 
-# Create limiter instance
-limiter = Limiter(key_func=get_remote_address)
+_PERIODS = {"second": 1.0, "minute": 60.0, "hour": 3600.0, "day": 86400.0}
+
+
+@dataclass(frozen=True)
+class Rate:
+    """``count`` requests per ``period_s`` seconds, in bursts of up to ``count``."""
+
+    count: int
+    period_s: float
+
+    @property
+    def interval_s(self) -> float:
+        return self.period_s / self.count
+
+
+@lru_cache(maxsize=64)
+def parse_rate(value: str) -> Rate:
+    """Parse ``"5/minute"``, ``"10/2 seconds"`` or ``"100/hour"``."""
+    count, _, per = value.partition("/")
+    amount, _, unit = per.strip().partition(" ")
+    if not unit:
+        amount, unit = "1", amount
+    period = _PERIODS.get(unit.strip().lower().rstrip("s"))
+    try:
+        rate = Rate(int(count), float(amount) * period)  # type: ignore[operator]
+    except (TypeError, ValueError):
+        raise ValueError(f"invalid rate {value!r}, expected e.g. '5/minute'") from None
+    if rate.count <= 0 or rate.period_s <= 0:
+        raise ValueError(f"invalid rate {value!r}, count and period must be positive")
+    return rate
+
+
+@dataclass(frozen=True)
+class Decision:
+    allowed: bool
+    # Seconds until a request would be allowed (0 when allowed)
+    retry_after_s: float
+    # Requests left in the current burst
+    remaining: int
+
+
+class _Shard:
+    __slots__ = ("lock", "tats")
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.tats: OrderedDict[Hashable, float] = OrderedDict()
+
+
+class GCRALimiter:
+    """GCRA state for up to ``max_keys`` keys, striped over ``shards`` locks."""
+
+    def __init__(
+        self, max_keys: int = 100_000, shards: int = 16, clock: Callable[[], float] = monotonic
+    ):
+        # Off admits every request without touching the state
+        self.enabled = True
+        self.clock = clock
+        self._shards = [_Shard() for _ in range(max(shards, 1))]
+        self._shard_keys = max(max_keys // len(self._shards), 1)
+
+    def __len__(self) -> int:
+        return sum(len(shard.tats) for shard in self._shards)
+
+    def hit(self, key: Hashable, rate: Rate) -> Decision:
+        """Count one request for ``key`` against ``rate``; a denied request is not counted."""
+        interval = rate.interval_s
+        burst_s = interval * rate.count
+        now = self.clock()
+        shard = self._shards[hash(key) % len(self._shards)]
+        evicted = 0
+        with shard.lock:
+            tats = shard.tats
+            tat = max(tats.get(key, now), now)
+            new_tat = tat + interval
+            if new_tat - now > burst_s:
+                tats.move_to_end(key)
+                return Decision(False, new_tat - burst_s - now, 0)
+            tats[key] = new_tat
+            tats.move_to_end(key)
+            # Oldest first: drop expired entries, then whatever exceeds the bound
+            while len(tats) > 1:
+                oldest, oldest_tat = next(iter(tats.items()))
+                if oldest_tat > now and len(tats) <= self._shard_keys:
+                    break
+                del tats[oldest]
+                evicted += oldest_tat > now
+        if evicted:
+            inc_counter("rate_limit_evictions", evicted)
+        return Decision(True, 0.0, int((burst_s - (new_tat - now)) / interval + 1e-9))
 
+    def reset(self) -> None:
+        for shard in self._shards:
+            with shard.lock:
+                shard.tats.clear()
 
-def get_client_ip(request: Request) -> str:
-    """Extract client IP from request for rate limiting."""
-    # Prioritize X-Forwarded-For if behind a proxy, otherwise use host
-    if "X-Forwarded-For" in request.headers:
-        return request.headers["X-Forwarded-For"].split(",")[0].strip()
-    # Use get_ipaddr for TestClient compatibility
-    return get_ipaddr(request)
 
+class SharedLimiter:
+    """GCRA state in a shared store, with token leases, cached denials and a local fallback.
 
-# Rate limit decorators
-def rate_limit_enroll_start() -> Callable:
-    """Rate limit for enrollment start endpoint (5 per minute per IP)."""
-    return limiter.limit("5/minute", key_func=get_client_ip)
+    ``store`` is a :class:`~.limitstore.RedisStore` or a stand-in with the
+    same ``acquire``. A key is leased up to ``lease_tokens`` tokens, but
+    never more than the limit refills in ``lease_s``, the longest a lease is
+    kept. For slow limits such as 5/minute that is one token, so every
+    request goes to the store. A process thus holds back at most one lease period's worth
+    of a key's tokens from other processes. When the store fails, ``fallback``
+    decides alone until ``retry_s`` has passed.
+    """
 
+    def __init__(
+        self,
+        store: "RedisStore | MemoryStore",
+        fallback: GCRALimiter,
+        lease_tokens: int = 10,
+        lease_s: float = 1.0,
+        retry_s: float = 5.0,
+        max_keys: int = 100_000,
+        clock: Callable[[], float] = monotonic,
+    ):
+        self.enabled = True
+        self.store = store
+        self.fallback = fallback
+        self.lease_tokens = lease_tokens
+        self.lease_s = lease_s
+        self.retry_s = retry_s
+        self.max_keys = max_keys
+        self.clock = clock
+        # key -> (tokens left, lease expiry); a denied key has no tokens until its retry time
+        self._leases: OrderedDict[str, tuple[int, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._store_down_until = 0.0
 
-def rate_limit_login_start() -> Callable:
-    """Rate limit for login start endpoint (10 per minute per IP)."""
-    return limiter.limit("10/minute", key_func=get_client_ip)
+    def __len__(self) -> int:
+        return len(self._leases) + len(self.fallback)
 
+    def _local(self, key: str, now: float) -> Optional[Decision]:
+        with self._lock:
+            lease = self._leases.get(key)
+            if lease is None:
+                return None
+            tokens, expires = lease
+            if now >= expires:
+                del self._leases[key]
+                return None
+            if tokens == 0:
+                return Decision(False, expires - now, 0)
+            if tokens == 1:
+                del self._leases[key]
+            else:
+                self._leases[key] = (tokens - 1, expires)
+            return Decision(True, 0.0, tokens - 1)
 
-def rate_limit_finish() -> Callable:
-    """Rate limit for finish endpoints (20 per minute per IP)."""
-    return limiter.limit("20/minute", key_func=get_client_ip)
+    def _keep(self, key: str, tokens: int, expires: float) -> None:
+        with self._lock:
+            self._leases[key] = (tokens, expires)
+            self._leases.move_to_end(key)
+            while len(self._leases) > self.max_keys:
+                self._leases.popitem(last=False)
+
+    def hit(self, key: Hashable, rate: Rate) -> Decision:
+        parts = key if isinstance(key, tuple) else (key,)
+        name = ":".join(part.hex() if isinstance(part, bytes) else str(part) for part in parts)
+        now = self.clock()
+        decision = self._local(name, now)
+        if decision is not None:
+            return decision
+        if now < self._store_down_until:
+            return self.fallback.hit(key, rate)
+        interval_ms = rate.interval_s * 1000.0
+        want = max(1, min(self.lease_tokens, int(self.lease_s / rate.interval_s)))
+        try:
+            granted, retry_ms, remaining = self.store.acquire(
+                name, interval_ms, interval_ms * rate.count, want
+            )
+        except Exception as exc:
+            self._store_down_until = now + self.retry_s
+            inc_counter("rate_limit_store_errors")
+            logger.warning("rate_limit_store_unavailable", error=repr(exc), retry_s=self.retry_s)
+            return self.fallback.hit(key, rate)
+        if not granted:
+            self._keep(name, 0, now + retry_ms / 1000.0)
+            return Decision(False, retry_ms / 1000.0, 0)
+        if granted > 1:
+            self._keep(name, granted - 1, now + self.lease_s)
+        return Decision(True, 0.0, remaining + granted - 1)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._leases.clear()
+        self._store_down_until = 0.0
+        self.fallback.reset()
+
+
+def _new_limiter() -> "GCRALimiter | SharedLimiter":
+    settings = get_settings()
+    local = GCRALimiter(settings.rate_limit_max_keys, settings.rate_limit_shards)
+    if not settings.rate_limit_storage_url:
+        return local
+    return SharedLimiter(
+        RedisStore(settings.rate_limit_storage_url, timeout_s=settings.rate_limit_store_timeout_s),
+        local,
+        lease_tokens=settings.rate_limit_lease_tokens,
+        lease_s=settings.rate_limit_lease_s,
+        max_keys=settings.rate_limit_max_keys,
+    )
+
+
+limiter = _new_limiter()
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, name: str, decision: Decision):
+        super().__init__(name)
+        self.name = name
+        self.decision = decision
+
+
+def client_ip(forwarded_for: Optional[str], peer: Optional[str]) -> str:
+    """Client IP for rate limiting: the first ``X-Forwarded-For`` address, else the peer address."""
+    if forwarded_for:
+        return forwarded_for.split(",")[0].strip()
+    return peer or "127.0.0.1"
+
+
+def account_key(user_id: str) -> bytes:
+    """16-byte keyed hash of a user id: fixed-size limiter keys that do not reveal the id."""
+    return keyed_hash(get_settings().app_secret, "ratelimit-account", user_id)
+
+
+def check_rate_limit(name: str, key: str | bytes, rate: Rate) -> Decision:
+    """Count a request for ``key`` against limit ``name``.
+
+    Raises :class:`RateLimitExceeded` when the limit is exceeded.
+    """
+    if not limiter.enabled:
+        return Decision(True, 0.0, rate.count)
+    decision = limiter.hit((name, key), rate)
+    inc_counter(
+        "rate_limit_decisions", limit=name, decision="allowed" if decision.allowed else "limited"
+    )
+    if not decision.allowed:
+        raise RateLimitExceeded(name, decision)
+    return decision
 
 
 def setup_rate_limit_handler(app) -> None:
@@ -46,11 +289,9 @@ def setup_rate_limit_handler(app) -> None:
     app.state.limiter = limiter
 
 
-def rate_limit_exceeded_handler(request: Request, exc: RateLimitExceeded):
-    """Custom rate limit exceeded handler."""
-    logger.warning("rate_limit_exceeded", ip=get_client_ip(request), path=request.url.path)
-    raise HTTPException(
+def rate_limited_response(exc: RateLimitExceeded) -> JSONResponse:
+    return JSONResponse(
+        {"detail": "Rate limit exceeded. Please try again later."},
         status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-        detail="Rate limit exceeded. Please try again later.",
+        headers={"Retry-After": str(max(math.ceil(exc.decision.retry_after_s), 1))},
     )
-
@@ -0,0 +1,96 @@
+"""Threadpool and event-loop instrumentation.
+
+Sync routes and dependencies run in anyio's default threadpool, so every
+call first waits for a token of its capacity limiter (``THREADPOOL_LIMIT``).
+:func:`instrument_threadpool` times that wait in the ``threadpool_wait_time``
+histogram, labelled by route (only on anyio 4, see
+:func:`instrument_threadpool`). :func:`run_probe` runs on the event loop and,
+every ``RUNTIME_PROBE_S``, records:
+
+- ``event_loop_lag``: how late a timer fired, i.e. how long the loop was
+  busy or blocked (histogram, and the latest value as a gauge);
+- ``threadpool_busy`` / ``threadpool_waiting`` / ``threadpool_limit``:
+  threads in use, calls queued for a thread, and the pool size (gauges);
+- the admission controller's signals (``admission_*`` gauges).
+"""
+
+import asyncio
+from importlib.metadata import PackageNotFoundError, version
+from time import perf_counter
+from typing import Any
+
+from anyio import to_thread
+
+from .admission import controller as admission
+from .logging import get_logger
+from .metrics import observe_timing, set_gauge
+from .tracing import current_trace
+
+logger = get_logger()
+
+# The anyio major version whose limiter classes the timed subclass was checked against
+_TIMED_ANYIO_MAJOR = "4"
+
+
+def _anyio_major() -> str:
+    try:
+        return version("anyio").split(".")[0]
+    except PackageNotFoundError:
+        return ""
+
+
+def _timed_limiter_class(base: type) -> type:
+    class TimedCapacityLimiter(base):  # type: ignore[misc, valid-type]
+        # Same layout as the backend class, so the default limiter can be switched to it in place
+        __slots__ = ()
+
+        async def acquire(self) -> None:
+            t0 = perf_counter()
+            await super().acquire()
+            trace = current_trace()
+            endpoint = trace.endpoint if trace else ""
+            observe_timing(
+                "threadpool_wait_time", (perf_counter() - t0) * 1000.0, endpoint=endpoint
+            )
+
+    return TimedCapacityLimiter
+
+
+def instrument_threadpool(limit: int) -> Any:
+    """Resize anyio's default thread limiter to ``limit`` and time its acquisitions.
+
+    Must run inside the event loop (the limiter is per loop), e.g. at startup.
+    Starlette runs sync routes on anyio's default limiter and anyio has no
+    hook for it, so its (private) class is switched to a subclass that only
+    adds the timing. That is done only on the anyio major version it was
+    checked against; on any other, or if the switch fails, the pool is
+    resized but ``threadpool_wait_time`` is not recorded.
+    """
+    limiter = to_thread.current_default_thread_limiter()
+    limiter.total_tokens = limit
+    if type(limiter).__name__ == "TimedCapacityLimiter":
+        return limiter
+    anyio_major = _anyio_major()
+    if anyio_major != _TIMED_ANYIO_MAJOR:
+        logger.warning("threadpool_wait_untimed", anyio_major=anyio_major)
+        return limiter
+    try:
+        limiter.__class__ = _timed_limiter_class(type(limiter))
+    except TypeError as e:
+        logger.warning("threadpool_wait_untimed", error=str(e))
+    return limiter
+
+
+async def run_probe(interval_s: float) -> None:
+    """Record loop lag and threadpool occupancy every ``interval_s`` until cancelled."""
+    limiter = to_thread.current_default_thread_limiter()
+    while True:
+        t0 = perf_counter()
+        await asyncio.sleep(interval_s)
+        lag_ms = max(perf_counter() - t0 - interval_s, 0.0) * 1000.0
+        observe_timing("event_loop_lag", lag_ms)
+        set_gauge("event_loop_lag_ms", lag_ms)
+        set_gauge("threadpool_busy", limiter.borrowed_tokens)
+        set_gauge("threadpool_waiting", limiter.statistics().tasks_waiting)
+        set_gauge("threadpool_limit", limiter.total_tokens)
+        admission.record_gauges()
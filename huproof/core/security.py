@@ -4,6 +4,8 @@ from typing import Any, Optional
 
 import jwt
 
+from .tracing import span
+
 
 def generate_jti() -> str:
     """Generate a unique JWT ID (JTI) for token tracking."""
@@ -50,7 +52,8 @@ def create_access_token(
         payload["exp"] = int((now + timedelta(seconds=expires_in_seconds)).timestamp())
     if claims:
         payload.update(claims)
-    token = jwt.encode(payload, secret, algorithm="HS256")
+    with span("jwt_sign"):
+        token = jwt.encode(payload, secret, algorithm="HS256")
     return token, jti_value
 
 
@@ -0,0 +1,91 @@
+"""Request-scoped database session dependencies.
+
+The scopes themselves live in :mod:`huproof.db.session`; these wrap them
+for FastAPI, labelling replica routing with the request path.
+"""
+
+from contextlib import AsyncExitStack, ExitStack
+from typing import AsyncIterator, Iterator, Optional
+
+from fastapi import Request
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from ..db.session import (
+    async_read_session_scope,
+    async_session_scope,
+    get_replicas,
+    get_shards,
+    read_session_scope,
+    session_scope,
+)
+
+
+def _shares_primary() -> bool:
+    """Reads go to the primary anyway: no replicas, or sharded (shards have none)."""
+    return get_replicas() is None or get_shards() is not None
+
+
+def get_read_session(request: Request) -> Iterator[Session]:
+    with read_session_scope(request.url.path) as s:
+        yield s
+
+
+async def get_async_read_session(request: Request) -> AsyncIterator[AsyncSession]:
+    async with async_read_session_scope(request.url.path) as s:
+        yield s
+
+
+class ReadWriteSessions:
+    """A read session, and a primary session opened on first use.
+
+    For handlers that mostly read but sometimes write. Without replicas both
+    are the same primary session, so the handler holds one pooled connection.
+    With replicas, ``read`` is routed like :func:`get_read_session`, and
+    :meth:`primary` opens a primary session only when it is called.
+    """
+
+    def __init__(self, stack: ExitStack, route: str):
+        self._stack = stack
+        self._primary: Optional[Session] = None
+        self.read = (
+            self.primary() if _shares_primary() else stack.enter_context(read_session_scope(route))
+        )
+
+    def primary(self) -> Session:
+        if self._primary is None:
+            self._primary = self._stack.enter_context(session_scope())
+        return self._primary
+
+
+class AsyncReadWriteSessions:
+    """Async counterpart of :class:`ReadWriteSessions`; build it with :meth:`open`."""
+
+    def __init__(self, stack: AsyncExitStack):
+        self._stack = stack
+        self._primary: Optional[AsyncSession] = None
+        self.read: AsyncSession
+
+    @classmethod
+    async def open(cls, stack: AsyncExitStack, route: str) -> "AsyncReadWriteSessions":
+        sessions = cls(stack)
+        if _shares_primary():
+            sessions.read = await sessions.primary()
+        else:
+            sessions.read = await stack.enter_async_context(async_read_session_scope(route))
+        return sessions
+
+    async def primary(self) -> AsyncSession:
+        if self._primary is None:
+            self._primary = await self._stack.enter_async_context(async_session_scope())
+        return self._primary
+
+
+def get_read_write_sessions(request: Request) -> Iterator[ReadWriteSessions]:
+    with ExitStack() as stack:
+        yield ReadWriteSessions(stack, request.url.path)
+
+
+async def get_async_read_write_sessions(request: Request) -> AsyncIterator[AsyncReadWriteSessions]:
+    async with AsyncExitStack() as stack:
+        yield await AsyncReadWriteSessions.open(stack, request.url.path)
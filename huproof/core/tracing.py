@@ -0,0 +1,282 @@
+"""Lightweight request tracing: stage spans, ``Server-Timing`` and sampled trace files.
+
+``with span("nonce_query"):`` times one stage of a request. Every span feeds
+the ``stage_time`` histogram, labelled with the stage and the route. Inside a
+request seen by :class:`TracingMiddleware`, the span is also added to that
+request's trace:
+
+- the ``Server-Timing`` response header lists the time per stage plus
+  ``total`` (``SERVER_TIMING``);
+- a ``TRACE_SAMPLE_RATE`` fraction of traces is appended to ``TRACE_FILE``
+  as OTLP JSON, one ``ExportTraceServiceRequest`` per line. This is the
+  layout the OpenTelemetry Collector's file receiver reads.
+
+The current trace is a context variable. The threadpool runs sync handlers
+and dependencies in a copy of the request's context, so their spans land in
+the same trace. Outside a request a span only records its histogram.
+"""
+
+import json
+import random
+import re
+import secrets
+import threading
+from collections import Counter
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from time import perf_counter_ns, time_ns
+from typing import Any, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from ..config.settings import get_settings
+from .logging import get_logger
+from .metrics import inc_counter, observe_timing
+
+logger = get_logger()
+
+TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+SCOPE_NAME = "huproof"
+
+
+@dataclass
+class Span:
+    name: str
+    span_id: str
+    parent_id: Optional[str]
+    start_ns: int
+    duration_ns: int = 0
+    error: bool = False
+    attributes: dict[str, Any] = field(default_factory=dict)
+
+
+class Trace:
+    """Spans recorded while serving one request."""
+
+    def __init__(self, scope: Scope, sampled: bool):
+        self.scope = scope
+        self.sampled = sampled
+        self.start_ns = time_ns()
+        self._t0 = perf_counter_ns()
+        self.spans: list[Span] = []
+        # SQL statements run for this request, by normalised text
+        self.queries: Counter[str] = Counter()
+        self.query_ns = 0
+        self.parent_id: Optional[str] = None
+        self.trace_id = secrets.token_hex(16)
+        for name, value in scope.get("headers", ()):
+            if name == b"traceparent":
+                match = TRACEPARENT.match(value.decode("latin-1"))
+                if match:
+                    self.trace_id, self.parent_id = match.groups()
+        self.root_id = secrets.token_hex(8)
+
+    @property
+    def endpoint(self) -> str:
+        """Route template once routing has run (bounded, unlike the raw path)."""
+        route = self.scope.get("route")
+        return getattr(route, "path", "")
+
+    def elapsed_ns(self) -> int:
+        return perf_counter_ns() - self._t0
+
+    def add_query(self, query: str, start_ns: int, duration_ns: int) -> None:
+        """Account one SQL statement (reported as the ``sql`` stage)."""
+        self.queries[query] += 1
+        self.query_ns += duration_ns
+        parent = _current_span.get() or self.root_id
+        self.spans.append(
+            Span(
+                "sql",
+                secrets.token_hex(8),
+                parent,
+                start_ns,
+                duration_ns,
+                attributes={"db.statement": query},
+            )
+        )
+
+    def report_queries(self) -> None:
+        """Per-request query count and time; warn past ``DB_QUERY_WARN_THRESHOLD`` (likely N+1)."""
+        count = sum(self.queries.values())
+        if not count:
+            return
+        endpoint = self.endpoint
+        inc_counter("db_request_queries", count, endpoint=endpoint)
+        observe_timing("db_request_time", self.query_ns / 1e6, endpoint=endpoint)
+        threshold = get_settings().db_query_warn_threshold
+        if threshold and count > threshold:
+            query, repeats = self.queries.most_common(1)[0]
+            inc_counter("db_query_warnings", endpoint=endpoint)
+            logger.warning(
+                "db_query_count_exceeded",
+                endpoint=endpoint,
+                queries=count,
+                threshold=threshold,
+                most_repeated=query,
+                repeats=repeats,
+            )
+
+    def server_timing(self) -> str:
+        """``Server-Timing`` value: time per stage name in milliseconds, then ``total``."""
+        stages: dict[str, int] = {}
+        for s in list(self.spans):
+            stages[s.name] = stages.get(s.name, 0) + s.duration_ns
+        stages["total"] = self.elapsed_ns()
+        return ", ".join(f"{name};dur={ns / 1e6:.3f}" for name, ns in stages.items())
+
+    def root_span(self, status_code: int) -> Span:
+        method = self.scope.get("method", "")
+        return Span(
+            name=f"{method} {self.endpoint or self.scope.get('path', '')}",
+            span_id=self.root_id,
+            parent_id=self.parent_id,
+            start_ns=self.start_ns,
+            duration_ns=self.elapsed_ns(),
+            error=status_code >= 500,
+            attributes={
+                "http.request.method": method,
+                "http.route": self.endpoint,
+                "http.response.status_code": status_code,
+            },
+        )
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("huproof_trace", default=None)
+_current_span: ContextVar[Optional[str]] = ContextVar("huproof_span", default=None)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+class span:
+    """Time a stage: ``with span("jwt_sign"):``. Extra keyword arguments become span attributes."""
+
+    __slots__ = ("name", "attributes", "_span", "_token", "_t0")
+
+    def __init__(self, name: str, **attributes: Any):
+        self.name = name
+        self.attributes = attributes
+        self._span: Optional[Span] = None
+
+    def __enter__(self) -> "span":
+        trace = _current_trace.get()
+        if trace is not None:
+            parent = _current_span.get() or trace.root_id
+            self._span = Span(
+                self.name, secrets.token_hex(8), parent, time_ns(), attributes=self.attributes
+            )
+            self._token = _current_span.set(self._span.span_id)
+        self._t0 = perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type: Any, exc: Any, tb: Any) -> bool:
+        elapsed = perf_counter_ns() - self._t0
+        trace = _current_trace.get()
+        if self._span is not None:
+            self._span.duration_ns = elapsed
+            self._span.error = exc_type is not None
+            try:
+                _current_span.reset(self._token)
+            except ValueError:
+                # Entered in another context (e.g. a threadpool call of a generator dependency)
+                pass
+            if trace is not None:
+                trace.spans.append(self._span)
+        observe_timing(
+            "stage_time", elapsed / 1e6, stage=self.name, endpoint=trace.endpoint if trace else ""
+        )
+        return False
+
+
+def _otlp_value(value: Any) -> dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_span(trace: Trace, s: Span, kind: int) -> dict[str, Any]:
+    out: dict[str, Any] = {
+        "traceId": trace.trace_id,
+        "spanId": s.span_id,
+        "name": s.name,
+        "kind": kind,
+        "startTimeUnixNano": str(s.start_ns),
+        "endTimeUnixNano": str(s.start_ns + s.duration_ns),
+        "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s.attributes.items()],
+        # STATUS_CODE_ERROR = 2, STATUS_CODE_UNSET = 0
+        "status": {"code": 2 if s.error else 0},
+    }
+    if s.parent_id:
+        out["parentSpanId"] = s.parent_id
+    return out
+
+
+def to_otlp(trace: Trace, status_code: int) -> dict[str, Any]:
+    """The trace as an OTLP/JSON ``ExportTraceServiceRequest``."""
+    settings = get_settings()
+    # SPAN_KIND_SERVER = 2, SPAN_KIND_INTERNAL = 1
+    spans = [_otlp_span(trace, trace.root_span(status_code), 2)]
+    spans += [_otlp_span(trace, s, 1) for s in trace.spans]
+    resource = [
+        {"key": "service.name", "value": {"stringValue": settings.app_name}},
+        {"key": "service.version", "value": {"stringValue": settings.app_version}},
+    ]
+    return {
+        "resourceSpans": [
+            {
+                "resource": {"attributes": resource},
+                "scopeSpans": [{"scope": {"name": SCOPE_NAME}, "spans": spans}],
+            }
+        ]
+    }
+
+
+_file_lock = threading.Lock()
+
+
+def write_trace(path: str, line: str) -> None:
+    with _file_lock, open(path, "a", encoding="utf-8") as f:
+        f.write(line + "\n")
+
+
+class TracingMiddleware:
+    """Open a trace per HTTP request; add ``Server-Timing`` and export sampled traces."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        settings = get_settings()
+        sampled = bool(settings.trace_file) and random.random() < settings.trace_sample_rate
+        trace = Trace(scope, sampled)
+        token = _current_trace.set(trace)
+        status_code = 500
+
+        async def send_with_timing(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if settings.server_timing:
+                    MutableHeaders(scope=message).append("Server-Timing", trace.server_timing())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_trace.reset(token)
+            observe_timing("request_time", trace.elapsed_ns() / 1e6, endpoint=trace.endpoint)
+            trace.report_queries()
+            if trace.sampled:
+                line = json.dumps(to_otlp(trace, status_code), separators=(",", ":"))
+                await run_in_threadpool(write_trace, settings.trace_file, line)
@@ -0,0 +1,351 @@
+"""Active keystroke commitment lookups with an in-process cache.
+
+A login reads the active commitment for ``(user_id, origin)`` twice, once in
+each phase, and commitments almost never change. Lookups go through a bounded
+LRU cache with a TTL. Writes invalidate it once their transaction commits:
+:func:`store_commitment` writes the new commitment through, and
+:func:`deactivate_commitments` drops the affected entries. Both also drop the
+pair's negative entry.
+
+Misses on the primary are cached too, in a separate LRU of keyed hashes
+(``COMMITMENT_NEGATIVE_CACHE_SIZE``, same TTL). A flood of ``login_start``
+requests for made-up user ids then costs no database reads and cannot push
+real users out of the cache. Known and unknown ids behave the same: the first lookup reads the
+database, later ones are answered from memory. Response times therefore do not reveal
+whether an account exists.
+
+Other workers learn about changes through PostgreSQL ``LISTEN/NOTIFY``. The
+``NOTIFY`` is sent inside the writing transaction, so it is delivered only if
+that transaction commits. Without PostgreSQL, the TTL bounds how stale another
+worker's cache can get.
+"""
+
+import select
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from time import monotonic
+from typing import Optional
+
+from sqlalchemy import Engine, text, update
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from ..config.settings import get_settings
+from ..core.crypto import keyed_hash
+from ..core.logging import get_logger
+from ..core.metrics import record_counter
+from ..core.tracing import span
+from .models import KeystrokeCommitment
+from .queries import ACTIVE_COMMITMENT
+from .session import on_commit, served_by_replica, shard_bind_arguments
+
+logger = get_logger()
+
+NOTIFY_CHANNEL = "huproof_commitment_invalidate"
+
+
+@dataclass(frozen=True)
+class CachedCommitment:
+    """Detached snapshot of an active commitment; safe to share across sessions."""
+
+    id: str
+    user_id: str
+    origin: str
+    commitment_c: str
+    tau: int
+
+    @classmethod
+    def from_model(cls, commit: KeystrokeCommitment) -> "CachedCommitment":
+        return cls(
+            id=commit.id,
+            user_id=commit.user_id,
+            origin=commit.origin,
+            commitment_c=commit.commitment_c,
+            tau=commit.tau,
+        )
+
+
+def _missing_key(user_id: str, origin: str) -> bytes:
+    return keyed_hash(
+        get_settings().app_secret, "commitment-negative-cache", f"{user_id}\n{origin}"
+    )
+
+
+class CommitmentCache:
+    """Thread-safe LRU of active commitments keyed by ``(user_id, origin)``.
+
+    Pairs without an active commitment are kept apart, as 16-byte keyed
+    hashes in an LRU bounded by ``negative_maxsize``.
+    """
+
+    def __init__(self, maxsize: int, ttl_s: float, negative_maxsize: int = 0):
+        self.maxsize = maxsize
+        self.ttl_s = ttl_s
+        self.negative_maxsize = negative_maxsize
+        self._entries: OrderedDict[tuple[str, str], tuple[float, CachedCommitment]] = OrderedDict()
+        self._missing: OrderedDict[bytes, float] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str, origin: str) -> Optional[CachedCommitment]:
+        key = (user_id, origin)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, value: CachedCommitment) -> None:
+        if self.negative_maxsize > 0:
+            missing = _missing_key(value.user_id, value.origin)
+            with self._lock:
+                self._missing.pop(missing, None)
+        if self.maxsize <= 0:
+            return
+        key = (value.user_id, value.origin)
+        with self._lock:
+            self._entries[key] = (monotonic() + self.ttl_s, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def is_missing(self, user_id: str, origin: str) -> bool:
+        """Whether ``(user_id, origin)`` was recently found to have no active commitment."""
+        if self.negative_maxsize <= 0:
+            return False
+        key = _missing_key(user_id, origin)
+        with self._lock:
+            expires_at = self._missing.get(key)
+            if expires_at is None:
+                return False
+            if expires_at < monotonic():
+                del self._missing[key]
+                return False
+            self._missing.move_to_end(key)
+            return True
+
+    def put_missing(self, user_id: str, origin: str) -> None:
+        if self.negative_maxsize <= 0:
+            return
+        key = _missing_key(user_id, origin)
+        with self._lock:
+            self._missing[key] = monotonic() + self.ttl_s
+            self._missing.move_to_end(key)
+            while len(self._missing) > self.negative_maxsize:
+                self._missing.popitem(last=False)
+
+    def discard(self, user_id: str, origin: Optional[str] = None) -> None:
+        """Drop one entry, or every origin cached for ``user_id`` when ``origin`` is None.
+
+        The negative entry goes too. Those are keyed hashes that cannot be
+        matched by user, so without an origin the whole negative cache is cleared.
+        """
+        missing = _missing_key(user_id, origin) if origin is not None else None
+        with self._lock:
+            if origin is not None:
+                self._entries.pop((user_id, origin), None)
+                self._missing.pop(missing, None)
+                return
+            for key in [k for k in self._entries if k[0] == user_id]:
+                del self._entries[key]
+            self._missing.clear()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._missing.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+_cache: Optional[CommitmentCache] = None
+
+
+def get_commitment_cache() -> CommitmentCache:
+    global _cache
+    if _cache is None:
+        settings = get_settings()
+        _cache = CommitmentCache(
+            settings.commitment_cache_size,
+            settings.commitment_cache_ttl_s,
+            settings.commitment_negative_cache_size,
+        )
+    return _cache
+
+
+def _lookup_cached(user_id: str, origin: str) -> tuple[bool, Optional[CachedCommitment]]:
+    """``(found, commitment)``; found with ``None`` means known to be missing."""
+    cache = get_commitment_cache()
+    cached = cache.get(user_id, origin)
+    if cached is not None:
+        record_counter("commitment_cache_lookups", result="hit")
+        return True, cached
+    if cache.is_missing(user_id, origin):
+        record_counter("commitment_cache_lookups", result="negative_hit")
+        return True, None
+    record_counter("commitment_cache_lookups", result="miss")
+    return False, None
+
+
+def _loaded(
+    session: Session | AsyncSession,
+    user_id: str,
+    origin: str,
+    commit: Optional[KeystrokeCommitment],
+) -> Optional[CachedCommitment]:
+    if commit is None:
+        # A replica may just lag behind; only the primary's answer is cached
+        if not served_by_replica(session):
+            get_commitment_cache().put_missing(user_id, origin)
+        return None
+    value = CachedCommitment.from_model(commit)
+    get_commitment_cache().put(value)
+    return value
+
+
+def get_active_commitment(
+    session: Session, user_id: str, origin: str
+) -> Optional[CachedCommitment]:
+    """Return the active commitment for ``(user_id, origin)``, from cache when possible."""
+    found, cached = _lookup_cached(user_id, origin)
+    if found:
+        return cached
+    with span("commitment_query"):
+        commit = session.exec(
+            ACTIVE_COMMITMENT, params={"user_id": user_id, "origin": origin}
+        ).first()
+    return _loaded(session, user_id, origin, commit)
+
+
+async def get_active_commitment_async(
+    session: AsyncSession, user_id: str, origin: str
+) -> Optional[CachedCommitment]:
+    """Async variant of :func:`get_active_commitment`."""
+    found, cached = _lookup_cached(user_id, origin)
+    if found:
+        return cached
+    with span("commitment_query"):
+        result = await session.exec(
+            ACTIVE_COMMITMENT, params={"user_id": user_id, "origin": origin}
+        )
+    return _loaded(session, user_id, origin, result.first())
+
+
+def _notify(session: Session, user_id: str, origin: Optional[str]) -> None:
+    """Queue a cross-worker invalidation; PostgreSQL delivers it only on commit."""
+    bind_arguments = shard_bind_arguments(user_id)
+    if (
+        session.get_bind(**bind_arguments).dialect.name != "postgresql"
+        or not get_settings().commitment_cache_notify
+    ):
+        return
+    session.execute(
+        text("SELECT pg_notify(:channel, :payload)"),
+        {"channel": NOTIFY_CHANNEL, "payload": f"{user_id}\n{origin or ''}"},
+        bind_arguments=bind_arguments,
+    )
+
+
+def _write_through(session: Session, commit: KeystrokeCommitment) -> None:
+    value = CachedCommitment.from_model(commit)
+    on_commit(session, lambda: get_commitment_cache().put(value))
+
+
+def store_commitment(session: Session, commit: KeystrokeCommitment) -> None:
+    """Add a new active commitment and write it through to the cache on commit.
+
+    Other workers are notified too, so they drop a cached miss for the pair.
+    """
+    session.add(commit)
+    _write_through(session, commit)
+    _notify(session, commit.user_id, commit.origin)
+
+
+async def store_commitment_async(session: AsyncSession, commit: KeystrokeCommitment) -> None:
+    """Async variant of :func:`store_commitment`."""
+    session.add(commit)
+    _write_through(session.sync_session, commit)
+    await session.run_sync(_notify, commit.user_id, commit.origin)
+
+
+def deactivate_commitments(session: Session, user_id: str, origin: Optional[str] = None) -> None:
+    """Deactivate a user's commitments (for one origin, or all) and invalidate caches."""
+    stmt = update(KeystrokeCommitment).where(
+        KeystrokeCommitment.user_id == user_id,
+        KeystrokeCommitment.is_active == True,  # noqa: E712
+    )
+    if origin is not None:
+        stmt = stmt.where(KeystrokeCommitment.origin == origin)
+    session.exec(stmt.values(is_active=False), bind_arguments=shard_bind_arguments(user_id))
+    # Drop now so this worker stops serving it, and again on commit in case a
+    # concurrent reader re-cached the old row before the update became visible.
+    get_commitment_cache().discard(user_id, origin)
+    on_commit(session, lambda: get_commitment_cache().discard(user_id, origin))
+    _notify(session, user_id, origin)
+
+
+class InvalidationListener:
+    """Background thread applying ``NOTIFY`` invalidations from other workers.
+
+    Uses the psycopg2 notification API. After every (re)connect it clears the
+    local cache, because notifications sent while it was disconnected are lost.
+    """
+
+    def __init__(self, engine: Engine, poll_interval_s: float = 1.0):
+        self.engine = engine
+        self.poll_interval_s = poll_interval_s
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="commitment-invalidation", daemon=True
+        )
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join(timeout=self.poll_interval_s * 2)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            raw = None
+            try:
+                raw = self.engine.raw_connection()
+                conn = raw.driver_connection
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {NOTIFY_CHANNEL}")
+                get_commitment_cache().clear()
+                logger.info("commitment_invalidation_listening")
+                while not self._stop.is_set():
+                    if select.select([conn], [], [], self.poll_interval_s) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        user_id, _, origin = conn.notifies.pop(0).payload.partition("\n")
+                        get_commitment_cache().discard(user_id, origin or None)
+            except Exception as e:
+                logger.warning("commitment_invalidation_listener_error", error=str(e))
+                self._stop.wait(5.0)
+            finally:
+                if raw is not None:
+                    # Never hand a LISTENing autocommit connection back to the pool
+                    raw.invalidate()
+
+
+def start_invalidation_listener(engine: Engine) -> Optional[InvalidationListener]:
+    """Start the cross-worker listener when running on PostgreSQL with psycopg2."""
+    settings = get_settings()
+    if engine.dialect.name != "postgresql" or engine.dialect.driver != "psycopg2":
+        return None
+    if not settings.commitment_cache_notify or settings.commitment_cache_size <= 0:
+        return None
+    listener = InvalidationListener(engine)
+    listener.start()
+    return listener
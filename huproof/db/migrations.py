@@ -0,0 +1,147 @@
+"""Versioned schema migrations.
+
+``create_all`` only creates missing tables, so index and column changes never
+reach an existing database. Each :class:`Migration` is a list of idempotent
+SQL statements per dialect; :func:`run_migrations` applies the ones newer than
+the version recorded in ``schema_version``.
+
+On PostgreSQL statements run in autocommit mode so indexes can be built with
+``CREATE INDEX CONCURRENTLY`` while the service keeps serving, and an advisory
+lock stops several workers from migrating at once. A concurrent build that is
+interrupted leaves an invalid index behind, which ``IF NOT EXISTS`` would then
+keep; such an index is dropped before the statement that creates it is re-run.
+"""
+
+import re
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from sqlalchemy import Connection, Engine, text
+
+from ..core.logging import get_logger
+
+logger = get_logger()
+
+# Arbitrary key for pg_advisory_lock, shared by every worker
+_ADVISORY_LOCK_KEY = 0x687570726F6F66
+
+_CONCURRENT_INDEX = re.compile(
+    r"CREATE (?:UNIQUE )?INDEX CONCURRENTLY IF NOT EXISTS (\w+)", re.IGNORECASE
+)
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    description: str
+    # Dialect name -> statements; "*" applies to any dialect without its own entry
+    statements: dict[str, list[str]] = field(default_factory=dict)
+
+    def statements_for(self, dialect: str) -> list[str]:
+        return self.statements.get(dialect, self.statements.get("*", []))
+
+
+MIGRATIONS: list[Migration] = [
+    Migration(
+        version=1,
+        description="composite lookup indexes; drop unused single-column indexes",
+        statements={
+            "postgresql": [
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_keystrokecommitment_active_lookup "
+                "ON keystrokecommitment (user_id, origin) INCLUDE (commitment_c, tau) "
+                "WHERE is_active",
+                "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS ux_noncerecord_value_purpose "
+                "ON noncerecord (value, purpose)",
+                "DROP INDEX CONCURRENTLY IF EXISTS ix_keystrokecommitment_commitment_c",
+                "DROP INDEX CONCURRENTLY IF EXISTS ix_keystrokecommitment_origin",
+                "DROP INDEX CONCURRENTLY IF EXISTS ix_keystrokecommitment_user_id",
+                "DROP INDEX CONCURRENTLY IF EXISTS ix_keystrokecommitment_vkey_id",
+                "DROP INDEX CONCURRENTLY IF EXISTS ix_keystrokecommitment_id",
+                "DROP INDEX CONCURRENTLY IF EXISTS ix_user_id",
+                "DROP INDEX CONCURRENTLY IF EXISTS ix_noncerecord_value",
+                "DROP INDEX CONCURRENTLY IF EXISTS ix_noncerecord_origin_hash",
+                "DROP INDEX CONCURRENTLY IF EXISTS ix_noncerecord_consumed_at",
+            ],
+            "*": [
+                "CREATE INDEX IF NOT EXISTS ix_keystrokecommitment_active_lookup "
+                "ON keystrokecommitment (user_id, origin) WHERE is_active = 1",
+                "CREATE UNIQUE INDEX IF NOT EXISTS ux_noncerecord_value_purpose "
+                "ON noncerecord (value, purpose)",
+                "DROP INDEX IF EXISTS ix_keystrokecommitment_commitment_c",
+                "DROP INDEX IF EXISTS ix_keystrokecommitment_origin",
+                "DROP INDEX IF EXISTS ix_keystrokecommitment_user_id",
+                "DROP INDEX IF EXISTS ix_keystrokecommitment_vkey_id",
+                "DROP INDEX IF EXISTS ix_keystrokecommitment_id",
+                "DROP INDEX IF EXISTS ix_user_id",
+                "DROP INDEX IF EXISTS ix_noncerecord_value",
+                "DROP INDEX IF EXISTS ix_noncerecord_origin_hash",
+                "DROP INDEX IF EXISTS ix_noncerecord_consumed_at",
+            ],
+        },
+    ),
+]
+
+
+def _ensure_version_table(conn: Connection) -> None:
+    conn.execute(
+        text(
+            "CREATE TABLE IF NOT EXISTS schema_version ("
+            "version INTEGER PRIMARY KEY, description VARCHAR NOT NULL, "
+            "applied_at TIMESTAMP NOT NULL)"
+        )
+    )
+
+
+def current_version(conn: Connection) -> int:
+    _ensure_version_table(conn)
+    return conn.execute(text("SELECT COALESCE(MAX(version), 0) FROM schema_version")).scalar_one()
+
+
+def _drop_invalid_index(conn: Connection, statement: str) -> None:
+    """Drop the index ``statement`` builds concurrently if an earlier build left it invalid."""
+    match = _CONCURRENT_INDEX.match(statement)
+    if match is None:
+        return
+    name = match.group(1)
+    invalid = conn.execute(
+        text("SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)"),
+        {"name": name},
+    ).scalar()
+    if invalid:
+        logger.warning("migration_invalid_index_dropped", index=name)
+        conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+
+
+def run_migrations(engine: Engine, migrations: list[Migration] = MIGRATIONS) -> int:
+    """Apply pending migrations in version order; returns the resulting version."""
+    dialect = engine.dialect.name
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if dialect == "postgresql":
+            conn.execute(text("SELECT pg_advisory_lock(:k)"), {"k": _ADVISORY_LOCK_KEY})
+        try:
+            version = current_version(conn)
+            for migration in sorted(migrations, key=lambda m: m.version):
+                if migration.version <= version:
+                    continue
+                logger.info(
+                    "migration_start", version=migration.version, description=migration.description
+                )
+                # Statements are idempotent, and invalid indexes from an interrupted
+                # concurrent build are dropped first, so a migration is safe to re-run
+                for statement in migration.statements_for(dialect):
+                    if dialect == "postgresql":
+                        _drop_invalid_index(conn, statement)
+                    conn.execute(text(statement))
+                conn.execute(
+                    text(
+                        "INSERT INTO schema_version (version, description, applied_at) "
+                        "VALUES (:v, :d, :t)"
+                    ),
+                    {"v": migration.version, "d": migration.description, "t": datetime.utcnow()},
+                )
+                version = migration.version
+                logger.info("migration_done", version=version)
+        finally:
+            if dialect == "postgresql":
+                conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": _ADVISORY_LOCK_KEY})
+    return version
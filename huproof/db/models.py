@@ -5,8 +5,11 @@ from enum import Enum
 from typing import Optional
 from uuid import uuid4
 
+from sqlalchemy import Index, text
 from sqlmodel import Field, SQLModel
 
+from .types import CompactUUID, FieldElement
+
 
 class NoncePurpose(str, Enum):
     enroll = "enroll"
@@ -18,35 +21,55 @@ def _uuid_str() -> str:
 
 
 class User(SQLModel, table=True):
-    id: str = Field(default_factory=_uuid_str, primary_key=True, index=True)
+    id: str = Field(default_factory=_uuid_str, primary_key=True, sa_type=CompactUUID)
     created_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
 
 
 class KeystrokeCommitment(SQLModel, table=True):
-    id: str = Field(default_factory=_uuid_str, primary_key=True, index=True)
-    user_id: str = Field(foreign_key="user.id", index=True)
-    origin: str = Field(index=True)
-    commitment_c: str = Field(index=True)
+    # Login looks up the active commitment by (user_id, origin); only active rows are indexed.
+    # The index also serves user_id foreign-key lookups. The SQLite predicate must match the
+    # compiled query text (``is_active = 1``) for the planner to pick the partial index.
+    __table_args__ = (
+        Index(
+            "ix_keystrokecommitment_active_lookup",
+            "user_id",
+            "origin",
+            postgresql_where=text("is_active"),
+            postgresql_include=["commitment_c", "tau"],
+            sqlite_where=text("is_active = 1"),
+        ),
+    )
+
+    id: str = Field(default_factory=_uuid_str, primary_key=True, sa_type=CompactUUID)
+    user_id: str = Field(foreign_key="user.id", sa_type=CompactUUID)
+    origin: str = Field()
+    commitment_c: str = Field(sa_type=FieldElement)
     tau: int = Field(default=400)
-    vkey_id: Optional[str] = Field(default=None, index=True)
+    vkey_id: Optional[str] = Field(default=None)
     is_active: bool = Field(default=True)
     created_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
 
 
 class NonceRecord(SQLModel, table=True):
-    id: str = Field(default_factory=_uuid_str, primary_key=True)
-    value: str = Field(index=True, unique=True)
+    # Nonces are looked up by (value, purpose) and are the highest-volume writes,
+    # so no other secondary indexes besides the user_id foreign key.
+    __table_args__ = (Index("ux_noncerecord_value_purpose", "value", "purpose", unique=True),)
+
+    id: str = Field(default_factory=_uuid_str, primary_key=True, sa_type=CompactUUID)
+    value: str = Field()
     purpose: NoncePurpose = Field()
-    origin_hash: str = Field(index=True)
-    user_id: Optional[str] = Field(default=None, foreign_key="user.id", index=True)
+    origin_hash: str = Field()
+    user_id: Optional[str] = Field(
+        default=None, foreign_key="user.id", index=True, sa_type=CompactUUID
+    )
     created_at: datetime = Field(default_factory=datetime.utcnow)
     expires_at: datetime = Field()
-    consumed_at: Optional[datetime] = Field(default=None, index=True)
+    consumed_at: Optional[datetime] = Field(default=None)
 
 
 class SessionToken(SQLModel, table=True):
-    id: str = Field(default_factory=_uuid_str, primary_key=True)
-    user_id: str = Field(foreign_key="user.id", index=True)
+    id: str = Field(default_factory=_uuid_str, primary_key=True, sa_type=CompactUUID)
+    user_id: str = Field(foreign_key="user.id", index=True, sa_type=CompactUUID)
     jti: str = Field(index=True, unique=True)
     issued_at: datetime = Field(default_factory=datetime.utcnow)
     expires_at: datetime = Field()
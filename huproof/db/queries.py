@@ -0,0 +1,41 @@
+"""Prebuilt statements for the fixed lookups in the API.
+
+Statements are built once at import with bound parameters so every request
+reuses the same construct and hits SQLAlchemy's compiled statement cache
+instead of rebuilding and re-hashing a fresh ``select`` each time.
+"""
+
+from sqlalchemy import bindparam, update
+from sqlmodel import select
+
+from .models import KeystrokeCommitment, NonceRecord, SessionToken, User
+
+ACTIVE_COMMITMENT = select(KeystrokeCommitment).where(
+    KeystrokeCommitment.user_id == bindparam("user_id"),
+    KeystrokeCommitment.origin == bindparam("origin"),
+    KeystrokeCommitment.is_active == True,  # noqa: E712
+)
+
+NONCE_BY_VALUE = select(NonceRecord).where(
+    NonceRecord.value == bindparam("value"),
+    NonceRecord.purpose == bindparam("purpose"),
+)
+
+# Consumes a nonce only if no other request has: a replayed /finish updates no row
+CONSUME_NONCE = (
+    update(NonceRecord)
+    .where(
+        NonceRecord.value == bindparam("nonce"),
+        NonceRecord.purpose == bindparam("nonce_purpose"),
+        NonceRecord.consumed_at == None,  # noqa: E711
+    )
+    .values(consumed_at=bindparam("now"))
+)
+
+# user_id (the token subject) is redundant with the unique jti but routes the lookup to a shard
+SESSION_TOKEN_BY_JTI = select(SessionToken).where(
+    SessionToken.jti == bindparam("jti"),
+    SessionToken.user_id == bindparam("user_id"),
+)
+
+USER_BY_ID = select(User).where(User.id == bindparam("user_id"))
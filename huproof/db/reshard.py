@@ -0,0 +1,107 @@
+"""Online resharding: move users onto the shard the current ring assigns them.
+
+To add shards to a running deployment:
+
+1. Append the new URLs to ``DB_SHARD_URLS``, set ``DB_SHARD_PREVIOUS_COUNT``
+   to the shard count before the change, and roll out. Startup creates the
+   tables on the new shards; users not moved yet are still found on their
+   previous shard.
+2. Run ``huproof reshard``.
+3. Unset ``DB_SHARD_PREVIOUS_COUNT`` and roll out again.
+
+Each user moves in one step. The source transaction locks the ``User`` row
+(``FOR UPDATE`` on PostgreSQL, the database write lock on SQLite), which
+blocks concurrent writes that reference it. The user's rows are then copied
+and committed on the target, and deleted from the source. Requests arriving
+after the copy commits find the user on the target. Pending nonces are not
+copied: a login started before its user moved has to be restarted. A run
+interrupted between the two commits is completed by running the tool again.
+"""
+
+from typing import Iterator, Optional
+
+from sqlalchemy import delete, update
+from sqlalchemy.orm import make_transient
+from sqlmodel import Session, select
+
+from ..core.logging import get_logger
+from ..core.metrics import record_counter
+from .models import KeystrokeCommitment, NonceRecord, SessionToken, User
+from .session import ShardRouter, get_shards
+
+logger = get_logger()
+
+
+def misplaced_users(
+    router: ShardRouter, shard_id: str, batch_size: int = 500
+) -> Iterator[list[str]]:
+    """Batches of user ids stored on ``shard_id`` that the ring assigns elsewhere."""
+    last: Optional[str] = None
+    while True:
+        stmt = select(User.id).order_by(User.id).limit(batch_size)
+        if last is not None:
+            stmt = stmt.where(User.id > last)
+        with Session(router.engines[shard_id]) as session:
+            ids = list(session.exec(stmt))
+        if not ids:
+            return
+        last = ids[-1]
+        batch = [user_id for user_id in ids if router.owner(user_id) != shard_id]
+        if batch:
+            yield batch
+
+
+def _lock_user(session: Session, user_id: str) -> Optional[User]:
+    if session.get_bind().dialect.name == "postgresql":
+        # FOR UPDATE conflicts with the KEY SHARE lock every foreign-key insert takes
+        return session.exec(select(User).where(User.id == user_id).with_for_update()).first()
+    # No row locks on SQLite: a no-op write takes the database write lock
+    session.exec(update(User).where(User.id == user_id).values(created_at=User.created_at))
+    return session.exec(select(User).where(User.id == user_id)).first()
+
+
+def move_user(router: ShardRouter, user_id: str, source: str, target: str) -> bool:
+    """Move one user and its commitments and session tokens; False if it was not on ``source``."""
+    with Session(router.engines[source]) as src, Session(router.engines[target]) as dst:
+        user = _lock_user(src, user_id)
+        if user is None:
+            return False
+        # Already copied by an interrupted run: the target copy may have newer writes
+        if dst.exec(select(User.id).where(User.id == user_id)).first() is None:
+            rows: list = [user]
+            rows += src.exec(
+                select(KeystrokeCommitment).where(KeystrokeCommitment.user_id == user_id)
+            ).all()
+            rows += src.exec(select(SessionToken).where(SessionToken.user_id == user_id)).all()
+            for row in rows:
+                src.expunge(row)
+                make_transient(row)
+                dst.add(row)
+                # Flush one by one to keep add order (no relationships to sort foreign keys)
+                dst.flush()
+            dst.commit()
+        for model in (NonceRecord, SessionToken, KeystrokeCommitment):
+            src.exec(delete(model).where(model.user_id == user_id))
+        src.exec(delete(User).where(User.id == user_id))
+        src.commit()
+    record_counter("db_reshard_moved", source=source, target=target)
+    return True
+
+
+def reshard(
+    router: Optional[ShardRouter] = None, batch_size: int = 500, dry_run: bool = False
+) -> dict[str, int]:
+    """Move every misplaced user to its owner; returns the number moved per target shard."""
+    router = router or get_shards()
+    if router is None:
+        raise RuntimeError("sharding is not configured (DB_SHARD_URLS is empty)")
+    moved = {shard_id: 0 for shard_id in router.ids}
+    for source in router.ids:
+        for batch in misplaced_users(router, source, batch_size):
+            for user_id in batch:
+                target = router.owner(user_id)
+                if dry_run or move_user(router, user_id, source, target):
+                    moved[target] += 1
+            logger.info("reshard_batch", source=source, users=len(batch), dry_run=dry_run)
+    return moved
+
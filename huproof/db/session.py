@@ -1,34 +1,572 @@
-from contextlib import contextmanager
-from typing import Iterator
+import bisect
+import hashlib
+import itertools
+import re
+import threading
+from concurrent.futures import Future
+from contextlib import asynccontextmanager, contextmanager
+from datetime import datetime
+from time import monotonic, perf_counter_ns, time_ns
+from typing import Any, AsyncIterator, Callable, Iterator, Optional
 
-from sqlmodel import Session, SQLModel, create_engine
+from sqlalchemy import Engine, event, text
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.ext.horizontal_shard import ShardedSession
+from sqlalchemy.orm import ORMExecuteState
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlmodel import Session, SQLModel, create_engine, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from ..config.settings import get_settings
+from ..config.settings import Settings, get_settings
+from ..core.logging import get_logger
+from ..core.metrics import observe_timing, record_counter
+from ..core.tracing import current_trace, span
+from .migrations import run_migrations
+from .models import NonceRecord, User
+from .queries import CONSUME_NONCE
+from .sqlite import DeferredWriteSession, SQLiteWriter, install_pragmas, is_file_sqlite
 
+logger = get_logger()
 
 _engine = None
+_async_engine: AsyncEngine | None = None
+_replicas: Optional["ReplicaSet"] = None
+_sqlite_writer: Optional[SQLiteWriter] = None
+_shards: Optional["ShardRouter"] = None
+
+# Async drivers substituted for the configured sync URL when DB_ASYNC is on
+_ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|\$\d+|(?<!:):\w+|'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_VALUE_LIST = re.compile(r"\(\?(?:\s*,\s*\?)*\)(?:\s*,\s*\(\?(?:\s*,\s*\?)*\))*")
+_normalized: dict[str, str] = {}
+_NORMALIZED_MAX = 2000
+
+
+def normalize_sql(statement: str) -> str:
+    """Statement text with literals, bind markers and value lists reduced to ``?``.
+
+    Statements differing only in parameters or ``IN``/``VALUES`` list length
+    get the same text, so they aggregate into one series.
+    """
+    normalized = _normalized.get(statement)
+    if normalized is None:
+        normalized = " ".join(_VALUE_LIST.sub("(?)", _PLACEHOLDER.sub("?", statement)).split())
+        if len(_normalized) >= _NORMALIZED_MAX:
+            _normalized.clear()
+        _normalized[statement] = normalized
+    return normalized
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_query(
+    conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, executemany: bool
+) -> None:
+    conn.info.setdefault("query_start", []).append((time_ns(), perf_counter_ns()))
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_query(
+    conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, executemany: bool
+) -> None:
+    """Time every statement of every engine by normalised text; add it to the request's trace."""
+    started = conn.info.get("query_start")
+    if not started:
+        return
+    start_ns, t0 = started.pop()
+    elapsed = perf_counter_ns() - t0
+    query = normalize_sql(statement)
+    observe_timing("db_query_time", elapsed / 1e6, query=query)
+    trace = current_trace()
+    if trace is not None:
+        trace.add_query(query, start_ns, elapsed)
+
+
+@event.listens_for(Engine, "handle_error")
+def _failed_query(context: Any) -> None:
+    # after_cursor_execute does not run for a failed statement
+    started = context.connection.info.get("query_start") if context.connection is not None else None
+    if started:
+        started.pop()
+
+
+def _engine_kwargs(settings: Settings, db_url: Optional[str] = None) -> dict[str, Any]:
+    """Build ``create_engine`` keyword arguments for ``db_url`` (default: ``DB_URL``)."""
+    db_url = db_url or settings.db_url
+    kwargs: dict[str, Any] = {
+        "echo": False,
+        "query_cache_size": settings.db_query_cache_size,
+    }
+    if db_url.startswith("sqlite"):
+        kwargs["connect_args"] = {"check_same_thread": False}
+        if settings.sqlite_production and is_file_sqlite(db_url):
+            # Pool of reader connections; writes go through the writer thread
+            kwargs.update(pool_size=settings.sqlite_read_pool_size, max_overflow=0)
+        return kwargs
+
+    kwargs.update(
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout_s,
+        pool_pre_ping=settings.db_pool_pre_ping,
+        pool_recycle=settings.db_pool_recycle_s,
+    )
+    if db_url.startswith("postgresql") and settings.db_statement_timeout_ms > 0:
+        kwargs["connect_args"] = {
+            "options": f"-c statement_timeout={settings.db_statement_timeout_ms}"
+        }
+    return kwargs
+
+
+def create_url_engine(db_url: str) -> Engine:
+    """Engine for another database URL (tools, shards, replicas) with the configured pool."""
+    return create_engine(db_url, **_engine_kwargs(get_settings(), db_url))
 
 
 def get_engine():
     global _engine
     if _engine is None:
         settings = get_settings()
-        connect_args = {"check_same_thread": False} if settings.db_url.startswith("sqlite") else {}
-        _engine = create_engine(settings.db_url, echo=False, connect_args=connect_args)
+        _engine = create_engine(settings.db_url, **_engine_kwargs(settings))
+        if settings.sqlite_production and is_file_sqlite(settings.db_url):
+            install_pragmas(_engine, settings)
     return _engine
 
 
+def get_sqlite_writer() -> Optional[SQLiteWriter]:
+    """The group-commit writer when SQLite production mode is on, else None."""
+    global _sqlite_writer
+    settings = get_settings()
+    if not (settings.sqlite_production and is_file_sqlite(settings.db_url)):
+        return None
+    if settings.db_shard_urls.strip():
+        # Sharded sessions write to several databases; the writer owns only DB_URL
+        return None
+    if _sqlite_writer is None:
+        _sqlite_writer = SQLiteWriter(settings.db_url, settings)
+    return _sqlite_writer
+
+
+def _run_on_commit(session: Session) -> None:
+    for callback in session.info.pop("on_commit", []):
+        callback()
+
+
+def on_commit(session: Session, callback: Callable[[], None]) -> None:
+    """Run ``callback`` once the session's pending writes are committed."""
+    callbacks = session.info.setdefault("on_commit", [])
+    if not callbacks:
+        event.listen(session, "after_commit", _run_on_commit, once=True)
+    callbacks.append(callback)
+
+
+def async_url(db_url: str) -> str:
+    """Rewrite a sync database URL to use the matching async driver."""
+    scheme, sep, rest = db_url.partition("://")
+    backend = scheme.split("+", 1)[0]
+    if backend not in _ASYNC_DRIVERS:
+        raise ValueError(f"no async driver known for {scheme!r}")
+    return f"{_ASYNC_DRIVERS[backend]}{sep}{rest}"
+
+
+def _async_engine_kwargs(settings: Settings, db_url: Optional[str] = None) -> dict[str, Any]:
+    db_url = db_url or settings.db_url
+    kwargs = _engine_kwargs(settings, db_url)
+    if db_url.startswith("sqlite"):
+        # aiosqlite runs each connection on its own thread already
+        kwargs.pop("connect_args", None)
+    elif "connect_args" in kwargs:
+        # asyncpg takes server settings instead of libpq ``options``
+        kwargs["connect_args"] = {
+            "server_settings": {"statement_timeout": str(settings.db_statement_timeout_ms)}
+        }
+    return kwargs
+
+
+def get_async_engine() -> AsyncEngine:
+    global _async_engine
+    if _async_engine is None:
+        settings = get_settings()
+        _async_engine = create_async_engine(
+            async_url(settings.db_url), **_async_engine_kwargs(settings)
+        )
+    return _async_engine
+
+
+class ReplicaSet:
+    """Read replicas picked round-robin, skipping any that lag too far behind.
+
+    Replication lag is probed at most every ``check_interval_s`` per replica
+    (PostgreSQL ``pg_last_xact_replay_timestamp``; other backends report 0).
+    A replica that fails its probe counts as infinitely stale until the next
+    probe. When no replica is fresh enough, reads go to the primary.
+    """
+
+    def __init__(self, urls: list[str], settings: Settings):
+        self.urls = urls
+        self.settings = settings
+        self.max_lag_s = settings.db_replica_max_lag_s
+        self.check_interval_s = settings.db_replica_lag_check_s
+        self.engines = [create_engine(url, **_engine_kwargs(settings, url)) for url in urls]
+        self._async_engines: dict[int, AsyncEngine] = {}
+        self._lag = [0.0] * len(urls)
+        self._checked_at = [float("-inf")] * len(urls)
+        self._rr = itertools.count()
+        self._lock = threading.Lock()
+
+    def _probe(self, index: int) -> float:
+        engine = self.engines[index]
+        if engine.dialect.name != "postgresql":
+            return 0.0
+        try:
+            with engine.connect() as conn:
+                lag = conn.execute(
+                    text(
+                        "SELECT COALESCE("
+                        "EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)"
+                    )
+                ).scalar_one()
+            return float(lag)
+        except Exception as e:
+            logger.warning("replica_probe_failed", replica=index, error=str(e))
+            return float("inf")
+
+    def lag(self, index: int) -> float:
+        now = monotonic()
+        with self._lock:
+            due = now - self._checked_at[index] >= self.check_interval_s
+            if due:
+                # Claim the probe so concurrent readers keep using the last value
+                self._checked_at[index] = now
+        if due:
+            self._lag[index] = self._probe(index)
+        return self._lag[index]
+
+    def pick(self) -> Optional[int]:
+        """Index of a fresh-enough replica, or None to use the primary."""
+        start = next(self._rr)
+        for offset in range(len(self.engines)):
+            index = (start + offset) % len(self.engines)
+            if self.lag(index) <= self.max_lag_s:
+                return index
+        return None
+
+    def async_engine(self, index: int) -> AsyncEngine:
+        if index not in self._async_engines:
+            url = self.urls[index]
+            self._async_engines[index] = create_async_engine(
+                async_url(url), **_async_engine_kwargs(self.settings, url)
+            )
+        return self._async_engines[index]
+
+    def dispose(self) -> None:
+        for engine in self.engines:
+            engine.dispose()
+
+
+def get_replicas() -> Optional[ReplicaSet]:
+    """Replica set from ``DB_REPLICA_URLS``, or None when no replicas are configured."""
+    global _replicas
+    settings = get_settings()
+    urls = [u.strip() for u in settings.db_replica_urls.split(",") if u.strip()]
+    if not urls:
+        return None
+    if _replicas is None:
+        _replicas = ReplicaSet(urls, settings)
+    return _replicas
+
+
+def _pick_read_target(route: str) -> Optional[int]:
+    replicas = get_replicas()
+    index = replicas.pick() if replicas is not None else None
+    record_counter("db_read_route", route=route, target="primary" if index is None else "replica")
+    return index
+
+
+def served_by_replica(session: Session | AsyncSession) -> bool:
+    """Whether a read session was routed to a replica (and so may be stale)."""
+    return bool(session.info.get("replica"))
+
+
+def _ring_hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent hash ring with ``vnodes`` points per shard.
+
+    A key belongs to the first point at or after its hash. Adding a shard
+    only takes over keys from the points it lands next to, so about
+    ``1/N`` of the users move instead of nearly all of them.
+    """
+
+    def __init__(self, shard_ids: list[str], vnodes: int):
+        points = sorted(
+            (_ring_hash(f"{shard_id}#{i}"), shard_id)
+            for shard_id in shard_ids
+            for i in range(vnodes)
+        )
+        self._hashes = [h for h, _ in points]
+        self._owners = [shard_id for _, shard_id in points]
+
+    def shard(self, key: str) -> str:
+        index = bisect.bisect_left(self._hashes, _ring_hash(key)) % len(self._hashes)
+        return self._owners[index]
+
+
+class ShardRouter:
+    """Maps users to shards: ``DB_URL`` is shard ``"0"``, ``DB_SHARD_URLS`` are ``"1"``, ``"2"``...
+
+    Everything belonging to a user lives on the shard the ring assigns to its
+    id. Enrollment nonces have no user yet and go to the enroll shard. Nonce
+    values carry their shard as a ``"<shard>."`` prefix so ``/finish`` can find
+    them without asking every shard.
+
+    While resharding (``DB_SHARD_PREVIOUS_COUNT`` set), a user whose owner
+    differs between the previous and the current ring is served from the
+    current owner once its ``User`` row is there, else from the previous one.
+    That costs one extra lookup for those users until the reshard is done.
+    """
+
+    def __init__(self, urls: list[str], settings: Settings, primary: Engine):
+        self.urls = urls
+        self.settings = settings
+        self.ids = [str(i) for i in range(len(urls))]
+        self.engines: dict[str, Engine] = {"0": primary}
+        for shard_id, url in zip(self.ids[1:], urls[1:]):
+            self.engines[shard_id] = create_engine(url, **_engine_kwargs(settings, url))
+        self._async_engines: dict[str, AsyncEngine] = {}
+        self.ring = HashRing(self.ids, settings.db_shard_vnodes)
+        previous = settings.db_shard_previous_count
+        self.previous = (
+            HashRing(self.ids[:previous], settings.db_shard_vnodes)
+            if 0 < previous < len(urls)
+            else None
+        )
+        self.enroll_shard = str(settings.db_enroll_shard)
+        if self.enroll_shard not in self.engines:
+            raise ValueError(
+                f"DB_ENROLL_SHARD={settings.db_enroll_shard} "
+                f"but only {len(urls)} shards are configured"
+            )
+
+    def owner(self, user_id: str) -> str:
+        """Shard the current ring assigns to ``user_id``."""
+        return self.ring.shard(user_id)
+
+    def locate(self, user_id: str) -> str:
+        """Shard currently holding ``user_id``."""
+        owner = self.ring.shard(user_id)
+        if self.previous is None:
+            return owner
+        previous = self.previous.shard(user_id)
+        if previous == owner:
+            return owner
+        with self.engines[owner].connect() as conn:
+            moved = conn.execute(select(User.id).where(User.id == user_id)).first() is not None
+        return owner if moved else previous
+
+    def tag_nonce(self, nonce: str, user_id: Optional[str] = None) -> str:
+        shard_id = self.locate(user_id) if user_id is not None else self.enroll_shard
+        return f"{shard_id}.{nonce}"
+
+    def nonce_shard(self, value: str) -> str:
+        shard_id, sep, _ = value.partition(".")
+        return shard_id if sep and shard_id in self.engines else self.enroll_shard
+
+    def async_engines(self) -> dict[str, AsyncEngine]:
+        if not self._async_engines:
+            self._async_engines["0"] = get_async_engine()
+            for shard_id, url in zip(self.ids[1:], self.urls[1:]):
+                self._async_engines[shard_id] = create_async_engine(
+                    async_url(url), **_async_engine_kwargs(self.settings, url)
+                )
+        return self._async_engines
+
+    def dispose(self) -> None:
+        for engine in self.engines.values():
+            engine.dispose()
+
+
+class ShardedUserSession(ShardedSession, Session):
+    """Session routing every row and statement to the shard of its user.
+
+    New rows go by their ``user_id`` (``User.id`` for users, the tagged value
+    for nonces). Statements go by their ``user_id`` parameter, or by a nonce
+    ``value`` parameter; anything else runs on every shard and is counted as
+    ``db_shard_fanout``.
+    """
+
+    def __init__(self, router: ShardRouter, shards: Optional[dict[str, Any]] = None, **kwargs: Any):
+        self.router = router
+        self._located: dict[str, str] = {}
+        super().__init__(
+            shard_chooser=self._shard_for_instance,
+            identity_chooser=self._shards_for_identity,
+            execute_chooser=self._shards_for_statement,
+            shards=shards if shards is not None else router.engines,
+            **kwargs,
+        )
+
+    def _user_shard(self, user_id: str) -> str:
+        if user_id not in self._located:
+            self._located[user_id] = self.router.locate(user_id)
+        return self._located[user_id]
+
+    def _shard_for_instance(self, mapper: Any, instance: Any, **kw: Any) -> str:
+        if isinstance(instance, User):
+            # A new user goes to its owner; its other rows in this session follow it
+            return self._located.setdefault(instance.id, self.router.owner(instance.id))
+        if isinstance(instance, NonceRecord):
+            return self.router.nonce_shard(instance.value)
+        user_id = getattr(instance, "user_id", None)
+        return self._user_shard(user_id) if user_id is not None else self.router.enroll_shard
+
+    def _shards_for_identity(self, mapper: Any, primary_key: Any, **kw: Any) -> list[str]:
+        if mapper.class_ is User:
+            return [self._user_shard(primary_key[0])]
+        return list(self.router.ids)
+
+    def _shards_for_statement(self, orm_context: ORMExecuteState) -> list[str]:
+        params = orm_context.parameters if isinstance(orm_context.parameters, dict) else {}
+        if params.get("user_id") is not None:
+            return [self._user_shard(params["user_id"])]
+        nonce = params.get("value", params.get("nonce"))
+        if isinstance(nonce, str):
+            return [self.router.nonce_shard(nonce)]
+        record_counter("db_shard_fanout")
+        return list(self.router.ids)
+
+
+def get_shards() -> Optional[ShardRouter]:
+    """Shard router over ``DB_URL`` and ``DB_SHARD_URLS``, or None when not sharded."""
+    global _shards
+    settings = get_settings()
+    extra = [u.strip() for u in settings.db_shard_urls.split(",") if u.strip()]
+    if not extra:
+        return None
+    if _shards is None:
+        _shards = ShardRouter([settings.db_url, *extra], settings, get_engine())
+    return _shards
+
+
+def shard_engines() -> list[Engine]:
+    """Every primary database: the shards when sharded, else just ``DB_URL``."""
+    shards = get_shards()
+    return [get_engine()] if shards is None else list(shards.engines.values())
+
+
+def shard_nonce(nonce: str, user_id: Optional[str] = None) -> str:
+    """Tag ``nonce`` with the shard its record is stored on (unchanged when not sharded)."""
+    shards = get_shards()
+    return nonce if shards is None else shards.tag_nonce(nonce, user_id)
+
+
+def shard_bind_arguments(user_id: str) -> dict[str, str]:
+    """``bind_arguments`` pinning a statement with no ``user_id`` parameter to that user's shard."""
+    shards = get_shards()
+    return {} if shards is None else {"shard_id": shards.locate(user_id)}
+
+
 def init_db() -> None:
-    engine = get_engine()
-    SQLModel.metadata.create_all(engine)
+    for engine in shard_engines():
+        SQLModel.metadata.create_all(engine)
+        run_migrations(engine)
+
+
+def _wait_for_writer(future: Future) -> Any:
+    """Wait for a writer job; on timeout cancel it so it cannot commit after the request failed."""
+    timeout_s = get_settings().sqlite_write_timeout_s
+    try:
+        return future.result(timeout=timeout_s)
+    except TimeoutError:
+        if future.cancel():
+            raise
+        # Already in a batch being committed: that decides
+        return future.result(timeout=timeout_s)
+
+
+class NonceAlreadyConsumed(Exception):
+    """Another request consumed the nonce first."""
+
+
+def _consume_params(record: NonceRecord, now: datetime) -> dict[str, Any]:
+    return {"nonce": record.value, "nonce_purpose": record.purpose, "now": now}
+
+
+_NO_SYNC = {"synchronize_session": False}
+
+
+def consume_nonce(session: Session, record: NonceRecord, now: datetime) -> bool:
+    """Mark ``record`` consumed unless another request already has; False if it lost the race.
+
+    The update is conditional and takes effect before the caller answers:
+    of two concurrent ``/finish`` calls with the same nonce, one updates the
+    row and the other finds nothing to update. With the SQLite writer the
+    update is a writer job of its own, waited for here.
+    """
+    params = _consume_params(record, now)
+    if isinstance(session, DeferredWriteSession):
+        writer = get_sqlite_writer()
+
+        def claim(s: Session) -> None:
+            if s.exec(CONSUME_NONCE, params=params, execution_options=_NO_SYNC).rowcount != 1:
+                raise NonceAlreadyConsumed()
+
+        try:
+            _wait_for_writer(writer.submit(claim))
+        except NonceAlreadyConsumed:
+            return False
+    elif session.exec(CONSUME_NONCE, params=params, execution_options=_NO_SYNC).rowcount != 1:
+        return False
+    set_committed_value(record, "consumed_at", now)
+    return True
+
+
+async def consume_nonce_async(session: AsyncSession, record: NonceRecord, now: datetime) -> bool:
+    """Async variant of :func:`consume_nonce`."""
+    params = _consume_params(record, now)
+    result = await session.exec(CONSUME_NONCE, params=params, execution_options=_NO_SYNC)
+    if result.rowcount != 1:
+        return False
+    set_committed_value(record, "consumed_at", now)
+    return True
+
+
+@contextmanager
+def _deferred_session_scope(writer: SQLiteWriter) -> Iterator[Session]:
+    """Read on a pooled connection, then commit the writes through ``writer``."""
+    session = DeferredWriteSession(get_engine(), autoflush=False)
+    try:
+        yield session
+        with span("db_commit"):
+            future = writer.submit_session(session)
+            if future is not None:
+                _wait_for_writer(future)
+        if future is not None:
+            _run_on_commit(session)
+    finally:
+        session.rollback()
+        session.close()
 
 
 @contextmanager
 def session_scope() -> Iterator[Session]:
-    session = Session(get_engine())
+    writer = get_sqlite_writer()
+    if writer is not None:
+        with _deferred_session_scope(writer) as session:
+            yield session
+        return
+    shards = get_shards()
+    session = Session(get_engine()) if shards is None else ShardedUserSession(shards)
     try:
         yield session
-        session.commit()
+        with span("db_commit"):
+            session.commit()
     except Exception:
         session.rollback()
         raise
@@ -36,8 +574,90 @@ def session_scope() -> Iterator[Session]:
         session.close()
 
 
+@contextmanager
+def read_session_scope(route: str = "") -> Iterator[Session]:
+    """Session for read-only work: never flushes or commits.
+
+    Routed to a read replica when one is configured and fresh enough. The
+    transaction is rolled back on exit, which is the cheapest way to end it.
+    On PostgreSQL the transaction is also marked ``READ ONLY``.
+    Anything that must see its own writes uses :func:`session_scope` instead.
+    Sharded deployments read from the shard primaries.
+    """
+    shards = get_shards()
+    if shards is not None:
+        session: Session = ShardedUserSession(shards, autoflush=False, info={"replica": False})
+        engine = None
+    else:
+        index = _pick_read_target(route)
+        engine = get_engine() if index is None else get_replicas().engines[index]
+        session = Session(engine, autoflush=False, info={"replica": index is not None})
+    try:
+        if engine is not None and engine.dialect.name == "postgresql":
+            session.connection(execution_options={"postgresql_readonly": True})
+        yield session
+    finally:
+        session.rollback()
+        session.close()
+
+
 def get_session() -> Iterator[Session]:
     with session_scope() as s:
         yield s
 
 
+def _new_async_session(**kwargs: Any) -> AsyncSession:
+    shards = get_shards()
+    if shards is None:
+        return AsyncSession(get_async_engine(), **kwargs)
+    # Router lookups while resharding use the sync engines and may briefly block the loop
+    return AsyncSession(
+        sync_session_class=ShardedUserSession,
+        router=shards,
+        shards={
+            shard_id: engine.sync_engine for shard_id, engine in shards.async_engines().items()
+        },
+        **kwargs,
+    )
+
+
+@asynccontextmanager
+async def async_session_scope() -> AsyncIterator[AsyncSession]:
+    session = _new_async_session(expire_on_commit=False)
+    try:
+        yield session
+        with span("db_commit"):
+            await session.commit()
+    except Exception:
+        await session.rollback()
+        raise
+    finally:
+        await session.close()
+
+
+@asynccontextmanager
+async def async_read_session_scope(route: str = "") -> AsyncIterator[AsyncSession]:
+    """Async counterpart of :func:`read_session_scope`.
+
+    Replica lag probes are shared with the sync path and may briefly block
+    the event loop, at most once per ``DB_REPLICA_LAG_CHECK_S`` per replica.
+    """
+    if get_shards() is not None:
+        session = _new_async_session(autoflush=False, info={"replica": False})
+        engine = None
+    else:
+        index = _pick_read_target(route)
+        engine = get_async_engine() if index is None else get_replicas().async_engine(index)
+        session = AsyncSession(engine, autoflush=False, info={"replica": index is not None})
+    try:
+        if engine is not None and engine.dialect.name == "postgresql":
+            await session.connection(execution_options={"postgresql_readonly": True})
+        yield session
+    finally:
+        await session.rollback()
+        await session.close()
+
+
+async def get_async_session() -> AsyncIterator[AsyncSession]:
+    async with async_session_scope() as s:
+        yield s
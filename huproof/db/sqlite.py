@@ -0,0 +1,174 @@
+"""SQLite production mode: tuned pragmas and a single-writer group-commit queue.
+
+SQLite allows one writer at a time, and every commit is an fsync. Concurrent
+request threads that each commit their own transaction contend for the write
+lock ("database is locked") and pay one fsync each. In production mode:
+
+* every connection runs in WAL mode with ``synchronous=NORMAL``, a
+  ``busy_timeout`` and memory-mapped I/O, so readers never block the writer;
+* request sessions only read; the rows they add or modify are handed to
+  :class:`SQLiteWriter`, one thread that owns the only write connection and
+  commits everything queued since its last commit as a single transaction.
+
+Each job runs inside its own SAVEPOINT, so a failing job (for example a
+duplicate nonce) is rolled back alone without failing the rest of the batch.
+"""
+
+import queue
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from time import perf_counter
+from typing import Any, Callable, Optional
+
+from sqlalchemy import Engine, create_engine, event
+from sqlmodel import Session
+
+from ..config.settings import Settings
+from ..core.logging import get_logger
+from ..core.metrics import record_counter, record_timing
+
+logger = get_logger()
+
+
+def is_file_sqlite(db_url: str) -> bool:
+    """True for SQLite URLs naming a database file (not in-memory)."""
+    if not db_url.startswith("sqlite"):
+        return False
+    path = db_url.partition("://")[2].lstrip("/")
+    return bool(path) and ":memory:" not in path
+
+
+def install_pragmas(engine: Engine, settings: Settings) -> None:
+    """Apply the production pragmas to every new connection of ``engine``."""
+
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_conn: Any, _record: Any) -> None:
+        cur = dbapi_conn.cursor()
+        cur.execute("PRAGMA journal_mode=WAL")
+        cur.execute(f"PRAGMA busy_timeout={int(settings.sqlite_busy_timeout_ms)}")
+        cur.execute("PRAGMA synchronous=NORMAL")
+        cur.execute(f"PRAGMA mmap_size={int(settings.sqlite_mmap_size)}")
+        cur.close()
+
+
+class DeferredWriteSession(Session):
+    """Request session whose writes are collected for the writer thread.
+
+    ``flush`` is a no-op, so added and modified objects stay pending in
+    ``new``/``dirty`` (in the order they were added) until
+    :meth:`SQLiteWriter.submit_session` hands them over.
+    """
+
+    def flush(self, objects: Any = None) -> None:
+        return None
+
+
+@dataclass
+class _Job:
+    apply: Callable[[Session], None]
+    future: Future = field(default_factory=Future)
+
+
+class SQLiteWriter:
+    """Single writer thread that group-commits queued jobs."""
+
+    def __init__(self, db_url: str, settings: Settings):
+        self.max_batch = settings.sqlite_write_batch_max
+        self.engine = create_engine(
+            db_url,
+            pool_size=1,
+            max_overflow=0,
+            connect_args={"check_same_thread": False},
+        )
+        install_pragmas(self.engine, settings)
+
+        @event.listens_for(self.engine, "connect")
+        def _manual_transactions(dbapi_conn: Any, _record: Any) -> None:
+            # Let SQLAlchemy emit BEGIN/SAVEPOINT itself (pysqlite's implicit
+            # transactions break SAVEPOINT handling)
+            dbapi_conn.isolation_level = None
+
+        @event.listens_for(self.engine, "begin")
+        def _begin_immediate(conn: Any) -> None:
+            # Take the write lock up front instead of upgrading mid-transaction
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+        self._queue: queue.Queue[Optional[_Job]] = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="sqlite-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, apply: Callable[[Session], None]) -> Future:
+        """Queue ``apply(session)``; the future resolves once its batch commits.
+
+        Cancelling the future before the writer picks the job up drops it.
+        """
+        job = _Job(apply)
+        self._queue.put(job)
+        return job.future
+
+    def submit_session(self, session: Session) -> Optional[Future]:
+        """Detach the pending writes of ``session`` and queue them as one job."""
+        objects = [*session.dirty, *session.new]
+        if not objects:
+            return None
+        session.expunge_all()
+
+        def apply(s: Session) -> None:
+            for obj in objects:
+                s.add(obj)
+                # Flush one by one to keep add order (no relationships to sort foreign keys)
+                s.flush()
+
+        return self.submit(apply)
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join()
+        self.engine.dispose()
+
+    def _drain(self, first: _Job) -> list[_Job]:
+        batch = [first]
+        while len(batch) < self.max_batch:
+            try:
+                job = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if job is None:
+                self._queue.put(None)
+                break
+            batch.append(job)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            # Jobs cancelled by a request that stopped waiting must not commit
+            batch = [job for job in self._drain(first) if job.future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            t0 = perf_counter()
+            errors: dict[int, BaseException] = {}
+            try:
+                with Session(self.engine, expire_on_commit=False) as session:
+                    for i, job in enumerate(batch):
+                        try:
+                            with session.begin_nested():
+                                job.apply(session)
+                        except Exception as e:
+                            errors[i] = e
+                    session.commit()
+            except Exception as e:
+                logger.error("sqlite_write_batch_failed", size=len(batch), error=str(e))
+                for job in batch:
+                    job.future.set_exception(e)
+                continue
+            for i, job in enumerate(batch):
+                if i in errors:
+                    job.future.set_exception(errors[i])
+                else:
+                    job.future.set_result(None)
+            record_timing("sqlite_write_batch_time", (perf_counter() - t0) * 1000.0)
+            record_counter("sqlite_write_batch_size", value=len(batch))
@@ -0,0 +1,30 @@
+"""On-disk size of tables and their indexes, for capacity planning."""
+
+from sqlalchemy import Engine, text
+
+
+def table_sizes(engine: Engine) -> dict[str, int]:
+    """Bytes used by each table including its indexes (SQLite or PostgreSQL).
+
+    Raises ValueError for any other dialect.
+    """
+    dialect = engine.dialect.name
+    if dialect not in ("postgresql", "sqlite"):
+        raise ValueError(f"table sizes are not supported for the {dialect} dialect")
+    with engine.connect() as conn:
+        if dialect == "postgresql":
+            rows = conn.execute(
+                text(
+                    "SELECT relname, pg_total_relation_size(relid) "
+                    "FROM pg_catalog.pg_statio_user_tables"
+                )
+            )
+        else:
+            # dbstat reports per b-tree; fold each index into its table
+            rows = conn.execute(
+                text(
+                    "SELECT m.tbl_name, SUM(s.pgsize) FROM dbstat s "
+                    "JOIN sqlite_master m ON m.name = s.name GROUP BY m.tbl_name"
+                )
+            )
+        return {name: int(size) for name, size in rows}
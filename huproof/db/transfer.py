@@ -0,0 +1,211 @@
+"""Streaming export and import of users and their commitments.
+
+The dump is line-delimited JSON, one object per row with its table under
+``"table"``; users come first so commitments always follow the user they
+reference. A path ending in ``.gz`` is gzip-compressed. Values go through the
+model column types in both directions, so a dump moves between SQLite and
+PostgreSQL, between shards, and between compact and plain storage.
+
+Export reads with a server-side cursor (``stream_results``) in primary key
+order, so memory stays constant however large the tables are. Import inserts
+in batches: ``COPY`` on PostgreSQL with psycopg2, ``executemany`` elsewhere.
+After each batch commits, the number of lines consumed is written to a
+checkpoint file; a rerun skips them. The batch after a resume uses
+``ON CONFLICT DO NOTHING`` in case the previous run committed it but died
+before checkpointing.
+"""
+
+import gzip
+import io
+import json
+import os
+import sys
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import IO, Any, Iterable, Iterator, Optional
+
+from sqlalchemy import Connection, DateTime, Engine, Table, insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.types import TypeDecorator
+
+from ..core.logging import get_logger
+from .models import KeystrokeCommitment, User
+from .session import ShardRouter
+
+logger = get_logger()
+
+# Export order: parents before children
+TABLES: list[Table] = [User.__table__, KeystrokeCommitment.__table__]  # type: ignore[list-item]
+_BY_NAME = {table.name: table for table in TABLES}
+
+
+def open_dump(path: str, mode: str) -> IO[str]:
+    """Open a dump file for text ``mode`` ("r" or "w"); ``-`` is stdin/stdout."""
+    if path == "-":
+        return sys.stdin if mode == "r" else sys.stdout
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def _encode(value: Any) -> Any:
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _decode_row(table: Table, record: dict[str, Any]) -> dict[str, Any]:
+    row = {}
+    for column in table.columns:
+        value = record.get(column.name)
+        if value is not None and isinstance(column.type, DateTime):
+            value = datetime.fromisoformat(value)
+        row[column.name] = value
+    return row
+
+
+def export_rows(
+    engines: Iterable[Engine], out: IO[str], batch_size: int = 10_000
+) -> dict[str, int]:
+    """Write every user and commitment in ``engines`` to ``out``; returns rows per table."""
+    counts = {table.name: 0 for table in TABLES}
+    engines = list(engines)
+    for table in TABLES:
+        for engine in engines:
+            with engine.connect() as conn:
+                result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(
+                    table.select().order_by(table.c.id)
+                )
+                for row in result.mappings():
+                    record = {"table": table.name, **{k: _encode(v) for k, v in row.items()}}
+                    out.write(json.dumps(record))
+                    out.write("\n")
+                    counts[table.name] += 1
+        logger.info("export_table_done", table=table.name, rows=counts[table.name])
+    return counts
+
+
+@dataclass
+class Checkpoint:
+    """Dump lines consumed so far, persisted atomically after every batch."""
+
+    path: str
+    records: int = 0
+
+    @classmethod
+    def load(cls, path: str) -> "Checkpoint":
+        try:
+            with open(path, encoding="utf-8") as f:
+                return cls(path, int(json.load(f)["records"]))
+        except FileNotFoundError:
+            return cls(path)
+
+    def save(self, records: int) -> None:
+        self.records = records
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"records": records}, f)
+        os.replace(tmp, self.path)
+
+    def clear(self) -> None:
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def _read_batches(
+    lines: Iterator[str], skip: int, batch_size: int
+) -> Iterator[tuple[list[dict[str, Any]], int]]:
+    """Yield batches of records after the first ``skip`` lines, with the lines consumed so far."""
+    batch: list[dict[str, Any]] = []
+    consumed = 0
+    for consumed, line in enumerate(lines, start=1):
+        if consumed <= skip or not line.strip():
+            continue
+        batch.append(json.loads(line))
+        if len(batch) >= batch_size:
+            yield batch, consumed
+            batch = []
+    if batch:
+        yield batch, consumed
+
+
+def _copy_text(value: Any) -> str:
+    """One value in PostgreSQL ``COPY ... (FORMAT text)`` syntax."""
+    if value is None:
+        return "\\N"
+    if isinstance(value, bytes):
+        return "\\\\x" + value.hex()
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, datetime):
+        return value.isoformat()
+    text = str(value)
+    return text.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def _copy_rows(conn: Connection, table: Table, rows: list[dict[str, Any]]) -> None:
+    dialect = conn.dialect
+    columns = list(table.columns)
+    binders = [
+        (lambda v, t=column.type: t.process_bind_param(v, dialect))
+        if isinstance(column.type, TypeDecorator)
+        else None
+        for column in columns
+    ]
+    buf = io.StringIO()
+    for row in rows:
+        values = [row[c.name] if b is None else b(row[c.name]) for c, b in zip(columns, binders)]
+        buf.write("\t".join(_copy_text(v) for v in values))
+        buf.write("\n")
+    buf.seek(0)
+    names = ", ".join(dialect.identifier_preparer.quote(c.name) for c in columns)
+    quoted_table = dialect.identifier_preparer.format_table(table)
+    with conn.connection.cursor() as cur:
+        cur.copy_expert(f"COPY {quoted_table} ({names}) FROM STDIN", buf)
+
+
+def _insert_rows(
+    conn: Connection, table: Table, rows: list[dict[str, Any]], ignore_conflicts: bool
+) -> None:
+    dialect = conn.dialect.name
+    if ignore_conflicts and dialect in ("postgresql", "sqlite"):
+        module = postgresql if dialect == "postgresql" else sqlite
+        conn.execute(module.insert(table).on_conflict_do_nothing(), rows)
+    elif dialect == "postgresql" and conn.dialect.driver == "psycopg2":
+        _copy_rows(conn, table, rows)
+    else:
+        conn.execute(insert(table), rows)
+
+
+def import_rows(
+    engine: Engine,
+    lines: Iterator[str],
+    checkpoint: Checkpoint,
+    batch_size: int = 10_000,
+    router: Optional[ShardRouter] = None,
+) -> int:
+    """Insert the records of a dump, resuming after ``checkpoint``; returns lines consumed.
+
+    With ``router``, each row goes to the shard that owns its user instead of ``engine``.
+    """
+    resumed = checkpoint.records > 0
+    done = checkpoint.records
+    for batch, consumed in _read_batches(lines, checkpoint.records, batch_size):
+        # Group by target engine and table, keeping dump order within each group
+        groups: dict[tuple[Engine, str], list[dict[str, Any]]] = defaultdict(list)
+        for record in batch:
+            table = _BY_NAME[record["table"]]
+            row = _decode_row(table, record)
+            target = engine
+            if router is not None:
+                target = router.engines[
+                    router.owner(row["id"] if table.name == "user" else row["user_id"])
+                ]
+            groups[(target, table.name)].append(row)
+        for (target, name), rows in groups.items():
+            with target.begin() as conn:
+                _insert_rows(conn, _BY_NAME[name], rows, ignore_conflicts=resumed)
+        done = consumed
+        checkpoint.save(done)
+        resumed = False
+        logger.info("import_batch_done", records=done)
+    return done
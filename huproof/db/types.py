@@ -0,0 +1,96 @@
+"""Column types for the optional compact storage schema.
+
+With ``DB_COMPACT_STORAGE`` on, identifiers are stored as 16-byte UUIDs
+(native ``uuid`` on PostgreSQL, a 16-byte blob elsewhere) instead of
+36-character strings, and field elements such as ``commitment_c`` as fixed
+32-byte big-endian values instead of decimal strings of up to 78 digits.
+Values are converted at the column boundary, so models and the API keep
+using strings.
+
+The flag decides the physical column type when tables are created, so it
+must not be flipped on an existing database without migrating its data.
+"""
+
+import uuid
+from typing import Any, Optional
+
+from sqlalchemy import LargeBinary
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.engine import Dialect
+from sqlalchemy.types import TypeDecorator, TypeEngine
+from sqlmodel import AutoString
+
+from ..config.settings import get_settings
+
+FIELD_ELEMENT_BYTES = 32
+
+# Bound for identifiers that cannot be a UUID: matches no stored 16-byte value
+_NO_MATCH = b""
+
+
+def compact_storage() -> bool:
+    return get_settings().db_compact_storage
+
+
+def is_field_element(value: str) -> bool:
+    """Whether ``value`` is a canonical decimal that fits in 32 bytes."""
+    return (
+        value.isdigit()
+        and str(int(value)) == value
+        and int(value).bit_length() <= FIELD_ELEMENT_BYTES * 8
+    )
+
+
+class CompactUUID(TypeDecorator):
+    """UUID string in Python; 16 bytes in compact storage, a plain string otherwise."""
+
+    impl = AutoString
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect: Dialect) -> TypeEngine[Any]:
+        if not compact_storage():
+            return dialect.type_descriptor(AutoString())
+        if dialect.name == "postgresql":
+            return dialect.type_descriptor(postgresql.UUID(as_uuid=True))
+        return dialect.type_descriptor(LargeBinary(16))
+
+    def process_bind_param(self, value: Optional[str], dialect: Dialect) -> Any:
+        if value is None or not compact_storage():
+            return value
+        try:
+            parsed = uuid.UUID(value)
+        except (ValueError, AttributeError, TypeError):
+            # Lookups by arbitrary client input (e.g. ?user_id=...) must simply not match
+            return None if dialect.name == "postgresql" else _NO_MATCH
+        return parsed if dialect.name == "postgresql" else parsed.bytes
+
+    def process_result_value(self, value: Any, dialect: Dialect) -> Optional[str]:
+        if value is None or not compact_storage():
+            return value
+        if isinstance(value, uuid.UUID):
+            return str(value)
+        return str(uuid.UUID(bytes=bytes(value)))
+
+
+class FieldElement(TypeDecorator):
+    """Decimal string in Python; 32-byte big-endian in compact storage."""
+
+    impl = AutoString
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect: Dialect) -> TypeEngine[Any]:
+        if not compact_storage():
+            return dialect.type_descriptor(AutoString())
+        return dialect.type_descriptor(LargeBinary(FIELD_ELEMENT_BYTES))
+
+    def process_bind_param(self, value: Optional[str], dialect: Dialect) -> Any:
+        if value is None or not compact_storage():
+            return value
+        if not is_field_element(value):
+            raise ValueError("field element must be a canonical non-negative integer below 2**256")
+        return int(value).to_bytes(FIELD_ELEMENT_BYTES, "big")
+
+    def process_result_value(self, value: Any, dialect: Dialect) -> Optional[str]:
+        if value is None or not compact_storage():
+            return value
+        return str(int.from_bytes(bytes(value), "big"))
@@ -1,64 +1,66 @@
 """Test fixtures and utilities."""
 
 import os
-import tempfile
-from typing import Generator
+from typing import Callable, Generator
 
+import httpx
 import pytest
 from fastapi.testclient import TestClient
 
+# Settings are needed at import/DDL time by some modules, not just by the app
+os.environ.setdefault("APP_SECRET", "test-secret")
+os.environ.setdefault("BYPASS_ZK_VERIFY", "1")
+os.environ.setdefault("ORIGIN", "http://localhost:5173")
+
+
+def _reset_db_globals() -> None:
+    """Drop the cached engines and writer so the next use connects to ``settings.db_url``."""
+    from huproof.db import commitments as db_commitments
+    from huproof.db import session as db_session
+
+    if db_session._sqlite_writer is not None:
+        db_session._sqlite_writer.close()
+    if db_session._engine is not None:
+        db_session._engine.dispose()
+    db_session._engine = None
+    db_session._async_engine = None
+    db_session._sqlite_writer = None
+    db_session._replicas = None
+    db_session._shards = None
+    db_commitments._cache = None
+
 
 @pytest.fixture(scope="function")
-def test_client() -> Generator[TestClient, None, None]:
-    """Create a test client with initialized database."""
-    # Set test environment variables BEFORE importing app
-    os.environ.setdefault("APP_SECRET", "test-secret")
-    os.environ.setdefault("BYPASS_ZK_VERIFY", "1")
-    os.environ.setdefault("ORIGIN", "http://localhost:5173")
-    
-    # Use unique temp file for each test
-    db_file = tempfile.NamedTemporaryFile(delete=False, suffix=".db")
-    db_path = db_file.name
-    db_file.close()
-    os.environ["DB_URL"] = f"sqlite:///{db_path}"
-    
-    # Import after env vars are set
+def test_client(tmp_path) -> Generator[TestClient, None, None]:
+    """Create a test client on a fresh database file under ``tmp_path``.
+
+    Settings are cached, so the database URL is set on them directly (and on
+    ``DB_URL`` for code that builds its own ``Settings``) and restored after
+    the test; nothing is written to the default ``./dev.db``.
+    """
     from huproof.app import app
-    from huproof.db.session import init_db
-    
-    # Force reinitialize the engine with new DB URL
-    from sqlalchemy import create_engine
     from huproof.config.settings import get_settings
-    from huproof.db import session as db_session
-    
+    from huproof.core.ratelimit import limiter
+    from huproof.db.session import init_db
+
     settings = get_settings()
-    
-    # Dispose old engine if it exists and reset global
-    if hasattr(db_session, '_engine') and db_session._engine is not None:
-        try:
-            db_session._engine.dispose()
-        except Exception:
-            pass
-    db_session._engine = None
-    
-    # Initialize database (will create new engine with new DB URL)
+    db_url = f"sqlite:///{tmp_path}/test.db"
+    previous = (settings.db_url, os.environ.get("DB_URL"))
+    settings.db_url = os.environ["DB_URL"] = db_url
+    _reset_db_globals()
+
+    # Rate-limit counters would otherwise leak between tests
+    limiter.reset()
+
     init_db()
-    
-    # Create test client
-    client = TestClient(app)
-    
-    yield client
-    
-    # Cleanup
-    try:
-        # Close all connections
-        if hasattr(db_session, '_engine') and db_session._engine is not None:
-            db_session._engine.dispose()
-        # Remove database file
-        if os.path.exists(db_path):
-            os.remove(db_path)
-    except Exception:
-        pass
+    yield TestClient(app)
+
+    _reset_db_globals()
+    settings.db_url = previous[0]
+    if previous[1] is None:
+        os.environ.pop("DB_URL", None)
+    else:
+        os.environ["DB_URL"] = previous[1]
 
 
 @pytest.fixture
@@ -66,3 +68,35 @@ def test_headers() -> dict[str, str]:
     """Default test headers with Origin."""
     return {"Origin": "http://localhost:5173"}
 
+
+@pytest.fixture
+def enroll_and_login(
+    test_client: TestClient, test_headers: dict[str, str]
+) -> Callable[[], httpx.Response]:
+    """Enroll a new user and log in; the callable returns the login finish response."""
+    client, headers = test_client, test_headers
+
+    def run() -> httpx.Response:
+        start = client.get("/api/enroll/start", headers=headers).json()
+        inputs = {
+            "nonce": start["nonce"],
+            "origin_hash": start["origin_hash"],
+            "tau": start["tau"],
+            "timestamp": start["timestamp"],
+            "C": "123456789",
+            "sig": "987654321",
+        }
+        proof = {"pi_a": [], "pi_b": [], "pi_c": []}
+        enrolled = client.post(
+            "/api/enroll/finish",
+            json={"commitment": "123456789", "public_inputs": inputs, "proof": proof},
+            headers=headers,
+        )
+        user_id = enrolled.json()["user_id"]
+        login = client.get(f"/api/login/start?user_id={user_id}", headers=headers).json()
+        inputs = {**inputs, "nonce": login["nonce"], "timestamp": login["timestamp"]}
+        return client.post(
+            "/api/login/finish", json={"public_inputs": inputs, "proof": proof}, headers=headers
+        )
+
+    return run
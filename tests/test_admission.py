@@ -0,0 +1,123 @@
+"""Tests for adaptive admission control."""
+
+from typing import Generator
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select
+
+from huproof.config.settings import get_settings
+from huproof.core.admission import FINISH, START, AdmissionController, controller, flow_priority
+from huproof.core.metrics import get_metric_stats
+from huproof.db.models import NonceRecord
+from huproof.db.session import get_engine
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def limits() -> Generator:
+    settings = get_settings()
+    values = {
+        "admission_max_in_flight": 10,
+        "admission_max_verify_queue": 4,
+        "admission_p99_target_ms": 1000.0,
+    }
+    previous = {name: getattr(settings, name) for name in values}
+    for name, value in values.items():
+        setattr(settings, name, value)
+    yield settings
+    for name, value in previous.items():
+        setattr(settings, name, value)
+
+
+def test_flow_priority() -> None:
+    assert flow_priority("/api/login/start") == START
+    assert flow_priority("/api/enroll/finish") == FINISH
+    assert flow_priority("/api/logout") is None
+    assert flow_priority("/metrics") is None
+
+
+def test_starts_are_shed_before_finishes(limits) -> None:
+    admission = AdmissionController(clock=_Clock())
+    admission.in_flight = 7
+    assert admission.admit(START) and admission.admit(FINISH)
+    admission.in_flight = 8
+    assert not admission.admit(START) and admission.admit(FINISH)
+    admission.in_flight = 10
+    assert not admission.admit(FINISH)
+
+    admission.in_flight = 0
+    with (
+        admission.verification(),
+        admission.verification(),
+        admission.verification(),
+        admission.verification(),
+    ):
+        assert admission.load() == 1.0
+    assert admission.verifying == 0 and admission.load() == 0.0
+
+    stats = get_metric_stats("admission_rejections")
+    assert stats is not None
+    assert {s["labels"]["priority"] for s in stats["series"]} >= {START, FINISH}
+
+
+def test_p99_latency_window(limits) -> None:
+    clock = _Clock()
+    admission = AdmissionController(clock=clock)
+    for _ in range(99):
+        admission.observe(10.0)
+    admission.observe(2500.0)
+    admission.observe(2500.0)
+    assert admission.p99_ms() == 2500.0
+    assert not admission.admit(START) and not admission.admit(FINISH)
+    assert admission.retry_after_s() == 3
+    # Old samples leave the window
+    clock.now += limits.admission_window_s + 1
+    assert admission.p99_ms() == 0.0 and admission.admit(START)
+
+
+def _nonce_count() -> int:
+    with Session(get_engine()) as session:
+        return len(session.exec(select(NonceRecord)).all())
+
+
+def test_overload_rejects_start_before_nonce(
+    test_client: TestClient, test_headers: dict[str, str], limits
+) -> None:
+    start = test_client.get("/api/enroll/start", headers=test_headers).json()
+    controller.in_flight += 9
+    try:
+        before = _nonce_count()
+        resp = test_client.get("/api/enroll/start", headers=test_headers)
+        assert resp.status_code == 503
+        assert int(resp.headers["retry-after"]) >= 1
+        assert resp.headers["access-control-allow-origin"] == test_headers["Origin"]
+        assert _nonce_count() == before
+
+        # The flow started before the overload can still finish
+        inputs = {
+            "nonce": start["nonce"],
+            "origin_hash": start["origin_hash"],
+            "tau": start["tau"],
+            "timestamp": start["timestamp"],
+            "C": "123456789",
+            "sig": "987654321",
+        }
+        payload = {
+            "commitment": "123456789",
+            "public_inputs": inputs,
+            "proof": {"pi_a": [], "pi_b": [], "pi_c": []},
+        }
+        resp = test_client.post("/api/enroll/finish", json=payload, headers=test_headers)
+        assert resp.status_code == 200
+        assert test_client.get("/health").status_code == 200
+    finally:
+        controller.in_flight -= 9
+    assert test_client.get("/api/enroll/start", headers=test_headers).status_code == 200
@@ -0,0 +1,102 @@
+"""Tests for the async database layer and async handlers."""
+
+from typing import Generator
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from huproof.db.session import async_url
+
+pytest.importorskip("aiosqlite")
+
+
+def test_async_url() -> None:
+    """Sync URLs map onto their async drivers."""
+    assert async_url("sqlite:///./dev.db") == "sqlite+aiosqlite:///./dev.db"
+    assert async_url("postgresql://u:p@h/db") == "postgresql+asyncpg://u:p@h/db"
+    assert async_url("postgresql+psycopg2://u:p@h/db") == "postgresql+asyncpg://u:p@h/db"
+    with pytest.raises(ValueError):
+        async_url("mysql://u:p@h/db")
+
+
+@pytest.fixture
+def async_client(test_client: TestClient) -> Generator[TestClient, None, None]:
+    """Client for an app serving the async routers on the test database."""
+    from huproof.api import enroll, login, logout
+    from huproof.core.guard import GuardMiddleware
+    from huproof.core.ratelimit import setup_rate_limit_handler
+    from huproof.db import session as db_session
+
+    app = FastAPI()
+    setup_rate_limit_handler(app)
+    app.add_middleware(GuardMiddleware)
+    app.include_router(enroll.async_router, prefix="/api/enroll")
+    app.include_router(login.async_router, prefix="/api/login")
+    app.include_router(logout.async_router, prefix="/api")
+
+    db_session._async_engine = None
+    with TestClient(app) as client:
+        yield client
+    db_session._async_engine = None
+
+
+def test_async_enroll_login_logout(async_client: TestClient, test_headers: dict[str, str]) -> None:
+    """Full enroll → login → logout flow through the async handlers."""
+    start = async_client.get("/api/enroll/start", headers=test_headers).json()
+    public_inputs = {
+        "nonce": start["nonce"],
+        "origin_hash": start["origin_hash"],
+        "tau": start["tau"],
+        "timestamp": start["timestamp"],
+        "C": "123456789",
+        "sig": "987654321",
+    }
+    proof = {"pi_a": [], "pi_b": [], "pi_c": []}
+    resp = async_client.post(
+        "/api/enroll/finish",
+        json={"commitment": "123456789", "public_inputs": public_inputs, "proof": proof},
+        headers=test_headers,
+    )
+    assert resp.status_code == 200
+    user_id = resp.json()["user_id"]
+
+    resp = async_client.get(f"/api/login/start?user_id={user_id}", headers=test_headers)
+    assert resp.status_code == 200
+    login_data = resp.json()
+    assert login_data["commitment"] == "123456789"
+
+    public_inputs = {
+        **public_inputs,
+        "nonce": login_data["nonce"],
+        "timestamp": login_data["timestamp"],
+    }
+    resp = async_client.post(
+        "/api/login/finish",
+        json={"public_inputs": public_inputs, "proof": proof},
+        headers=test_headers,
+    )
+    assert resp.status_code == 200
+    token = resp.json()["token"]
+
+    # Nonce is single-use
+    resp = async_client.post(
+        "/api/login/finish",
+        json={"public_inputs": public_inputs, "proof": proof},
+        headers=test_headers,
+    )
+    assert resp.status_code == 400
+
+    resp = async_client.post(
+        "/api/logout", headers={**test_headers, "Authorization": f"Bearer {token}"}
+    )
+    assert resp.status_code == 200
+    assert resp.json() == {"success": True}
+
+
+def test_async_login_start_unknown_user(
+    async_client: TestClient, test_headers: dict[str, str]
+) -> None:
+    """Unknown users get 404 from the async handler too."""
+    resp = async_client.get("/api/login/start?user_id=nonexistent", headers=test_headers)
+    assert resp.status_code == 404
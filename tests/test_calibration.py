@@ -1,5 +1,10 @@
 """Tests for calibration utilities."""
 
+import random
+
+import pytest
+
+from huproof.core import calibration
 from huproof.core.calibration import (
     calculate_l1_distance,
     average_features,
@@ -58,3 +63,97 @@ def test_calculate_template_quality() -> None:
     assert "consistency_score" in quality
     assert 0 <= quality["consistency_score"] <= 1
 
+
+
+def _as_list(value):
+    return value.tolist() if hasattr(value, "tolist") else value
+
+
+def _batch(users: int = 200, samples: int = 6, features: int = 64, seed: int = 7):
+    rng = random.Random(seed)
+    data = [
+        [[rng.randrange(0, 500) for _ in range(features)] for _ in range(samples)]
+        for _ in range(users)
+    ]
+    counts = [rng.randrange(1, samples + 1) for _ in range(users)]
+    return data, counts
+
+
+def _check_batch_matches_scalar(data, counts) -> None:
+    templates = calibration.batch_templates(data, counts)
+    taus = calibration.batch_adaptive_tau(templates, data, counts, base_tau=10, multiplier=1.5)
+    quality = calibration.batch_template_quality(templates, data, counts)
+    distances = calibration.batch_distances(templates, data, counts)
+    for u, (user, count) in enumerate(zip(data, counts)):
+        samples = user[:count]
+        template = average_features(samples)
+        assert _as_list(templates)[u] == template
+        assert _as_list(taus)[u] == calculate_adaptive_tau(
+            template, samples, base_tau=10, multiplier=1.5
+        )
+        assert quality[u] == calculate_template_quality(template, samples)
+        assert _as_list(distances)[u][:count] == [
+            calculate_l1_distance(template, s) for s in samples
+        ]
+
+
+def test_batch_matches_scalar() -> None:
+    data, counts = _batch()
+    _check_batch_matches_scalar(data, counts)
+    matrix = _as_list(
+        calibration.distance_matrix([u[0] for u in data[:20]], [u[1] for u in data[20:50]])
+    )
+    assert matrix[3][4] == calculate_l1_distance(data[3][0], data[24][1])
+    assert len(matrix) == 20 and len(matrix[0]) == 30
+
+
+def test_batch_without_numpy(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(calibration, "np", None)
+    data, counts = _batch(users=30)
+    _check_batch_matches_scalar(data, counts)
+    assert calibration.distance_matrix([[1, 2]], [[2, 2], [0, 0]]) == [[1, 3]]
+
+
+def test_batch_numpy_int16_arrays(monkeypatch: pytest.MonkeyPatch) -> None:
+    np = pytest.importorskip("numpy")
+    data, counts = _batch(users=50)
+    features = np.asarray(data, dtype=np.int16)
+    # Small blocks exercise the chunked distance matrix
+    monkeypatch.setattr(calibration, "BLOCK_ELEMENTS", 1000)
+    matrix = calibration.distance_matrix(features[:, 0], features[:, 1])
+    assert matrix.shape == (50, 50)
+    assert matrix[5, 7] == calculate_l1_distance(data[5][0], data[7][1])
+    templates = calibration.batch_templates(features, counts)
+    assert templates.dtype == np.int64
+    assert calibration.batch_adaptive_tau(templates, features, counts).tolist() == [
+        calculate_adaptive_tau(average_features(u[:c]), u[:c]) for u, c in zip(data, counts)
+    ]
+
+
+def test_batch_edge_cases() -> None:
+    with pytest.raises(ValueError):
+        calibration.batch_templates([[[1, 2]]], counts=[0])
+    with pytest.raises(ValueError):
+        calibration.batch_templates([[[1, 2]]], counts=[1, 1])
+    # A user without samples gets the base threshold and empty quality, like the scalar functions
+    data = [[[1, 2], [3, 4]], [[0, 0], [0, 0]]]
+    taus = _as_list(
+        calibration.batch_adaptive_tau([[2, 3], [0, 0]], data, counts=[2, 0], base_tau=50)
+    )
+    assert taus == [50, 50]
+    quality = calibration.batch_template_quality([[2, 3], [0, 0]], data, counts=[2, 0])
+    assert quality[1] == calculate_template_quality([0, 0], [])
+
+
+def test_adaptive_tau_sweep_matches_scalar() -> None:
+    data, counts = _batch(users=50)
+    templates = calibration.batch_templates(data, counts)
+    multipliers = [0.0, 1.5, 3.0]
+    sweep = _as_list(
+        calibration.adaptive_tau_sweep(
+            templates, data, counts, base_tau=50, multipliers=multipliers
+        )
+    )
+    for m, row in zip(multipliers, sweep):
+        for template, user, count, tau in zip(_as_list(templates), data, counts, row):
+            assert tau == calculate_adaptive_tau(template, user[:count], base_tau=50, multiplier=m)
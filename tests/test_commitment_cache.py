@@ -0,0 +1,159 @@
+"""Tests for the active-commitment cache."""
+
+import time
+from typing import Optional
+
+import pytest
+from fastapi.testclient import TestClient
+
+from huproof.db.commitments import CachedCommitment, CommitmentCache
+
+
+def _commitment(user_id: str, origin: str = "o") -> CachedCommitment:
+    return CachedCommitment(
+        id=f"c-{user_id}", user_id=user_id, origin=origin, commitment_c="1", tau=400
+    )
+
+
+def test_cache_lru_bound() -> None:
+    """Least recently used entries are evicted beyond maxsize."""
+    cache = CommitmentCache(maxsize=2, ttl_s=60)
+    cache.put(_commitment("a"))
+    cache.put(_commitment("b"))
+    assert cache.get("a", "o") is not None  # a is now most recent
+    cache.put(_commitment("c"))
+    assert len(cache) == 2
+    assert cache.get("b", "o") is None
+    assert cache.get("a", "o") is not None
+
+
+def test_cache_ttl() -> None:
+    """Entries expire after the TTL."""
+    cache = CommitmentCache(maxsize=10, ttl_s=0.01)
+    cache.put(_commitment("a"))
+    time.sleep(0.02)
+    assert cache.get("a", "o") is None
+
+
+def test_cache_discard_all_origins() -> None:
+    """Discarding without an origin drops every origin for the user."""
+    cache = CommitmentCache(maxsize=10, ttl_s=60)
+    cache.put(_commitment("a", "o1"))
+    cache.put(_commitment("a", "o2"))
+    cache.put(_commitment("b", "o1"))
+    cache.discard("a")
+    assert cache.get("a", "o1") is None and cache.get("a", "o2") is None
+    assert cache.get("b", "o1") is not None
+
+
+def test_cache_discard_drops_negative_entry() -> None:
+    """An invalidation for a pair also forgets that it was missing."""
+    cache = CommitmentCache(maxsize=10, ttl_s=60, negative_maxsize=10)
+    cache.put_missing("a", "o")
+    cache.put_missing("b", "o")
+    cache.discard("a", "o")
+    assert not cache.is_missing("a", "o") and cache.is_missing("b", "o")
+    cache.discard("b")
+    assert not cache.is_missing("b", "o")
+
+
+def _enroll(client: TestClient, headers: dict[str, str]) -> str:
+    data = client.get("/api/enroll/start", headers=headers).json()
+    payload = {
+        "commitment": "123456789",
+        "public_inputs": {
+            "nonce": data["nonce"],
+            "origin_hash": data["origin_hash"],
+            "tau": data["tau"],
+            "timestamp": data["timestamp"],
+            "C": "123456789",
+            "sig": "987654321",
+        },
+        "proof": {"pi_a": [], "pi_b": [], "pi_c": []},
+    }
+    resp = client.post("/api/enroll/finish", json=payload, headers=headers)
+    assert resp.status_code == 200
+    return resp.json()["user_id"]
+
+
+def test_enroll_writes_through_and_deactivation_invalidates(
+    test_client: TestClient, test_headers: dict[str, str]
+) -> None:
+    """Enrollment populates the cache; deactivation removes the entry on commit."""
+    from huproof.core.crypto import sha256_hex
+    from huproof.db.commitments import deactivate_commitments, get_commitment_cache
+    from huproof.db.session import session_scope
+
+    user_id = _enroll(test_client, test_headers)
+    origin_hash = sha256_hex(test_headers["Origin"])
+    cached = get_commitment_cache().get(user_id, origin_hash)
+    assert cached is not None and cached.commitment_c == "123456789"
+
+    with session_scope() as session:
+        deactivate_commitments(session, user_id)
+    assert get_commitment_cache().get(user_id, origin_hash) is None
+
+    resp = test_client.get(f"/api/login/start?user_id={user_id}", headers=test_headers)
+    assert resp.status_code == 404
+
+
+def test_enroll_notifies_other_workers(
+    test_client: TestClient, test_headers: dict[str, str], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Enrollment sends an invalidation so other workers drop a cached miss."""
+    from huproof.core.crypto import sha256_hex
+    from huproof.db import commitments
+
+    sent: list[tuple[str, Optional[str]]] = []
+    monkeypatch.setattr(
+        commitments, "_notify", lambda session, user_id, origin: sent.append((user_id, origin))
+    )
+    user_id = _enroll(test_client, test_headers)
+    assert sent == [(user_id, sha256_hex(test_headers["Origin"]))]
+
+
+def test_negative_cache_bound_and_write_through() -> None:
+    cache = CommitmentCache(maxsize=10, ttl_s=60, negative_maxsize=2)
+    cache.put_missing("a", "o")
+    cache.put_missing("b", "o")
+    assert cache.is_missing("a", "o")  # a is now most recent
+    cache.put_missing("c", "o")
+    assert not cache.is_missing("b", "o") and cache.is_missing("a", "o")
+    assert not cache.is_missing("a", "other-origin")
+    # A new commitment for the pair replaces the negative entry
+    cache.put(_commitment("a"))
+    assert not cache.is_missing("a", "o") and cache.get("a", "o") is not None
+    assert CommitmentCache(maxsize=10, ttl_s=60).is_missing("a", "o") is False
+
+
+def test_unknown_user_served_from_negative_cache(
+    test_client: TestClient, test_headers: dict[str, str]
+) -> None:
+    """Repeated login starts for a made-up id read the database once, like a known id."""
+    from sqlalchemy import event
+
+    from huproof.db.session import get_engine
+
+    known = _enroll(test_client, test_headers)
+    statements: list[str] = []
+
+    def count(conn, cursor, statement, *args) -> None:
+        statements.append(statement)
+
+    event.listen(get_engine(), "before_cursor_execute", count)
+    try:
+        for user_id in ("made-up", known):
+            statements.clear()
+            test_client.get(f"/api/login/start?user_id={user_id}", headers=test_headers)
+            test_client.get(f"/api/login/start?user_id={user_id}", headers=test_headers)
+            reads = [
+                s
+                for s in statements
+                if "keystroke" in s.lower() and s.lstrip().upper().startswith("SELECT")
+            ]
+            # Enrollment wrote the known commitment through, so only the made-up id is read, once
+            assert len(reads) == (1 if user_id == "made-up" else 0), user_id
+    finally:
+        event.remove(get_engine(), "before_cursor_execute", count)
+    resp = test_client.get("/api/login/start?user_id=made-up", headers=test_headers)
+    assert resp.status_code == 404
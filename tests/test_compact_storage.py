@@ -0,0 +1,116 @@
+"""Tests for the compact binary storage schema (DB_COMPACT_STORAGE)."""
+
+import tempfile
+from typing import Generator
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from huproof.db.types import is_field_element
+
+
+def test_is_field_element() -> None:
+    assert is_field_element("0")
+    assert is_field_element(str(2**256 - 1))
+    assert not is_field_element(str(2**256))
+    assert not is_field_element("0123")
+    assert not is_field_element("-5")
+    assert not is_field_element("12a")
+
+
+@pytest.fixture
+def compact_client(test_client: TestClient) -> Generator[TestClient, None, None]:
+    """The test app on a fresh database created with compact storage."""
+    from huproof.config.settings import get_settings
+    from huproof.db import session as db_session
+
+    settings = get_settings()
+    previous = (settings.db_compact_storage, settings.db_url)
+    with tempfile.TemporaryDirectory() as tmp:
+        settings.db_compact_storage = True
+        settings.db_url = f"sqlite:///{tmp}/compact.db"
+        # Column types are resolved per engine, so a new engine is required
+        db_session.get_engine().dispose()
+        db_session._engine = None
+        db_session.init_db()
+        yield test_client
+        db_session.get_engine().dispose()
+        db_session._engine = None
+    settings.db_compact_storage, settings.db_url = previous
+
+
+def _enroll(client: TestClient, headers: dict[str, str], commitment: str) -> dict:
+    data = client.get("/api/enroll/start", headers=headers).json()
+    return client.post(
+        "/api/enroll/finish",
+        json={
+            "public_inputs": {
+                "nonce": data["nonce"],
+                "origin_hash": data["origin_hash"],
+                "tau": data["tau"],
+                "timestamp": data["timestamp"],
+                "C": commitment,
+                "sig": "987654321",
+            },
+            "proof": {"pi_a": [], "pi_b": [], "pi_c": []},
+            "commitment": commitment,
+        },
+        headers=headers,
+    )
+
+
+def test_round_trip(compact_client: TestClient, test_headers: dict[str, str]) -> None:
+    commitment = str(2**253 + 12345)
+    response = _enroll(compact_client, test_headers, commitment)
+    assert response.status_code == 200
+    user_id = response.json()["user_id"]
+
+    start = compact_client.get(f"/api/login/start?user_id={user_id}", headers=test_headers)
+    assert start.status_code == 200
+    assert start.json()["commitment"] == commitment
+
+    from huproof.db.session import get_engine
+
+    with get_engine().connect() as conn:
+        stored = conn.execute(text("SELECT user_id, commitment_c FROM keystrokecommitment")).one()
+    assert len(stored.user_id) == 16
+    assert len(stored.commitment_c) == 32
+
+
+def test_non_canonical_commitment_rejected(
+    compact_client: TestClient, test_headers: dict[str, str]
+) -> None:
+    assert _enroll(compact_client, test_headers, str(2**256)).status_code == 400
+    assert _enroll(compact_client, test_headers, "007").status_code == 400
+
+
+@pytest.mark.parametrize(
+    "user_id", ["nonexistent-user-id", "' OR '1'='1", "00000000-0000-0000-0000-000000000000"]
+)
+def test_unknown_user_id_not_found(
+    compact_client: TestClient, test_headers: dict[str, str], user_id: str
+) -> None:
+    response = compact_client.get(
+        "/api/login/start", params={"user_id": user_id}, headers=test_headers
+    )
+    assert response.status_code == 404
+
+
+def test_table_sizes(test_client: TestClient) -> None:
+    from huproof.db.session import get_engine
+    from huproof.db.stats import table_sizes
+
+    sizes = table_sizes(get_engine())
+    assert sizes["keystrokecommitment"] > 0
+    assert "user" in sizes
+
+
+def test_table_sizes_unsupported_dialect() -> None:
+    from sqlalchemy import create_mock_engine
+
+    from huproof.db.stats import table_sizes
+
+    engine = create_mock_engine("mysql://", executor=lambda *args: None)
+    with pytest.raises(ValueError, match="mysql dialect"):
+        table_sizes(engine)  # type: ignore[arg-type]
@@ -0,0 +1,133 @@
+"""Tests for database engine configuration and session scopes."""
+
+import os
+import secrets
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from huproof.config.settings import Settings
+from huproof.db.session import _engine_kwargs
+
+
+def _settings(**env: str) -> Settings:
+    return Settings(APP_SECRET="test-secret", **env)  # type: ignore[arg-type]
+
+
+def test_engine_kwargs_sqlite() -> None:
+    """SQLite keeps the default pool and gets no statement timeout."""
+    kwargs = _engine_kwargs(_settings(DB_URL="sqlite:///./x.db"))
+    assert kwargs["connect_args"] == {"check_same_thread": False}
+    assert "pool_size" not in kwargs
+
+
+def test_engine_kwargs_postgres() -> None:
+    """PostgreSQL gets the tuned pool and a server-side statement timeout."""
+    kwargs = _engine_kwargs(
+        _settings(
+            DB_URL="postgresql://u:p@localhost/db",
+            DB_POOL_SIZE="7",
+            DB_MAX_OVERFLOW="3",
+            DB_POOL_RECYCLE_S="60",
+            DB_STATEMENT_TIMEOUT_MS="250",
+        )
+    )
+    assert kwargs["pool_size"] == 7
+    assert kwargs["max_overflow"] == 3
+    assert kwargs["pool_recycle"] == 60
+    assert kwargs["pool_pre_ping"] is True
+    assert kwargs["connect_args"] == {"options": "-c statement_timeout=250"}
+
+
+def test_read_session_does_not_commit(test_client: TestClient) -> None:
+    """Writes made through the read-only scope are discarded."""
+    from huproof.db.models import User
+    from huproof.db.session import read_session_scope, session_scope
+
+    with read_session_scope() as s:
+        s.add(User(id="read-only-user"))
+    with session_scope() as s:
+        assert s.get(User, "read-only-user") is None
+
+
+def test_login_start_holds_one_connection(
+    test_client: TestClient, test_headers: dict[str, str]
+) -> None:
+    """Without replicas, login_start reads and adds its nonce through one primary connection."""
+    from sqlalchemy import event
+
+    from huproof.db import commitments
+    from huproof.db.session import get_engine
+
+    data = test_client.get("/api/enroll/start", headers=test_headers).json()
+    inputs = {
+        **{k: data[k] for k in ("nonce", "origin_hash", "tau", "timestamp")},
+        "C": "42",
+        "sig": "1",
+    }
+    proof = {"pi_a": [], "pi_b": [], "pi_c": []}
+    enrolled = test_client.post(
+        "/api/enroll/finish",
+        json={"commitment": "42", "public_inputs": inputs, "proof": proof},
+        headers=test_headers,
+    )
+    user_id = enrolled.json()["user_id"]
+    commitments.get_commitment_cache().clear()
+
+    checkouts = 0
+
+    def checkout(*args: object) -> None:
+        nonlocal checkouts
+        checkouts += 1
+
+    pool = get_engine().pool
+    event.listen(pool, "checkout", checkout)
+    try:
+        resp = test_client.get(f"/api/login/start?user_id={user_id}", headers=test_headers)
+    finally:
+        event.remove(pool, "checkout", checkout)
+    assert resp.status_code == 200
+    assert checkouts == 1
+
+
+def test_nonce_consumed_once(test_client: TestClient) -> None:
+    """Two sessions that both read a nonce as unconsumed: only the first consumes it."""
+    from sqlmodel import select
+
+    from huproof.api.common import new_nonce_record
+    from huproof.db.models import NoncePurpose, NonceRecord
+    from huproof.db.session import consume_nonce, session_scope
+
+    nonce = secrets.token_urlsafe(16)
+    record, now = new_nonce_record(nonce, NoncePurpose.enroll, "o")
+    with session_scope() as s:
+        s.add(record)
+    query = select(NonceRecord).where(NonceRecord.value == nonce)
+    with session_scope() as second:
+        b = second.exec(query).one()
+        with session_scope() as first:
+            assert consume_nonce(first, first.exec(query).one(), now)
+        assert b.consumed_at is None
+        assert not consume_nonce(second, b, now)
+
+
+@pytest.mark.skipif(not os.environ.get("TEST_POSTGRES_URL"), reason="TEST_POSTGRES_URL not set")
+def test_postgres_profile(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Production profile against a local PostgreSQL (set TEST_POSTGRES_URL)."""
+    from huproof.config.settings import get_settings
+    from huproof.db import session as db_session
+
+    monkeypatch.setenv("DB_URL", os.environ["TEST_POSTGRES_URL"])
+    monkeypatch.setenv("DB_STATEMENT_TIMEOUT_MS", "1234")
+    get_settings.cache_clear()
+    monkeypatch.setattr(db_session, "_engine", None)
+    try:
+        db_session.init_db()
+        with db_session.session_scope() as s:
+            assert s.exec(text("SHOW statement_timeout")).one()[0] == "1234ms"
+        with db_session.read_session_scope() as s:
+            assert s.exec(text("SHOW transaction_read_only")).one()[0] == "on"
+    finally:
+        db_session.get_engine().dispose()
+        get_settings.cache_clear()
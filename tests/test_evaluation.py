@@ -0,0 +1,196 @@
+"""Tests for the FRR/FAR/EER evaluation."""
+
+import json
+import random
+
+import pytest
+
+from huproof import cli
+from huproof.core import calibration, evaluation
+from huproof.core.calibration import average_features, calculate_adaptive_tau, calculate_l1_distance
+from huproof.core.evaluation import (
+    Evaluation,
+    equal_error_rate,
+    evaluate,
+    parse_sweep,
+    read_samples,
+)
+
+TAUS = list(range(0, 3001, 50))
+MULTIPLIERS = [0.0, 0.5, 1.0, 2.0, 4.0]
+
+
+def _users(
+    count: int, samples: int, seed: int, prefix: str = "u", features: int = 64, noise: float = 8.0
+):
+    """Users with a base vector each and noisy samples around it, as in test_synthetic_features."""
+    rng = random.Random(seed)
+    users = []
+    for i in range(count):
+        base = [rng.randint(200, 800) for _ in range(features)]
+        noisy = [
+            [max(0, min(4095, int(x + rng.gauss(0, noise)))) for x in base] for _ in range(samples)
+        ]
+        users.append((f"{prefix}{i}", noisy))
+    return users
+
+
+def _brute_force(genuine, impostor, enroll: int, base_tau: int = 400):
+    """Accepted genuine and impostor comparisons per tau and multiplier, one at a time."""
+    enrolled = {}
+    gen_tau, gen_mult, gen_total = [0] * len(TAUS), [0] * len(MULTIPLIERS), 0
+    for user, samples in genuine:
+        if len(samples) < enroll:
+            continue
+        template = average_features(samples[:enroll])
+        taus = [
+            calculate_adaptive_tau(template, samples[:enroll], base_tau, m) for m in MULTIPLIERS
+        ]
+        enrolled[user] = (template, taus)
+        for sample in samples[enroll:]:
+            d = calculate_l1_distance(template, sample)
+            gen_total += 1
+            gen_tau = [n + (d <= tau) for n, tau in zip(gen_tau, TAUS)]
+            gen_mult = [n + (d <= tau) for n, tau in zip(gen_mult, taus)]
+    imp_tau, imp_mult, imp_total = [0] * len(TAUS), [0] * len(MULTIPLIERS), 0
+    for owner, samples in impostor:
+        for sample in samples:
+            for user, (template, taus) in enrolled.items():
+                if user == owner:
+                    continue
+                d = calculate_l1_distance(template, sample)
+                imp_total += 1
+                imp_tau = [n + (d <= tau) for n, tau in zip(imp_tau, TAUS)]
+                imp_mult = [n + (d <= tau) for n, tau in zip(imp_mult, taus)]
+    return gen_tau, gen_mult, gen_total, imp_tau, imp_mult, imp_total
+
+
+def _check_matches_brute_force(batch_size: int) -> dict:
+    genuine = _users(30, 8, seed=1) + [("short", _users(1, 3, seed=2)[0][1])]
+    # Impostors include samples of enrolled users, which are not compared with their own template
+    impostor = _users(12, 3, seed=3, prefix="x") + [("u4", _users(1, 2, seed=4)[0][1])]
+    report = evaluate(genuine, impostor, TAUS, MULTIPLIERS, enroll=5, batch_size=batch_size)
+    gen_tau, gen_mult, gen_total, imp_tau, imp_mult, imp_total = _brute_force(
+        genuine, impostor, enroll=5
+    )
+
+    assert report["users"] == 30
+    assert report["skipped_users"] == 1
+    assert report["genuine_comparisons"] == gen_total == 30 * 3
+    assert report["impostor_comparisons"] == imp_total == 36 * 30 + 2 * 29
+    for point, accepted, rejected in zip(report["tau"]["points"], imp_tau, gen_tau):
+        assert point["far"] == round(accepted / imp_total, 6)
+        assert point["frr"] == round(1 - rejected / gen_total, 6)
+    for point, accepted, rejected in zip(report["multiplier"]["points"], imp_mult, gen_mult):
+        assert point["far"] == round(accepted / imp_total, 6)
+        assert point["frr"] == round(1 - rejected / gen_total, 6)
+    return report
+
+
+def test_evaluate_matches_brute_force() -> None:
+    report = _check_matches_brute_force(batch_size=7)
+    points = report["tau"]["points"]
+    assert points[0]["frr"] == 1.0 and points[0]["far"] == 0.0
+    assert 0.0 <= report["tau"]["eer"]["rate"] < 0.05
+    assert report["tau"]["eer"]["tau"] > 0
+
+
+def test_evaluate_small_blocks(monkeypatch: pytest.MonkeyPatch) -> None:
+    # Blocks of a few comparisons give the same counts as whole ones
+    monkeypatch.setattr(calibration, "BLOCK_ELEMENTS", 200)
+    _check_matches_brute_force(batch_size=5)
+
+
+def test_evaluate_without_numpy(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(calibration, "np", None)
+    _check_matches_brute_force(batch_size=4)
+
+
+def test_evaluate_needs_comparisons() -> None:
+    with pytest.raises(ValueError, match="need genuine and impostor comparisons"):
+        evaluate(
+            _users(3, 5, seed=1), _users(2, 2, seed=2, prefix="x"), TAUS, MULTIPLIERS, enroll=5
+        )
+    with pytest.raises(ValueError, match="features"):
+        impostor = _users(2, 2, seed=2, prefix="x", features=32)
+        evaluate(_users(3, 6, seed=1), impostor, TAUS, MULTIPLIERS, enroll=5)
+
+
+def test_duplicate_genuine_users_rejected() -> None:
+    genuine = _users(2, 6, seed=7)
+    impostor = _users(2, 2, seed=2, prefix="x")
+    # Repeated after being enrolled, or after being skipped for having too few samples
+    skipped_then_repeated = [("short", genuine[0][1][:2]), ("short", genuine[1][1])]
+    for records in (genuine + genuine[:1], skipped_then_repeated):
+        with pytest.raises(ValueError, match="more than once"):
+            evaluate(records, impostor, TAUS, MULTIPLIERS, enroll=5, batch_size=2)
+
+
+def test_det_points() -> None:
+    genuine, impostor = _users(10, 7, seed=5), _users(5, 2, seed=6, prefix="x")
+    report = evaluate(genuine, impostor, [0, 300, 400, 100000], [2.0], enroll=5)
+    points = report["tau"]["points"]
+    # No genuine attempt is accepted at 0, every impostor at 100000: no normal deviate for 0 or 1
+    assert points[0]["det"][1] is None and points[-1]["det"][0] is None
+    for point in points:
+        assert point["tar"] == round(1 - point["frr"], 6)
+        for rate, deviate in zip((point["far"], point["frr"]), point["det"]):
+            assert (deviate is None) == (rate in (0.0, 1.0))
+
+
+def test_equal_error_rate() -> None:
+    points = [
+        {"tau": 100, "far": 0.0, "frr": 0.5},
+        {"tau": 200, "far": 0.1, "frr": 0.3},
+        {"tau": 300, "far": 0.4, "frr": 0.0},
+    ]
+    # far - frr goes from -0.2 to 0.4: a third of the way
+    assert equal_error_rate(points, "tau") == {"rate": 0.2, "tau": 233.333333}
+    assert equal_error_rate(points[:2], "tau") is None
+    assert equal_error_rate(points[2:], "tau") is None
+    assert equal_error_rate([{"tau": 5, "far": 0.2, "frr": 0.2}], "tau") == {"rate": 0.2, "tau": 5}
+
+
+def test_parse_sweep() -> None:
+    assert parse_sweep("0:100:25", int) == [0, 25, 50, 75, 100]
+    assert parse_sweep("0:1:0.1") == [round(i / 10, 1) for i in range(11)]
+    assert parse_sweep("3,1,2,1") == [1.0, 2.0, 3.0]
+    for bad in ("0:10:0", "10:0:1", "a:b:c", "0:10", ",", f"0:{evaluation.MAX_SWEEP}:1"):
+        with pytest.raises(ValueError):
+            parse_sweep(bad, int)
+
+
+def test_read_samples() -> None:
+    lines = ['{"user": 1, "samples": [[1, 2]]}\n', "\n", '{"user": "b", "samples": []}\n']
+    assert list(read_samples(lines)) == [("1", [[1, 2]]), ("b", [])]
+    with pytest.raises(ValueError, match="line 2"):
+        list(read_samples(['{"user": "a", "samples": []}', '{"samples": []}']))
+
+
+def test_evaluation_memory_is_per_user() -> None:
+    # Templates and thresholds are kept per enrolled user, not per comparison
+    run = Evaluation(TAUS, MULTIPLIERS, enroll=5, batch_size=16)
+    run.add_genuine(_users(40, 6, seed=8))
+    run.add_impostors(_users(40, 4, seed=9, prefix="x"))
+    assert run.impostor.total == 40 * 4 * 40
+    assert len(run._templates) == 40
+    assert len(run.genuine.first_tau) == len(TAUS) + 1
+
+
+def test_cli_evaluate(tmp_path) -> None:
+    genuine, impostor = tmp_path / "genuine.ndjson", tmp_path / "impostor.ndjson"
+    out = tmp_path / "report.json"
+    sets = ((genuine, _users(8, 7, seed=10)), (impostor, _users(4, 2, seed=11, prefix="x")))
+    for path, users in sets:
+        lines = (json.dumps({"user": user, "samples": samples}) + "\n" for user, samples in users)
+        path.write_text("".join(lines))
+    args = [str(genuine), str(impostor), "-o", str(out)]
+    args += ["--tau", "0:2000:100", "--multiplier", "1,2,3"]
+    assert cli.main(["evaluate", *args]) == 0
+    report = json.loads(out.read_text())
+    assert report["genuine_comparisons"] == 16 and report["impostor_comparisons"] == 64
+    assert [p["tau"] for p in report["tau"]["points"]] == list(range(0, 2001, 100))
+    assert [p["multiplier"] for p in report["multiplier"]["points"]] == [1.0, 2.0, 3.0]
+
+    # Too few samples to leave genuine attempts after enrollment
+    assert cli.main(["evaluate", *args, "--enroll", "7"]) == 1
@@ -0,0 +1,84 @@
+"""Tests for the pre-routing guard: body caps, origin and rate limits."""
+
+from fastapi.testclient import TestClient
+
+from huproof.config.settings import get_settings
+from huproof.core.metrics import get_metric_stats
+
+
+def _rejections() -> dict[str, float]:
+    stats = get_metric_stats("guard_rejections")
+    return {s["labels"]["reason"]: s["total"] for s in stats["series"]} if stats else {}
+
+
+def test_oversized_body_rejected_before_parsing(
+    test_client: TestClient, test_headers: dict[str, str]
+) -> None:
+    before = _rejections().get("body_too_large", 0)
+    proof = {"pi_a": ["1" * 100] * 200, "pi_b": [], "pi_c": []}
+    resp = test_client.post(
+        "/api/login/finish", json={"public_inputs": {}, "proof": proof}, headers=test_headers
+    )
+    assert resp.status_code == 413
+    # Without Content-Length the body is counted while it streams in
+    chunks = iter([b"{" + b" " * 10_000, b" " * 10_000 + b"}"])
+    resp = test_client.post(
+        "/api/enroll/finish",
+        content=chunks,
+        headers={**test_headers, "Content-Type": "application/json"},
+    )
+    assert resp.status_code == 413
+    # Start endpoints take no body
+    resp = test_client.request(
+        "GET", "/api/enroll/start", content=b"x" * 2048, headers=test_headers
+    )
+    assert resp.status_code == 413
+    assert _rejections()["body_too_large"] == before + 3
+
+
+def test_small_body_passes_through(test_client: TestClient, test_headers: dict[str, str]) -> None:
+    resp = test_client.post(
+        "/api/login/finish",
+        content=b"{not json",
+        headers={**test_headers, "Content-Type": "application/json"},
+    )
+    assert resp.status_code == 422
+
+
+def test_origin_checked_before_parsing(test_client: TestClient) -> None:
+    garbage = {"Content-Type": "application/json"}
+    resp = test_client.post("/api/enroll/finish", content=b"{not json", headers=garbage)
+    assert resp.status_code == 403 and resp.json()["detail"] == "Origin header required"
+    resp = test_client.post(
+        "/api/enroll/finish",
+        content=b"{not json",
+        headers={**garbage, "Origin": "https://evil.example"},
+    )
+    assert resp.status_code == 403 and resp.json()["detail"] == "Invalid origin"
+    # A trailing slash is the same origin
+    resp = test_client.get("/api/enroll/start", headers={"Origin": get_settings().origin + "/"})
+    assert resp.status_code == 200
+    assert _rejections()["origin_mismatch"] >= 1
+
+
+def test_rate_limited_before_parsing(test_client: TestClient, test_headers: dict[str, str]) -> None:
+    settings = get_settings()
+    settings.rate_limit_finish = "2/minute"
+    try:
+        codes = [
+            test_client.post(
+                "/api/login/finish",
+                content=b"{",
+                headers={**test_headers, "Content-Type": "application/json"},
+            ).status_code
+            for _ in range(3)
+        ]
+    finally:
+        settings.rate_limit_finish = "20/minute"
+    assert codes == [422, 422, 429]
+
+
+def test_unguarded_routes_untouched(test_client: TestClient) -> None:
+    assert test_client.get("/health").status_code == 200
+    # Wrong method on a guarded path is left to the router
+    assert test_client.get("/api/login/finish").status_code == 405
@@ -0,0 +1,163 @@
+"""Tests for the queued log pipeline, sampling and rate limits."""
+
+import io
+import json
+import threading
+
+import pytest
+import structlog
+
+from huproof.core.logging import LogPipeline, parse_event_rates, render_json
+from huproof.core.metrics import get_metric_stats
+
+
+def _logger(pipeline: LogPipeline):
+    from huproof.core.logging import _PipelineLogger
+
+    return structlog.wrap_logger(
+        _PipelineLogger(pipeline),
+        processors=[pipeline.filter, structlog.processors.add_log_level],
+        wrapper_class=structlog.make_filtering_bound_logger(20),
+    )
+
+
+def _lines(stream: io.StringIO) -> list[dict]:
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def test_events_are_written_by_background_thread() -> None:
+    stream = io.StringIO()
+    pipeline = LogPipeline(stream)
+    log = _logger(pipeline)
+    for i in range(100):
+        log.info("request_done", i=i)
+    pipeline.flush()
+    lines = _lines(stream)
+    assert [line["i"] for line in lines] == list(range(100))
+    assert lines[0]["level"] == "info"
+    assert lines[0]["timestamp"].endswith("Z")
+
+
+def test_sampling_and_rate_limits_count_drops() -> None:
+    stream = io.StringIO()
+    pipeline = LogPipeline(
+        stream, sample={"chatty": 0.0}, rate_limits={"bursty": 5}, background=False
+    )
+    log = _logger(pipeline)
+    for _ in range(20):
+        log.info("chatty")
+        log.info("bursty")
+    log.info("important")
+    pipeline.flush()
+
+    events = [line["event"] for line in _lines(stream)]
+    assert events.count("chatty") == 0
+    assert 5 <= events.count("bursty") <= 10  # the window may roll over once
+    assert "important" in events
+    report = {
+        line["dropped_event"]: line["count"]
+        for line in _lines(stream)
+        if line["event"] == "log_events_dropped"
+    }
+    assert report["chatty"] == 20
+    assert report["bursty"] == 20 - events.count("bursty")
+    stats = get_metric_stats("log_events_dropped")
+    assert any(s["labels"] == {"event": "chatty", "reason": "sampled"} for s in stats["series"])
+
+
+def test_inline_pipeline_reports_drops_without_flush(monkeypatch: pytest.MonkeyPatch) -> None:
+    from huproof.core import logging as huproof_logging
+
+    monkeypatch.setattr(huproof_logging, "DROP_REPORT_S", 0.0)
+    stream = io.StringIO()
+    pipeline = LogPipeline(stream, sample={"chatty": 0.0}, background=False)
+    log = _logger(pipeline)
+    log.info("chatty")
+    log.info("chatty")
+    reports = [line for line in _lines(stream) if line["event"] == "log_events_dropped"]
+    assert sum(line["count"] for line in reports) == 2
+
+
+def test_full_queue_drops_instead_of_blocking() -> None:
+    release = threading.Event()
+
+    class SlowStream(io.StringIO):
+        def write(self, text: str) -> int:
+            release.wait(5)
+            return super().write(text)
+
+    stream = SlowStream()
+    pipeline = LogPipeline(stream, queue_size=2)
+    log = _logger(pipeline)
+    for i in range(10):
+        log.info("flood", i=i)
+    assert pipeline.dropped[("flood", "queue_full")] >= 5
+    release.set()
+    pipeline.flush()
+    assert any(
+        line["event"] == "log_events_dropped" and line["reason"] == "queue_full"
+        for line in _lines(stream)
+    )
+
+
+def test_render_json_and_settings_parsing() -> None:
+    line = json.loads(render_json({"event": "x", "timestamp": 0.0, "obj": object()}))
+    assert line["timestamp"] == "1970-01-01T00:00:00Z"
+    assert line["obj"].startswith("<object")
+    assert parse_event_rates("metric_timing=0.01, zk_verify_ok=10") == {
+        "metric_timing": 0.01,
+        "zk_verify_ok": 10.0,
+    }
+    with pytest.raises(ValueError):
+        parse_event_rates("metric_timing")
+
+
+def test_reconfiguring_stops_the_previous_writer() -> None:
+    from huproof.core import logging as huproof_logging
+
+    stream = io.StringIO()
+    huproof_logging.configure_logging(stream)
+    first = huproof_logging._pipeline
+    huproof_logging.configure_logging(stream)
+    assert first._thread is not None and not first._thread.is_alive()
+    # A logger still bound to the closed pipeline writes inline
+    _logger(first).info("late")
+    assert _lines(stream)[-1]["event"] == "late"
+    huproof_logging.configure_logging()
+
+
+def test_close_stops_with_events_queued_after_the_sentinel() -> None:
+    release = threading.Event()
+
+    class SlowStream(io.StringIO):
+        def write(self, text: str) -> int:
+            release.wait(5)
+            return super().write(text)
+
+    stream = SlowStream()
+    pipeline = LogPipeline(stream)
+    log = _logger(pipeline)
+    log.info("first")
+    # As if an emit raced close(): an event lands behind a stop sentinel
+    pipeline._queue.put(None)
+    log.info("late")
+    release.set()
+    pipeline.close()
+    assert not pipeline._thread.is_alive()
+    assert [line["event"] for line in _lines(stream)] == ["first", "late"]
+
+
+def test_write_errors_are_counted(capsys: pytest.CaptureFixture[str]) -> None:
+    class BrokenStream(io.StringIO):
+        def write(self, text: str) -> int:
+            raise OSError("disk full")
+
+    pipeline = LogPipeline(BrokenStream())
+    log = _logger(pipeline)
+    before = (get_metric_stats("log_write_errors") or {}).get("total", 0)
+    log.info("lost")
+    pipeline.flush()
+    log.info("lost")
+    pipeline.close()
+    assert get_metric_stats("log_write_errors")["total"] == before + 2
+    assert capsys.readouterr().err.count("disk full") == 1
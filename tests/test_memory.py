@@ -0,0 +1,53 @@
+"""Tests for the tracemalloc admin endpoints and memory gauges."""
+
+import tracemalloc
+from typing import Generator
+
+import pytest
+from fastapi.testclient import TestClient
+
+from huproof.config.settings import get_settings
+from huproof.core.memory import record_memory_gauges
+from huproof.core.metrics import get_metric_stats
+
+_leak: list[bytes] = []
+
+
+@pytest.fixture
+def admin(test_client: TestClient) -> Generator[TestClient, None, None]:
+    settings = get_settings()
+    settings.admin_token = "admin-secret"
+    test_client.headers["Authorization"] = "Bearer admin-secret"
+    yield test_client
+    settings.admin_token = ""
+    tracemalloc.stop()
+    _leak.clear()
+
+
+def test_snapshot_diff_finds_growth(admin: TestClient) -> None:
+    assert admin.post("/api/admin/tracemalloc/snapshots?label=before").status_code == 409
+    assert admin.post("/api/admin/tracemalloc/start?frames=2").json()["tracing"] is True
+
+    assert admin.post("/api/admin/tracemalloc/snapshots?label=before").status_code == 200
+    _leak.extend(bytes(1000) for _ in range(2000))
+    after = admin.post("/api/admin/tracemalloc/snapshots?label=after").json()
+    assert after["traced_bytes"] >= 2_000_000
+
+    top = admin.get("/api/admin/tracemalloc/snapshots/after?limit=5").json()["top"]
+    assert any("test_memory.py" in top_site["site"][0] for top_site in top)
+    diff = admin.get("/api/admin/tracemalloc/diff?base=before&target=after&limit=3").json()["diff"]
+    assert "test_memory.py" in diff[0]["site"][0]
+    assert diff[0]["size_diff"] >= 2_000_000
+
+    assert admin.get("/api/admin/tracemalloc/snapshots/missing").status_code == 404
+    assert admin.post("/api/admin/tracemalloc/stop").json()["tracing"] is False
+
+
+def test_memory_endpoint_and_gauges(admin: TestClient) -> None:
+    memory = admin.get("/api/admin/memory").json()
+    assert memory["rss_bytes"] > 0
+    assert [gen["generation"] for gen in memory["gc"]] == [0, 1, 2]
+
+    record_memory_gauges()
+    assert get_metric_stats("process_rss_bytes")["value"] > 0
+    assert len(get_metric_stats("gc_objects")["series"]) == 3
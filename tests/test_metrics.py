@@ -9,6 +9,7 @@ from huproof.core.metrics import (
     get_metric_stats,
     record_counter,
     record_timing,
+    set_gauge,
 )
 
 
@@ -63,3 +64,137 @@ def test_metrics_endpoint(test_client: TestClient, test_headers: dict[str, str])
     data = resp.json()
     assert "metrics" in data
 
+
+
+def test_histogram_quantiles() -> None:
+    """Quantiles stay within the bucket precision over a wide range."""
+    from huproof.core.metrics import Histogram
+
+    hist = Histogram()
+    for v in range(1, 10001):
+        hist.observe(v / 10)  # 0.1 ms .. 1000 ms
+    stats = hist.stats()
+    assert stats is not None
+    assert stats["count"] == 10000
+    assert stats["min"] == 0.1 and stats["max"] == 1000.0
+    for name, expected in {"p50": 500, "p90": 900, "p99": 990, "p999": 999}.items():
+        assert abs(stats[name] - expected) / expected < 0.05
+    assert stats["windows"]["1m"]["count"] == 10000
+
+
+def test_histogram_memory_is_constant() -> None:
+    from huproof.core.metrics import Histogram
+
+    hist = Histogram()
+    for v in range(100000):
+        hist.observe(float(v % 977))
+    assert len(hist._counts) == len(Histogram()._counts)
+
+
+def test_windows_slide(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Values older than a window drop out of it but stay in the all-time figures."""
+    from huproof.core import metrics
+
+    now = [1000.0]
+    monkeypatch.setattr(metrics, "monotonic", lambda: now[0])
+    hist = metrics.Histogram()
+    counter = metrics.Counter()
+    hist.observe(100.0)
+    counter.inc(3)
+    now[0] += 120
+    hist.observe(1.0)
+    counter.inc(1)
+
+    stats = hist.stats()
+    assert stats["count"] == 2
+    assert stats["windows"]["1m"]["count"] == 1
+    assert stats["windows"]["1m"]["max"] == 1.0
+    assert stats["windows"]["5m"]["count"] == 2
+
+    totals = counter.stats()
+    assert totals["total"] == 4
+    assert totals["windows"]["1m"]["total"] == 1
+    assert totals["windows"]["5m"]["total"] == 4
+
+    now[0] += 600
+    assert hist.stats()["windows"]["5m"] == {"count": 0}
+
+
+def test_labelled_series() -> None:
+    """Labels split a metric into series; the JSON figures still cover all of them."""
+    record_counter("labelled_counter", result="hit")
+    record_counter("labelled_counter", result="hit")
+    record_counter("labelled_counter", result="miss")
+    stats = get_metric_stats("labelled_counter")
+    assert stats is not None
+    assert stats["total"] == 3
+    by_result = {s["labels"]["result"]: s["total"] for s in stats["series"]}
+    assert by_result == {"hit": 2, "miss": 1}
+
+
+def test_label_cardinality_is_bounded() -> None:
+    from huproof.core.metrics import MAX_SERIES, OVERFLOW_VALUE, _families, render_prometheus
+
+    for i in range(MAX_SERIES + 50):
+        record_counter("unbounded_counter", user=str(i))
+    family = _families["unbounded_counter"]
+    assert len(family.series) == MAX_SERIES + 1
+    assert family.series[(("user", OVERFLOW_VALUE),)].total == 50
+    overflow = 'huproof_metrics_series_overflow_total{metric="unbounded_counter"} 50'
+    assert overflow in render_prometheus()
+
+
+def test_prometheus_exposition(test_client: TestClient) -> None:
+    record_timing("prom_timing", 30.0, endpoint="a")
+    record_timing("prom_timing", 3000.0, endpoint="a")
+    record_counter("prom_events", result='x"y')
+
+    resp = test_client.get("/metrics", headers={"Accept": "text/plain;version=0.0.4"})
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/plain")
+    body = resp.text
+    assert "# TYPE huproof_prom_timing_seconds histogram" in body
+    assert 'huproof_prom_timing_seconds_bucket{endpoint="a",le="0.05"} 1' in body
+    assert 'huproof_prom_timing_seconds_bucket{endpoint="a",le="+Inf"} 2' in body
+    assert 'huproof_prom_timing_seconds_count{endpoint="a"} 2' in body
+    assert 'huproof_prom_events_total{result="x\\"y"} 1.0' in body
+
+    assert test_client.get("/metrics?format=prometheus").text.startswith("# TYPE")
+    assert "metrics" in test_client.get("/metrics").json()
+
+
+def test_shared_store_aggregates_workers(tmp_path) -> None:
+    """Series written by separate worker processes are summed by any reader."""
+    import os
+    import subprocess
+    import sys
+
+    from huproof.core import metrics
+
+    script = (
+        "import sys; from huproof.core.metrics import record_counter, record_timing, set_gauge\n"
+        "n = int(sys.argv[1])\n"
+        "for i in range(n):\n"
+        "    record_counter('shared_requests', route='a')\n"
+        "    record_timing('shared_latency', 10.0 * n)\n"
+        "set_gauge('shared_inflight', 5)\n"
+    )
+    env = {**os.environ, "METRICS_SHARED_DIR": str(tmp_path)}
+    for n in (3, 4):
+        subprocess.run(
+            [sys.executable, "-c", script, str(n)], env=env, check=True, capture_output=True
+        )
+
+    try:
+        metrics.use_shared_store(str(tmp_path))
+        record_counter("shared_requests", route="a")
+        set_gauge("shared_inflight", 2)
+        assert get_metric_stats("shared_requests")["total"] == 8
+        latency = get_metric_stats("shared_latency")
+        assert latency["count"] == 7 and latency["min"] == 30.0 and latency["max"] == 40.0
+        assert latency["windows"]["1m"]["count"] == 7
+        # The gauges of the exited workers are dropped
+        assert get_metric_stats("shared_inflight") == {"value": 2.0}
+        assert 'huproof_shared_requests_total{route="a"} 8.0' in metrics.render_prometheus()
+    finally:
+        metrics.use_shared_store(None)
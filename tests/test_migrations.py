@@ -0,0 +1,111 @@
+"""Tests for the schema migration runner."""
+
+from sqlalchemy import create_engine, inspect, text
+from sqlmodel import SQLModel
+
+from huproof.db import models  # noqa: F401  (registers tables)
+from huproof.db.migrations import (
+    MIGRATIONS,
+    Migration,
+    _drop_invalid_index,
+    current_version,
+    run_migrations,
+)
+
+
+def _index_names(engine, table: str) -> set[str]:
+    return {ix["name"] for ix in inspect(engine).get_indexes(table)}
+
+
+def test_fresh_database_is_at_latest_version() -> None:
+    """A database created from the models only records the migrations."""
+    engine = create_engine("sqlite://")
+    SQLModel.metadata.create_all(engine)
+    assert run_migrations(engine) == MIGRATIONS[-1].version
+    assert "ix_keystrokecommitment_active_lookup" in _index_names(engine, "keystrokecommitment")
+    # Idempotent
+    assert run_migrations(engine) == MIGRATIONS[-1].version
+
+
+def test_legacy_indexes_are_migrated() -> None:
+    """Indexes from the original schema are replaced on an existing database."""
+    engine = create_engine("sqlite://")
+    SQLModel.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "CREATE INDEX ix_keystrokecommitment_commitment_c "
+                "ON keystrokecommitment (commitment_c)"
+            )
+        )
+        conn.execute(text("CREATE UNIQUE INDEX ix_noncerecord_value ON noncerecord (value)"))
+        conn.execute(text("DROP INDEX ix_keystrokecommitment_active_lookup"))
+
+    run_migrations(engine)
+
+    commitment_indexes = _index_names(engine, "keystrokecommitment")
+    assert "ix_keystrokecommitment_commitment_c" not in commitment_indexes
+    assert "ix_keystrokecommitment_active_lookup" in commitment_indexes
+    nonce_indexes = _index_names(engine, "noncerecord")
+    assert "ix_noncerecord_value" not in nonce_indexes
+    assert "ux_noncerecord_value_purpose" in nonce_indexes
+
+
+def test_only_pending_migrations_run() -> None:
+    """Migrations at or below the recorded version are skipped."""
+    engine = create_engine("sqlite://")
+    extra = Migration(
+        version=1000, description="test", statements={"*": ["CREATE TABLE t1000 (x INTEGER)"]}
+    )
+    run_migrations(engine, [extra])
+    run_migrations(engine, [extra])
+    with engine.connect() as conn:
+        assert current_version(conn) == 1000
+    assert inspect(engine).has_table("t1000")
+
+
+class _FakeConnection:
+    """Records statements; the pg_index check reports the index as invalid."""
+
+    def __init__(self, invalid: bool):
+        self.invalid = invalid
+        self.statements: list[str] = []
+
+    def execute(self, statement, params=None):
+        self.statements.append(str(statement))
+        return self
+
+    def scalar(self) -> bool:
+        return self.invalid
+
+
+def test_invalid_concurrent_index_is_dropped() -> None:
+    """An index left invalid by an interrupted CONCURRENTLY build is dropped before re-creating."""
+    create = MIGRATIONS[0].statements_for("postgresql")[0]
+    conn = _FakeConnection(invalid=True)
+    _drop_invalid_index(conn, create)
+    assert "indisvalid" in conn.statements[0]
+    assert conn.statements[1] == (
+        "DROP INDEX CONCURRENTLY IF EXISTS ix_keystrokecommitment_active_lookup"
+    )
+
+    conn = _FakeConnection(invalid=False)
+    _drop_invalid_index(conn, create)
+    assert len(conn.statements) == 1
+    conn = _FakeConnection(invalid=True)
+    _drop_invalid_index(conn, "DROP INDEX CONCURRENTLY IF EXISTS ix_user_id")
+    assert conn.statements == []
+
+
+def test_active_commitment_lookup_uses_partial_index() -> None:
+    """The login lookup is served by the partial composite index."""
+    from sqlalchemy.dialects import sqlite
+
+    from huproof.db.queries import ACTIVE_COMMITMENT
+
+    engine = create_engine("sqlite://")
+    SQLModel.metadata.create_all(engine)
+    sql = str(ACTIVE_COMMITMENT.compile(dialect=sqlite.dialect()))
+    with engine.connect() as conn:
+        plan = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}", ("u", "o")).fetchall()
+    assert "ix_keystrokecommitment_active_lookup" in plan[0][-1]
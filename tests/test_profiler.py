@@ -0,0 +1,68 @@
+"""Tests for the sampling profiler and its admin endpoint."""
+
+import threading
+from types import SimpleNamespace
+from typing import Generator
+
+import pytest
+from fastapi.testclient import TestClient
+
+from huproof.config.settings import get_settings
+from huproof.core import profiler
+from huproof.core.profiler import StackSampler, route_codes
+
+
+def _busy_handler(stop: threading.Event) -> None:
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def test_sampler_attributes_stacks_to_endpoints() -> None:
+    route = SimpleNamespace(endpoint=_busy_handler, methods={"POST"}, path="/api/busy")
+    stop = threading.Event()
+    worker = threading.Thread(target=_busy_handler, args=(stop,), name="worker")
+    worker.start()
+    sampler = StackSampler(0.001, route_codes([route]))
+    try:
+        for _ in range(20):
+            sampler.sample()
+    finally:
+        stop.set()
+        worker.join()
+
+    busy = [
+        (stack, n) for stack, n in sampler.stacks.items() if stack.startswith("POST /api/busy;")
+    ]
+    assert sum(n for _, n in busy) == 20
+    assert all(":_busy_handler" in stack for stack, _ in busy)
+    line = sampler.collapsed().splitlines()[0]
+    assert line.rsplit(" ", 1)[1].isdigit()
+
+
+@pytest.fixture
+def admin_token() -> Generator[str, None, None]:
+    settings = get_settings()
+    settings.admin_token = "admin-secret"
+    yield "admin-secret"
+    settings.admin_token = ""
+
+
+def test_profile_endpoint(test_client: TestClient, admin_token: str) -> None:
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    resp = test_client.post("/api/admin/profile?seconds=0.2&hz=200&idle=true", headers=headers)
+    assert resp.status_code == 200
+    assert int(resp.headers["x-profile-samples"]) > 0
+    assert resp.text.strip()
+
+    assert test_client.post("/api/admin/profile?seconds=600", headers=headers).status_code == 400
+    resp = test_client.post("/api/admin/profile", headers={"Authorization": "Bearer wrong"})
+    assert resp.status_code == 401
+
+    # Only one profile at a time
+    with profiler._running:
+        resp = test_client.post("/api/admin/profile?seconds=0.1", headers=headers)
+        assert resp.status_code == 409
+
+
+def test_admin_endpoints_hidden_without_token(test_client: TestClient) -> None:
+    assert test_client.post("/api/admin/profile?seconds=0.1").status_code == 404
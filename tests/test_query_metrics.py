@@ -0,0 +1,73 @@
+"""Tests for per-statement SQL timing and per-request query counts."""
+
+from typing import Callable
+
+import httpx
+import pytest
+
+from huproof.config.settings import get_settings
+from huproof.core import tracing
+from huproof.core.metrics import get_metric_stats, render_prometheus
+from huproof.db.session import normalize_sql
+
+
+def test_normalize_sql() -> None:
+    assert (
+        normalize_sql("SELECT * FROM user WHERE id = :id_1 AND name = 'a''b'")
+        == "SELECT * FROM user WHERE id = ? AND name = ?"
+    )
+    assert (
+        normalize_sql("SELECT x FROM t WHERE id IN (%(p_1)s, %(p_2)s)\n  LIMIT 10")
+        == "SELECT x FROM t WHERE id IN (?) LIMIT ?"
+    )
+    assert (
+        normalize_sql("INSERT INTO t (a, b) VALUES ($1, $2), ($3, $4)")
+        == "INSERT INTO t (a, b) VALUES (?)"
+    )
+    assert (
+        normalize_sql("SELECT CAST(x AS TEXT)::text FROM t1")
+        == "SELECT CAST(x AS TEXT)::text FROM t1"
+    )
+
+
+def _series(name: str, endpoint: str) -> dict:
+    stats = get_metric_stats(name)
+    assert stats is not None
+    return next(s for s in stats["series"] if s["labels"].get("endpoint") == endpoint)
+
+
+def test_login_finish_query_count(enroll_and_login: Callable[[], httpx.Response]) -> None:
+    resp = enroll_and_login()
+    assert resp.status_code == 200
+    stages = dict(part.split(";dur=") for part in resp.headers["server-timing"].split(", "))
+    assert "sql" in stages
+
+    queries = _series("db_request_queries", "/api/login/finish")
+    assert queries["max"] >= 3
+    assert _series("db_request_time", "/api/login/finish")["count"] >= 1
+
+    stats = get_metric_stats("db_query_time")
+    assert stats is not None
+    assert any("nonce" in s["labels"]["query"] for s in stats["series"])
+    assert 'db_query_time_seconds_count{query="' in render_prometheus()
+
+
+def test_query_count_warning(
+    enroll_and_login: Callable[[], httpx.Response], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    warnings: list[dict] = []
+    monkeypatch.setattr(
+        tracing.logger,
+        "warning",
+        lambda event, **kw: warnings.append({"event": event, **kw}),
+        raising=False,
+    )
+    monkeypatch.setattr(get_settings(), "db_query_warn_threshold", 1)
+    assert enroll_and_login().status_code == 200
+    finish = [
+        w
+        for w in warnings
+        if w["event"] == "db_query_count_exceeded" and w["endpoint"] == "/api/login/finish"
+    ]
+    assert finish and finish[0]["queries"] > 1 and finish[0]["repeats"] >= 1
+    assert _series("db_query_warnings", "/api/login/finish")["total"] >= 1
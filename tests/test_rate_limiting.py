@@ -1,8 +1,25 @@
 """Tests for rate limiting."""
 
+import io
+import socket
+import threading
+
 import pytest
 from fastapi.testclient import TestClient
 
+from huproof.config.settings import get_settings
+from huproof.core.limitstore import MemoryStore, RedisStore, StoreError, encode_command, read_reply
+from huproof.core.metrics import get_metric_stats
+from huproof.core.ratelimit import GCRALimiter, Rate, SharedLimiter, parse_rate
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
 
 def test_rate_limit_enroll_start(test_client: TestClient, test_headers: dict[str, str]) -> None:
     """Test enrollment start rate limiting (5 per minute)."""
@@ -11,13 +28,12 @@ def test_rate_limit_enroll_start(test_client: TestClient, test_headers: dict[str
         resp = test_client.get("/api/enroll/start", headers=test_headers)
         assert resp.status_code == 200, f"Request {i+1} should succeed"
     
-    # 6th request should be rate limited, but rate limiting may not work perfectly in tests
-    # due to in-memory backend timing issues
+    # 6th request should be rate limited
     resp = test_client.get("/api/enroll/start", headers=test_headers)
-    assert resp.status_code in [200, 429], "Should handle rate limit gracefully"
-    # If rate limited, verify error message
-    if resp.status_code == 429:
-        assert "Rate limit exceeded" in resp.json()["detail"]
+    assert resp.status_code == 429
+    assert "Rate limit exceeded" in resp.json()["detail"]
+    # One request per 12 seconds refills the bucket
+    assert 1 <= int(resp.headers["retry-after"]) <= 12
 
 
 def test_rate_limit_login_start(test_client: TestClient, test_headers: dict[str, str]) -> None:
@@ -49,7 +65,223 @@ def test_rate_limit_login_start(test_client: TestClient, test_headers: dict[str,
         resp = test_client.get(f"/api/login/start?user_id={user_id}", headers=test_headers)
         assert resp.status_code == 200, f"Request {i+1} should succeed"
     
-    # 11th request should be rate limited (429) - may vary due to timing
+    # 11th request should be rate limited (429)
     resp = test_client.get(f"/api/login/start?user_id={user_id}", headers=test_headers)
-    assert resp.status_code in [200, 429], "Should handle rate limit gracefully"
+    assert resp.status_code == 429
+
+
+
+def test_limits_follow_settings(test_client: TestClient, test_headers: dict[str, str]) -> None:
+    settings = get_settings()
+    settings.rate_limit_enroll_start = "2/hour"
+    try:
+        codes = [
+            test_client.get("/api/enroll/start", headers=test_headers).status_code for _ in range(3)
+        ]
+    finally:
+        settings.rate_limit_enroll_start = "5/minute"
+    assert codes == [200, 200, 429]
+
+    stats = get_metric_stats("rate_limit_decisions")
+    assert stats is not None
+    decisions = {(s["labels"]["limit"], s["labels"]["decision"]) for s in stats["series"]}
+    assert {("enroll_start", "allowed"), ("enroll_start", "limited")} <= decisions
+
+
+def test_clients_are_limited_separately(
+    test_client: TestClient, test_headers: dict[str, str]
+) -> None:
+    def start(client_ip: str) -> int:
+        headers = {**test_headers, "X-Forwarded-For": client_ip}
+        return test_client.get("/api/enroll/start", headers=headers).status_code
+
+    for _ in range(5):
+        start("10.0.0.1")
+    assert start("10.0.0.1") == 429
+    assert start("10.0.0.2") == 200
+
+
+def test_parse_rate() -> None:
+    assert parse_rate("5/minute") == Rate(5, 60.0)
+    assert parse_rate("10/2 seconds") == Rate(10, 2.0)
+    assert parse_rate("100/Hour") == Rate(100, 3600.0)
+    for bad in ("5", "x/minute", "5/fortnight", "0/minute"):
+        with pytest.raises(ValueError):
+            parse_rate(bad)
+
+
+def test_gcra_burst_and_refill() -> None:
+    clock = _Clock()
+    limiter = GCRALimiter(clock=clock)
+    rate = Rate(3, 3.0)
+    assert [limiter.hit("k", rate).remaining for _ in range(3)] == [2, 1, 0]
+    denied = limiter.hit("k", rate)
+    assert not denied.allowed and denied.retry_after_s == pytest.approx(1.0)
+    clock.now += 1.0
+    assert limiter.hit("k", rate).allowed
+    assert not limiter.hit("k", rate).allowed
+    # A full period later the whole burst is available again
+    clock.now += 3.0
+    assert all(limiter.hit("k", rate).allowed for _ in range(3))
+
+
+def test_gcra_key_count_is_bounded() -> None:
+    clock = _Clock()
+    limiter = GCRALimiter(max_keys=64, shards=4, clock=clock)
+    rate = Rate(1, 60.0)
+    for i in range(10_000):
+        assert limiter.hit(f"10.0.{i // 256}.{i % 256}", rate).allowed
+    assert len(limiter) <= 64
+    # The most recent keys are still limited
+    assert not limiter.hit("10.0.39.15", rate).allowed
+    # Expired entries go first, so idle keys do not take up space
+    clock.now += 61.0
+    limiter.hit("fresh", rate)
+    assert len(limiter) < 64
+
+
+def _shared(store: MemoryStore, clock: _Clock) -> SharedLimiter:
+    return SharedLimiter(
+        store, GCRALimiter(clock=clock), lease_tokens=10, lease_s=1.0, retry_s=5.0, clock=clock
+    )
+
+
+def test_shared_limit_holds_across_workers() -> None:
+    clock = _Clock()
+    store = MemoryStore(clock)
+    workers = [_shared(store, clock), _shared(store, clock)]
+    rate = Rate(4, 60.0)
+    allowed = [workers[i % 2].hit(("login_start", "10.0.0.1"), rate).allowed for i in range(8)]
+    assert allowed == [True] * 4 + [False] * 4
+
+
+def test_shared_limiter_leases_tokens_for_fast_limits() -> None:
+    clock = _Clock()
+    store = MemoryStore(clock)
+    limiter = _shared(store, clock)
+    rate = Rate(100, 1.0)
+    assert all(limiter.hit("k", rate).allowed for _ in range(30))
+    # Ten tokens per round trip
+    assert store.calls == 3
+    # Slow limits never lease more than one token
+    assert limiter.hit("slow", Rate(5, 60.0)).allowed and store.calls == 4
+
+
+def test_shared_limiter_remembers_denials() -> None:
+    clock = _Clock()
+    store = MemoryStore(clock)
+    limiter = _shared(store, clock)
+    rate = Rate(1, 10.0)
+    assert limiter.hit("k", rate).allowed
+    assert not limiter.hit("k", rate).allowed
+    calls = store.calls
+    denied = limiter.hit("k", rate)
+    assert not denied.allowed and denied.retry_after_s == pytest.approx(10.0)
+    assert store.calls == calls
+    clock.now += 10.0
+    assert limiter.hit("k", rate).allowed
+
+
+def test_shared_limiter_falls_back_to_local_limits() -> None:
+    clock = _Clock()
+    store = MemoryStore(clock)
+    limiter = _shared(store, clock)
+    rate = Rate(2, 60.0)
+    store.fail = ConnectionRefusedError()
+    assert [limiter.hit("k", rate).allowed for _ in range(3)] == [True, True, False]
+    # The store is not retried until retry_s has passed
+    assert store.calls == 1
+    store.fail = None
+    clock.now += 5.0
+    assert limiter.hit("k2", rate).allowed and store.calls == 2
+
+
+def test_resp_encoding() -> None:
+    assert encode_command("GET", "k", 12) == b"*3\r\n$3\r\nGET\r\n$1\r\nk\r\n$2\r\n12\r\n"
+    reply = io.BytesIO(b"*3\r\n:2\r\n$3\r\n0.5\r\n:7\r\n")
+    assert read_reply(reply) == [2, b"0.5", 7]
+    assert read_reply(io.BytesIO(b"+OK\r\n")) == "OK"
+    assert read_reply(io.BytesIO(b"$-1\r\n")) is None
+    with pytest.raises(StoreError, match="NOSCRIPT"):
+        read_reply(io.BytesIO(b"-NOSCRIPT No matching script\r\n"))
+
+
+def test_redis_store_talks_resp() -> None:
+    """Against a scripted server: NOSCRIPT on EVALSHA, then EVAL."""
+    listener = socket.create_server(("127.0.0.1", 0))
+    port = listener.getsockname()[1]
+    received: list[bytes] = []
+
+    def serve() -> None:
+        conn, _ = listener.accept()
+        f = conn.makefile("rb")
+        for answer in (b"-NOSCRIPT No matching script\r\n", b"*3\r\n:1\r\n$1\r\n0\r\n:4\r\n"):
+            args = [f.read(int(f.readline()[1:]) + 2)[:-2] for _ in range(int(f.readline()[1:]))]
+            received.append(b" ".join(args))
+            conn.sendall(answer)
+        conn.close()
+
+    server = threading.Thread(target=serve)
+    server.start()
+    store = RedisStore(f"redis://127.0.0.1:{port}/0", timeout_s=2.0)
+    try:
+        assert store.acquire("login_start:10.0.0.1", 6000.0, 60000.0, 1) == (1, 0.0, 4)
+    finally:
+        store.close()
+        server.join()
+        listener.close()
+    assert received[0].startswith(b"EVALSHA ") and received[1].startswith(b"EVAL \n")
+    assert b"huproof:rl:login_start:10.0.0.1" in received[1]
+
+
+def test_login_start_limited_per_account(
+    test_client: TestClient, test_headers: dict[str, str]
+) -> None:
+    settings = get_settings()
+    settings.rate_limit_login_account = "3/minute"
+    try:
+        codes = [
+            test_client.get(
+                "/api/login/start?user_id=nobody",
+                headers={**test_headers, "X-Forwarded-For": f"10.1.0.{i}"},
+            ).status_code
+            for i in range(4)
+        ]
+        # Another account is not affected
+        other = test_client.get(
+            "/api/login/start?user_id=somebody",
+            headers={**test_headers, "X-Forwarded-For": "10.1.0.9"},
+        )
+    finally:
+        settings.rate_limit_login_account = "10/minute"
+    assert codes == [404, 404, 404, 429]
+    assert other.status_code == 404
+
+
+def test_login_start_account_limit_uses_last_user_id(
+    test_client: TestClient, test_headers: dict[str, str]
+) -> None:
+    # The handler binds the last user_id, so a junk first value must not dodge the limit
+    settings = get_settings()
+    settings.rate_limit_login_account = "2/minute"
+    try:
+        codes = [
+            test_client.get(
+                f"/api/login/start?user_id=junk{i}&user_id=victim",
+                headers={**test_headers, "X-Forwarded-For": f"10.2.0.{i}"},
+            ).status_code
+            for i in range(3)
+        ]
+    finally:
+        settings.rate_limit_login_account = "10/minute"
+    assert codes == [404, 404, 429]
+
+
+def test_account_keys_are_keyed_hashes() -> None:
+    from huproof.core.crypto import keyed_hash
+    from huproof.core.ratelimit import account_key
 
+    assert len(account_key("alice")) == 16 and account_key("alice") == account_key("alice")
+    assert account_key("alice") != account_key("bob")
+    assert keyed_hash("secret", "a", "alice") != keyed_hash("secret", "b", "alice")
+    assert keyed_hash("secret", "a", "alice") != keyed_hash("other", "a", "alice")
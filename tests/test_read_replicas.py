@@ -0,0 +1,108 @@
+"""Tests for read-replica routing."""
+
+import tempfile
+from typing import Callable, Generator
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlmodel import SQLModel
+
+from huproof.config.settings import Settings
+from huproof.db.session import ReplicaSet
+
+
+@pytest.fixture
+def replica_url(test_client: TestClient) -> Generator[str, None, None]:
+    """An empty replica database configured through DB_REPLICA_URLS."""
+    from huproof.config.settings import get_settings
+    from huproof.db import session as db_session
+
+    with tempfile.NamedTemporaryFile(suffix=".db") as f:
+        url = f"sqlite:///{f.name}"
+        engine = create_engine(url)
+        SQLModel.metadata.create_all(engine)
+        engine.dispose()
+
+        settings = get_settings()
+        previous = settings.db_replica_urls
+        settings.db_replica_urls = url
+        db_session._replicas = None
+        yield url
+        if db_session._replicas is not None:
+            db_session._replicas.dispose()
+        db_session._replicas = None
+        settings.db_replica_urls = previous
+
+
+def test_pick_skips_lagging_replicas(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Replicas over the lag limit are skipped; all lagging falls back to primary."""
+    settings = Settings(APP_SECRET="test-secret", DB_REPLICA_MAX_LAG_S="1.0")  # type: ignore[arg-type]
+    replicas = ReplicaSet(["sqlite://", "sqlite://"], settings)
+    lags = {0: 5.0, 1: 0.5}
+    monkeypatch.setattr(replicas, "_probe", lambda i: lags[i])
+    assert {replicas.pick() for _ in range(4)} == {1}
+
+    replicas = ReplicaSet(["sqlite://"], settings)
+    monkeypatch.setattr(replicas, "_probe", lambda i: float("inf"))
+    assert replicas.pick() is None
+
+
+def test_login_start_reads_replica_and_falls_back(
+    test_client: TestClient, test_headers: dict[str, str], replica_url: str
+) -> None:
+    """A commitment missing on a stale replica is found on the primary."""
+    from huproof.db import commitments
+    from huproof.db.session import read_session_scope, served_by_replica
+
+    with read_session_scope("/test") as s:
+        assert served_by_replica(s)
+
+    data = test_client.get("/api/enroll/start", headers=test_headers).json()
+    payload = {
+        "commitment": "42",
+        "public_inputs": {
+            "nonce": data["nonce"],
+            "origin_hash": data["origin_hash"],
+            "tau": data["tau"],
+            "timestamp": data["timestamp"],
+            "C": "42",
+            "sig": "1",
+        },
+        "proof": {"pi_a": [], "pi_b": [], "pi_c": []},
+    }
+    enrolled = test_client.post("/api/enroll/finish", json=payload, headers=test_headers)
+    user_id = enrolled.json()["user_id"]
+    commitments.get_commitment_cache().clear()
+
+    resp = test_client.get(f"/api/login/start?user_id={user_id}", headers=test_headers)
+    assert resp.status_code == 200
+    assert resp.json()["commitment"] == "42"
+
+
+def test_revocation_checked_on_primary(
+    test_client: TestClient,
+    test_headers: dict[str, str],
+    replica_url: str,
+    enroll_and_login: Callable[[], httpx.Response],
+) -> None:
+    """A token revoked on the primary is rejected even when the replica lacks the revocation."""
+    from contextlib import ExitStack
+
+    from fastapi import HTTPException
+
+    from huproof.core.auth import get_current_user
+    from huproof.core.sessions import ReadWriteSessions
+    from huproof.db.session import served_by_replica
+
+    token = enroll_and_login().json()["token"]
+    auth = {**test_headers, "Authorization": f"Bearer {token}"}
+    assert test_client.post("/api/logout", headers=auth).status_code == 200
+
+    with ExitStack() as stack:
+        sessions = ReadWriteSessions(stack, "/test")
+        assert served_by_replica(sessions.read)
+        with pytest.raises(HTTPException) as exc:
+            get_current_user(f"Bearer {token}", sessions)
+    assert exc.value.detail == "Token revoked"
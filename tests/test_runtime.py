@@ -0,0 +1,55 @@
+"""Tests for threadpool and event-loop instrumentation."""
+
+import asyncio
+import time
+
+from fastapi.testclient import TestClient
+
+from huproof.config.settings import get_settings
+from huproof.core.metrics import get_metric_stats
+from huproof.core.runtime import run_probe
+
+
+def test_threadpool_wait_and_limit(test_client: TestClient, test_headers: dict[str, str]) -> None:
+    settings = get_settings()
+    settings.threadpool_limit = 7
+    try:
+        with test_client as client:
+            assert client.get("/api/enroll/start", headers=test_headers).status_code == 200
+            time.sleep(settings.runtime_probe_s * 2)
+    finally:
+        settings.threadpool_limit = 40
+
+    wait = get_metric_stats("threadpool_wait_time")
+    assert wait is not None
+    assert any(s["labels"]["endpoint"] == "/api/enroll/start" for s in wait["series"])
+    assert get_metric_stats("threadpool_limit")["value"] == 7
+
+
+def test_loop_lag_probe() -> None:
+    async def main() -> None:
+        probe = asyncio.create_task(run_probe(0.01))
+        await asyncio.sleep(0.02)
+        time.sleep(0.1)  # block the loop
+        await asyncio.sleep(0.03)
+        probe.cancel()
+
+    asyncio.run(main())
+    lag = get_metric_stats("event_loop_lag")
+    assert lag is not None and lag["max"] >= 50
+
+
+def test_other_anyio_versions_stay_untimed(monkeypatch) -> None:
+    from anyio import to_thread
+
+    from huproof.core import runtime
+
+    monkeypatch.setattr(runtime, "_anyio_major", lambda: "5")
+
+    async def main() -> tuple[str, int]:
+        limiter = runtime.instrument_threadpool(3)
+        return type(limiter).__name__, to_thread.current_default_thread_limiter().total_tokens
+
+    name, total = asyncio.run(main())
+    assert name != "TimedCapacityLimiter"
+    assert total == 3
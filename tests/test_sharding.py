@@ -0,0 +1,180 @@
+"""Tests for hash-sharded user storage and online resharding."""
+
+from typing import Generator
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session, func, select
+
+from huproof.db.models import KeystrokeCommitment, NonceRecord, SessionToken, User
+from huproof.db.session import HashRing
+
+PROOF = {"pi_a": [], "pi_b": [], "pi_c": []}
+
+
+def test_ring_balance_and_minimal_movement() -> None:
+    keys = [f"user-{i}" for i in range(4000)]
+    four = HashRing(["0", "1", "2", "3"], 64)
+    counts = {shard: 0 for shard in "0123"}
+    for key in keys:
+        counts[four.shard(key)] += 1
+    assert min(counts.values()) > 600
+
+    five = HashRing(["0", "1", "2", "3", "4"], 64)
+    moved = [key for key in keys if four.shard(key) != five.shard(key)]
+    # Only keys taken over by the new shard move
+    assert all(five.shard(key) == "4" for key in moved)
+    assert len(moved) < len(keys) * 0.3
+
+
+@pytest.fixture
+def shard_dir(test_client: TestClient, tmp_path) -> Generator[str, None, None]:
+    from huproof.config.settings import get_settings
+    from huproof.core.ratelimit import limiter
+    from huproof.db import session as db_session
+
+    settings = get_settings()
+    previous = (settings.db_url, settings.db_shard_urls, settings.db_shard_previous_count)
+    engine = db_session._engine
+    # These tests enroll and log in more users than the per-IP limits allow
+    limiter.enabled = False
+    yield str(tmp_path)
+    if db_session._shards is not None:
+        db_session._shards.dispose()
+    if db_session._engine is not None:
+        db_session._engine.dispose()
+    db_session._shards = None
+    db_session._engine = engine
+    limiter.enabled = True
+    settings.db_url, settings.db_shard_urls, settings.db_shard_previous_count = previous
+
+
+def _configure(tmp: str, extra: int, previous_count: int = 0) -> None:
+    """Shard 0 and ``extra`` more shards, all in ``tmp``, so no other test's rows are on them."""
+    from huproof.config.settings import get_settings
+    from huproof.db import commitments as db_commitments
+    from huproof.db import session as db_session
+
+    settings = get_settings()
+    settings.db_url = f"sqlite:///{tmp}/shard0.db"
+    settings.db_shard_urls = ",".join(f"sqlite:///{tmp}/shard{i}.db" for i in range(1, extra + 1))
+    settings.db_shard_previous_count = previous_count
+    if db_session._shards is not None:
+        db_session._shards.dispose()
+    db_session._shards = None
+    if db_session._engine is not None and str(db_session._engine.url) != settings.db_url:
+        db_session._engine.dispose()
+        db_session._engine = None
+    db_commitments._cache = None
+    db_session.init_db()
+
+
+def _enroll(client: TestClient, headers: dict[str, str]) -> str:
+    data = client.get("/api/enroll/start", headers=headers).json()
+    public_inputs = {
+        "nonce": data["nonce"],
+        "origin_hash": data["origin_hash"],
+        "tau": data["tau"],
+        "timestamp": data["timestamp"],
+        "C": "7",
+        "sig": "1",
+    }
+    resp = client.post(
+        "/api/enroll/finish",
+        json={"commitment": "7", "public_inputs": public_inputs, "proof": PROOF},
+        headers=headers,
+    )
+    assert resp.status_code == 200
+    return resp.json()["user_id"]
+
+
+def _login(client: TestClient, headers: dict[str, str], user_id: str) -> str:
+    start = client.get("/api/login/start", params={"user_id": user_id}, headers=headers)
+    assert start.status_code == 200
+    data = start.json()
+    public_inputs = {
+        "nonce": data["nonce"],
+        "origin_hash": data["origin_hash"],
+        "tau": data["tau"],
+        "timestamp": data["timestamp"],
+        "C": "7",
+        "sig": "1",
+    }
+    resp = client.post(
+        "/api/login/finish", json={"public_inputs": public_inputs, "proof": PROOF}, headers=headers
+    )
+    assert resp.status_code == 200
+    return resp.json()["token"]
+
+
+def _count(engine, model, users: list[str]) -> int:
+    """Rows of ``model`` on ``engine`` belonging to ``users``."""
+    column = model.id if model is User else model.user_id
+    with Session(engine) as session:
+        return session.exec(select(func.count()).select_from(model).where(column.in_(users))).one()
+
+
+def test_users_spread_across_shards(
+    test_client: TestClient, test_headers: dict[str, str], shard_dir: str
+) -> None:
+    from huproof.db.session import get_shards
+
+    _configure(shard_dir, extra=2)
+    router = get_shards()
+    users = [_enroll(test_client, test_headers) for _ in range(12)]
+    for user_id in users[:3]:
+        token = _login(test_client, test_headers, user_id)
+        resp = test_client.post(
+            "/api/logout", headers={**test_headers, "Authorization": f"Bearer {token}"}
+        )
+        assert resp.status_code == 200
+
+    for shard_id, engine in router.engines.items():
+        owned = [u for u in users if router.owner(u) == shard_id]
+        assert _count(engine, User, users) == len(owned)
+        assert _count(engine, KeystrokeCommitment, users) == len(owned)
+    assert sum(_count(e, SessionToken, users) for e in router.engines.values()) == 3
+
+    # Login nonces follow their user; enrollment nonces all carry the enroll shard
+    for shard_id, engine in router.engines.items():
+        with Session(engine) as session:
+            nonces = session.exec(select(NonceRecord).where(NonceRecord.user_id.in_(users))).all()
+        assert all(n.value.startswith(f"{shard_id}.") for n in nonces)
+    nonce = test_client.get("/api/enroll/start", headers=test_headers).json()["nonce"]
+    assert nonce.startswith(f"{router.enroll_shard}.")
+
+
+def test_online_reshard(
+    test_client: TestClient, test_headers: dict[str, str], shard_dir: str
+) -> None:
+    from huproof.db.reshard import reshard
+    from huproof.db.session import get_shards
+
+    _configure(shard_dir, extra=1)
+    users = [_enroll(test_client, test_headers) for _ in range(16)]
+    tokens = {user_id: _login(test_client, test_headers, user_id) for user_id in users}
+
+    # Add a third shard; until users move they are served from their previous shard
+    _configure(shard_dir, extra=2, previous_count=2)
+    router = get_shards()
+    moving = [u for u in users if router.owner(u) == "2"]
+    assert moving
+    _login(test_client, test_headers, moving[0])
+
+    assert reshard(router, batch_size=5)["2"] == len(moving)
+    assert reshard(router)["2"] == 0
+    assert _count(router.engines["2"], User, users) == len(moving)
+
+    # Sessions issued before the move stay valid and revocable
+    resp = test_client.post(
+        "/api/logout", headers={**test_headers, "Authorization": f"Bearer {tokens[moving[0]]}"}
+    )
+    assert resp.status_code == 200
+    with Session(router.engines["2"]) as session:
+        revoked = session.exec(select(SessionToken).where(SessionToken.revoked_at != None)).all()  # noqa: E711
+    assert [t.user_id for t in revoked] == [moving[0]]
+
+    _configure(shard_dir, extra=2)
+    for user_id in users:
+        _login(test_client, test_headers, user_id)
+    assert _count(router.engines["2"], SessionToken, users) == 2 * len(moving) + 1
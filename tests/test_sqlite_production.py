@@ -0,0 +1,172 @@
+"""Tests for SQLite production mode (WAL pragmas and group-commit writer)."""
+
+import tempfile
+import threading
+from typing import Generator
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import select
+
+from huproof.db.sqlite import is_file_sqlite
+
+
+def test_is_file_sqlite() -> None:
+    assert is_file_sqlite("sqlite:///./dev.db")
+    assert is_file_sqlite("sqlite:////tmp/x.db")
+    assert not is_file_sqlite("sqlite://")
+    assert not is_file_sqlite("sqlite:///:memory:")
+    assert not is_file_sqlite("postgresql://u@h/db")
+
+
+@pytest.fixture
+def production_sqlite(test_client: TestClient) -> Generator[TestClient, None, None]:
+    """The test app switched to SQLite production mode on a fresh database file."""
+    from huproof.config.settings import get_settings
+    from huproof.db import session as db_session
+
+    settings = get_settings()
+    previous = (settings.sqlite_production, settings.db_url)
+    with tempfile.TemporaryDirectory() as tmp:
+        settings.sqlite_production = True
+        settings.db_url = f"sqlite:///{tmp}/prod.db"
+        db_session.get_engine().dispose()
+        db_session._engine = None
+        db_session.init_db()
+        yield test_client
+        if db_session._sqlite_writer is not None:
+            db_session._sqlite_writer.close()
+        db_session._sqlite_writer = None
+        db_session.get_engine().dispose()
+        db_session._engine = None
+    settings.sqlite_production, settings.db_url = previous
+
+
+def test_pragmas_applied(production_sqlite: TestClient) -> None:
+    from huproof.db.session import get_engine
+
+    with get_engine().connect() as conn:
+        assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert conn.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+
+
+def test_flow_through_writer(production_sqlite: TestClient, test_headers: dict[str, str]) -> None:
+    """Enroll and login commit through the writer thread."""
+    client = production_sqlite
+    data = client.get("/api/enroll/start", headers=test_headers).json()
+    public_inputs = {
+        "nonce": data["nonce"],
+        "origin_hash": data["origin_hash"],
+        "tau": data["tau"],
+        "timestamp": data["timestamp"],
+        "C": "7",
+        "sig": "1",
+    }
+    proof = {"pi_a": [], "pi_b": [], "pi_c": []}
+    resp = client.post(
+        "/api/enroll/finish",
+        json={"commitment": "7", "public_inputs": public_inputs, "proof": proof},
+        headers=test_headers,
+    )
+    assert resp.status_code == 200
+    user_id = resp.json()["user_id"]
+
+    # The enroll nonce was consumed through the writer
+    resp = client.post(
+        "/api/enroll/finish",
+        json={"commitment": "7", "public_inputs": public_inputs, "proof": proof},
+        headers=test_headers,
+    )
+    assert resp.status_code == 400
+
+    login = client.get(f"/api/login/start?user_id={user_id}", headers=test_headers).json()
+    public_inputs = {**public_inputs, "nonce": login["nonce"], "timestamp": login["timestamp"]}
+    resp = client.post(
+        "/api/login/finish",
+        json={"public_inputs": public_inputs, "proof": proof},
+        headers=test_headers,
+    )
+    assert resp.status_code == 200
+
+
+def test_group_commit_isolates_failing_jobs(production_sqlite: TestClient) -> None:
+    """Concurrent jobs share commits; a failing job does not fail its batch."""
+    from huproof.db.models import User
+    from huproof.db.session import get_sqlite_writer, session_scope
+
+    writer = get_sqlite_writer()
+    assert writer is not None
+
+    def add_user(user_id: str) -> None:
+        with session_scope() as s:
+            s.add(User(id=user_id))
+
+    threads = [threading.Thread(target=add_user, args=(f"u{i}",)) for i in range(20)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    def duplicate(s) -> None:
+        s.add(User(id="u0"))
+
+    bad = writer.submit(duplicate)
+    good = writer.submit(lambda s: s.add(User(id="after")))
+    with pytest.raises(IntegrityError):
+        bad.result(timeout=5)
+    good.result(timeout=5)
+
+    with session_scope() as s:
+        ids = {u.id for u in s.exec(select(User)).all()}
+    assert {f"u{i}" for i in range(20)} | {"after"} <= ids
+
+
+def test_timed_out_write_is_cancelled(production_sqlite: TestClient) -> None:
+    """A request that gave up waiting for the writer does not commit later."""
+    from huproof.config.settings import get_settings
+    from huproof.db.models import User
+    from huproof.db.session import get_sqlite_writer, session_scope
+
+    writer = get_sqlite_writer()
+    started, release = threading.Event(), threading.Event()
+
+    def block(s) -> None:
+        started.set()
+        release.wait(5)
+
+    blocker = writer.submit(block)
+    assert started.wait(5)
+    settings = get_settings()
+    previous, settings.sqlite_write_timeout_s = settings.sqlite_write_timeout_s, 0.05
+    try:
+        with pytest.raises(TimeoutError):
+            with session_scope() as s:
+                s.add(User(id="late"))
+    finally:
+        settings.sqlite_write_timeout_s = previous
+        release.set()
+    blocker.result(timeout=5)
+    writer.submit(lambda s: None).result(timeout=5)
+
+    with session_scope() as s:
+        assert s.get(User, "late") is None
+
+
+def test_nonce_consumed_once_through_writer(production_sqlite: TestClient) -> None:
+    """Of two requests holding the same unconsumed nonce, only the first consumes it."""
+    from huproof.api.common import new_nonce_record
+    from huproof.db.models import NoncePurpose, NonceRecord
+    from huproof.db.session import consume_nonce, session_scope
+
+    record, now = new_nonce_record("n-writer", NoncePurpose.login, "o")
+    with session_scope() as s:
+        s.add(record)
+    with session_scope() as first, session_scope() as second:
+        a = first.exec(select(NonceRecord)).one()
+        b = second.exec(select(NonceRecord)).one()
+        assert a.consumed_at is None and b.consumed_at is None
+        assert consume_nonce(first, a, now)
+        assert not consume_nonce(second, b, now)
+        assert a.consumed_at is not None
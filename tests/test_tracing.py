@@ -0,0 +1,66 @@
+"""Tests for request tracing, Server-Timing and the sampled OTLP trace file."""
+
+import json
+import os
+import tempfile
+from typing import Callable
+
+import httpx
+from fastapi.testclient import TestClient
+
+from huproof.config.settings import get_settings
+from huproof.core.metrics import get_metric_stats
+from huproof.core.tracing import span
+
+
+def test_server_timing_header(enroll_and_login: Callable[[], httpx.Response]) -> None:
+    resp = enroll_and_login()
+    assert resp.status_code == 200
+    stages = dict(part.split(";dur=") for part in resp.headers["server-timing"].split(", "))
+    assert {"origin", "nonce_query", "jwt_sign", "total"} <= set(stages)
+    assert all(float(ms) >= 0 for ms in stages.values())
+    assert float(stages["total"]) >= float(stages["nonce_query"])
+
+    stats = get_metric_stats("stage_time")
+    assert stats is not None
+    labels = {(s["labels"]["stage"], s["labels"]["endpoint"]) for s in stats["series"]}
+    assert ("nonce_query", "/api/login/finish") in labels
+    assert ("db_commit", "/api/login/finish") in labels
+
+
+def test_sampled_traces_written_as_otlp(
+    test_client: TestClient, test_headers: dict[str, str]
+) -> None:
+    settings = get_settings()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "traces.jsonl")
+        settings.trace_file, settings.trace_sample_rate = path, 1.0
+        try:
+            traceparent = "00-" + "ab" * 16 + "-" + "cd" * 8 + "-01"
+            resp = test_client.get(
+                "/api/enroll/start", headers={**test_headers, "traceparent": traceparent}
+            )
+            assert resp.status_code == 200
+        finally:
+            settings.trace_file, settings.trace_sample_rate = "", 0.0
+        with open(path) as f:
+            lines = f.readlines()
+    assert len(lines) == 1
+    spans = json.loads(lines[0])["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    root, *children = spans
+    assert root["name"] == "GET /api/enroll/start"
+    assert root["traceId"] == "ab" * 16 and root["parentSpanId"] == "cd" * 8
+    assert {s["name"] for s in children} >= {"origin", "db_commit"}
+    assert all(s["traceId"] == root["traceId"] for s in children)
+    # Stages hang off the root; SQL statements off the stage that ran them
+    ids = {s["spanId"] for s in spans}
+    assert all(s["parentSpanId"] == root["spanId"] for s in children if s["name"] != "sql")
+    assert all(s["parentSpanId"] in ids for s in children if s["name"] == "sql")
+
+
+def test_span_outside_request_records_histogram() -> None:
+    with span("offline_stage"):
+        pass
+    stats = get_metric_stats("stage_time")
+    assert stats is not None
+    assert any(s["labels"]["stage"] == "offline_stage" for s in stats["series"])
@@ -0,0 +1,106 @@
+"""Tests for the streaming export/import of users and commitments."""
+
+import os
+import subprocess
+import sys
+import tempfile
+from typing import Generator
+
+import pytest
+from sqlmodel import Session, SQLModel, create_engine, func, select
+
+from huproof.db.models import KeystrokeCommitment, User
+from huproof.db.transfer import Checkpoint, export_rows, import_rows, open_dump
+
+
+@pytest.fixture
+def populated() -> Generator[str, None, None]:
+    """A SQLite database file with 25 users and their commitments."""
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{tmp}/src.db")
+        SQLModel.metadata.create_all(engine)
+        with Session(engine) as session:
+            for i in range(25):
+                user = User()
+                session.add(user)
+                session.flush()
+                session.add(
+                    KeystrokeCommitment(
+                        user_id=user.id, origin="a" * 64, commitment_c=str(10**40 + i), tau=400
+                    )
+                )
+            session.commit()
+        engine.dispose()
+        yield tmp
+
+
+def _rows(url: str) -> tuple[set, set]:
+    engine = create_engine(url)
+    with Session(engine) as session:
+        users = {(u.id, u.created_at) for u in session.exec(select(User))}
+        commits = {
+            (c.id, c.user_id, c.commitment_c, c.is_active)
+            for c in session.exec(select(KeystrokeCommitment))
+        }
+    engine.dispose()
+    return users, commits
+
+
+@pytest.mark.parametrize("name", ["dump.ndjson", "dump.ndjson.gz"])
+def test_round_trip(populated: str, name: str) -> None:
+    dump = os.path.join(populated, name)
+    with open_dump(dump, "w") as out:
+        counts = export_rows([create_engine(f"sqlite:///{populated}/src.db")], out, batch_size=7)
+    assert counts == {"user": 25, "keystrokecommitment": 25}
+
+    target = create_engine(f"sqlite:///{populated}/dst.db")
+    SQLModel.metadata.create_all(target)
+    with open_dump(dump, "r") as lines:
+        assert import_rows(target, lines, Checkpoint(dump + ".checkpoint"), batch_size=10) == 50
+    assert _rows(f"sqlite:///{populated}/dst.db") == _rows(f"sqlite:///{populated}/src.db")
+
+
+def test_import_resumes_from_checkpoint(populated: str, monkeypatch: pytest.MonkeyPatch) -> None:
+    dump = os.path.join(populated, "dump.ndjson")
+    with open_dump(dump, "w") as out:
+        export_rows([create_engine(f"sqlite:///{populated}/src.db")], out)
+    target = create_engine(f"sqlite:///{populated}/dst.db")
+    SQLModel.metadata.create_all(target)
+
+    # Die after the third batch commits but before its checkpoint is written
+    saves = []
+    real_save = Checkpoint.save
+
+    def flaky_save(self: Checkpoint, records: int) -> None:
+        saves.append(records)
+        if len(saves) == 3:
+            raise KeyboardInterrupt
+        real_save(self, records)
+
+    monkeypatch.setattr(Checkpoint, "save", flaky_save)
+    with pytest.raises(KeyboardInterrupt), open_dump(dump, "r") as lines:
+        import_rows(target, lines, Checkpoint.load(dump + ".checkpoint"), batch_size=10)
+    monkeypatch.setattr(Checkpoint, "save", real_save)
+
+    checkpoint = Checkpoint.load(dump + ".checkpoint")
+    assert checkpoint.records == 20
+    with open_dump(dump, "r") as lines:
+        assert import_rows(target, lines, checkpoint, batch_size=10) == 50
+    with Session(target) as session:
+        assert session.exec(select(func.count()).select_from(User)).one() == 25
+        assert session.exec(select(func.count()).select_from(KeystrokeCommitment)).one() == 25
+
+
+def test_cli_export_import(populated: str) -> None:
+    env = {**os.environ, "APP_SECRET": "test-secret", "DB_URL": f"sqlite:///{populated}/src.db"}
+    dump = os.path.join(populated, "cli.ndjson.gz")
+    run = [sys.executable, "-m", "huproof.cli"]
+    subprocess.run([*run, "export", "-o", dump], env=env, check=True, capture_output=True)
+    subprocess.run(
+        [*run, "import", dump, "--db-url", f"sqlite:///{populated}/dst.db"],
+        env=env,
+        check=True,
+        capture_output=True,
+    )
+    assert _rows(f"sqlite:///{populated}/dst.db") == _rows(f"sqlite:///{populated}/src.db")
+    assert not os.path.exists(dump + ".checkpoint")